@@ -1,19 +1,126 @@
-from flask import Flask, render_template, request, redirect, url_for, session
-from crud_operations import MatchScheduler, insert_tournament, insert_match, fetch_tournament_by_id, fetch_matches_by_tournament, update_match_in_db, fetch_all_tournaments, delete_tournament_by_id
-from datetime import datetime, timedelta
+import click
+import os
+from flask import Flask, Response, abort, render_template, request, redirect, url_for, session, jsonify, stream_template, stream_with_context
+from crud_operations import insert_tournament, insert_matches_bulk, fetch_tournament_by_id, fetch_schedule, update_match_in_db, fetch_tournament_summaries, delete_tournament_by_id, close_db_connection, bulk_update_matches, ScheduleValidationError, fetch_matches_page, fetch_match_by_id, MatchVersionConflict, fetch_conflicts, count_conflicts, verify_conflict_index, rebuild_conflict_index, iter_matches, insert_fixtures_bulk, cancel_match_in_db, reslot_matches, reslot_day, fetch_matches_by_ids, fetch_team_by_id, fetch_tournament_teams, fetch_team_fixtures, fetch_next_match, fetch_team_rest_stats, record_match_result, fetch_standings, verify_standings, rebuild_standings, fetch_group_members, fetch_knockout_seeds, start_knockout, advance_knockout, sync_cache, count_matches, MATCH_PAGE_SIZE, TOURNAMENT_PAGE_SIZE, TOURNAMENT_SORTS
+import assets
+from cache import tournament_cache
+from conflict_index import INDEX_MIN_REST_MINUTES
+from conflicts import DEFAULT_MIN_REST_MINUTES, format_minutes
+from datetime import date, datetime, timedelta
+import fixtures
+import jobs
+from migrations import migrate
+from reslot import format_start
+import metrics
+import secrets
+from solver import DEFAULT_TIME_BUDGET_SECONDS, parse_windows, schedule_tournament
+from transfer import EXPORT_FORMATS, IMPORT_ERRORS, IMPORT_FORMATS, chunked, detect_format, export_lines, iter_fixtures, iter_records, parse_teams, text_stream
+from werkzeug.utils import secure_filename
 
 
-app = Flask(__name__)
-app.secret_key = 'your_secret_key'  # Needed for session
+# The repo's static folder is Static/, which only matched 'static' on
+# case-insensitive filesystems
+app = Flask(__name__, static_folder='Static', static_url_path='/static')
+# Sessions are signed with TOURNAMENT_SECRET_KEY. Without it a random key is
+# made at startup, so sessions end when the server restarts. serve.py imports
+# the app before forking, so every worker shares the key.
+app.secret_key = os.environ.get('TOURNAMENT_SECRET_KEY') or secrets.token_hex(32)
+# Request timing goes first so it covers every other hook
+metrics.init_app(app)
+# Set TOURNAMENT_TEMPLATE_CACHE to keep compiled templates somewhere other than instance/template-cache
+app.config['TEMPLATE_CACHE_DIR'] = os.environ.get('TOURNAMENT_TEMPLATE_CACHE')
+assets.init_app(app)
+# Set TOURNAMENT_PROFILER=1 to allow sampling a single request with ?profile=1
+app.config['PROFILER_ENABLED'] = os.environ.get('TOURNAMENT_PROFILER') == '1'
+# Each request reuses one SQLite connection across helpers and releases it here
+app.teardown_appcontext(close_db_connection)
+# The schedule form posts five fields per match, far past Flask's default of 1000
+app.config['MAX_FORM_PARTS'] = 1_000_000
+# Generating, scheduling or deleting at least this many matches runs as a
+# background job and the request returns at once; None runs everything inline
+app.config['BACKGROUND_MIN_MATCHES'] = 5000
+# serve.py sets this when several processes share the database
+app.config['SHARED_DATABASE'] = False
+
+MAX_PAGE_SIZE = 500
+DEFAULT_GROUP_COUNT = 4
+DEFAULT_KNOCKOUT_SIZE = 8
+IMPORT_KINDS = ('teams', 'fixtures')
+JOB_LABELS = {
+    'generate': 'Generating fixtures',
+    'schedule': 'Saving the schedule',
+    'solve': 'Scheduling matches',
+    'delete': 'Deleting the tournament',
+}
+# Seconds between status checks on a job's page
+JOB_POLL_SECONDS = 1
+_schema_checked = False
+
+
+@app.before_request
+def ensure_schema():
+    # Runs the migration check once per process rather than on import
+    global _schema_checked
+    if not _schema_checked:
+        migrate()
+        _schema_checked = True
+
+
+@app.before_request
+def sync_shared_cache():
+    if app.config['SHARED_DATABASE']:
+        sync_cache()
+
+
+def in_background(match_count):
+    limit = app.config['BACKGROUND_MIN_MATCHES']
+    return limit is not None and match_count >= limit
+
+
+@app.cli.command('verify-conflicts')
+@click.argument('tournament_id', type=int)
+@click.option('--repair', is_flag=True, help='Rebuild the index if it is inconsistent.')
+def verify_conflicts_command(tournament_id, repair):
+    migrate()
+    missing, unexpected = verify_conflict_index(tournament_id)
+    for row in missing:
+        print(f"missing: {row}")
+    for row in unexpected:
+        print(f"unexpected: {row}")
+    if not missing and not unexpected:
+        print("Conflict index is consistent.")
+    elif repair:
+        rebuild_conflict_index(tournament_id)
+        print("Conflict index rebuilt.")
+
+
+@app.cli.command('verify-standings')
+@click.argument('tournament_id', type=int)
+@click.option('--repair', is_flag=True, help='Rebuild the standings if they are inconsistent.')
+def verify_standings_command(tournament_id, repair):
+    migrate()
+    missing, unexpected = verify_standings(tournament_id)
+    for row in missing:
+        print(f"missing: {row}")
+    for row in unexpected:
+        print(f"unexpected: {row}")
+    if not missing and not unexpected:
+        print("Standings are consistent.")
+    elif repair:
+        rebuild_standings(tournament_id)
+        print("Standings rebuilt.")
+
+
+@app.cli.command('migrate')
+def migrate_command():
+    applied = migrate()
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
 
 
 @app.route('/')
 def root():
     return redirect(url_for('create_tournament'))
 
-
-from datetime import date, timedelta
-
 @app.route('/create_tournament', methods=['GET', 'POST'])
 def create_tournament():
     error = None
@@ -62,30 +169,49 @@ def generate_matches():
     tournament_id = session.get('tournament_id')
     if not tournament_id:
         return redirect(url_for('create_tournament'))
+    error = None
+    teams = []
+    fmt = request.form.get('format', 'round_robin')
+    group_count = request.form.get('groups', DEFAULT_GROUP_COUNT, type=int)
     if request.method == 'POST':
-        teams = request.form.get('teams').split(',')
-        teams = [team.strip() for team in teams if team.strip()]
-        match_id = 1
-        for i in range(len(teams)):
-            for j in range(i + 1, len(teams)):
-                insert_match(tournament_id, teams[i], teams[j])
-                match_id += 1
-        return redirect(url_for('schedule_matches'))
-    return render_template('generate_matches.html')
+        teams = list(dict.fromkeys(team.strip() for team in request.form.get('teams', '').split(',') if team.strip()))
+        try:
+            if len(teams) < 2:
+                raise ValueError("Add at least two teams.")
+            if fmt == 'knockout':
+                # Seeded in the order entered; later rounds follow the results
+                start_knockout(tournament_id, teams)
+                app.logger.info('Started a %d-team knockout for tournament %s', len(teams), tournament_id)
+            else:
+                rows = fixtures.generate(fmt, teams, group_count)
+                if in_background(fixtures.fixture_count(fmt, teams, group_count)):
+                    job_id = jobs.submit('generate', tournament_id, generate_fixtures, tournament_id, rows)
+                    return redirect(url_for('job_status', job_id=job_id))
+                generate_fixtures(tournament_id, rows)
+            return redirect(url_for('schedule_matches'))
+        except ValueError as e:
+            error = str(e)
+    return render_template('generate_matches.html', formats=fixtures.FORMATS, selected_format=fmt,
+                           group_count=group_count, teams=teams, error=error)
+
+def generate_fixtures(tournament_id, rows):
+    written, elapsed = insert_matches_bulk(tournament_id, rows)
+    app.logger.info('Generated %d matches for tournament %s in %.3fs', written, tournament_id, elapsed)
+    return {'matches': written}
 
 @app.route('/schedule', methods=['GET', 'POST'])
 def schedule_matches():
     tournament_id = session.get('tournament_id')
     if not tournament_id:
         return redirect(url_for('create_tournament'))
-    matches = fetch_matches_by_tournament(tournament_id)
+    matches = fetch_schedule(tournament_id)
     error = None
     tournament = fetch_tournament_by_id(tournament_id)
     tournament_start = tournament['start_date']
     tournament_end = tournament['end_date']
     try:
-        tournament_start_date = datetime.strptime(tournament_start, "%Y-%m-%d").date()
-        tournament_end_date = datetime.strptime(tournament_end, "%Y-%m-%d").date()
+        datetime.strptime(tournament_start, "%Y-%m-%d")
+        datetime.strptime(tournament_end, "%Y-%m-%d")
     except Exception:
         error = "Tournament start or end date not configured correctly."
         return render_template(
@@ -96,41 +222,32 @@ def schedule_matches():
             tournament_end=tournament_end,
         )
     if request.method == 'POST':
-        for match in matches:
-            date_str = request.form.get(f'date_{match["id"]}')
-            time_str = request.form.get(f'time_{match["id"]}')
-            location_str = request.form.get(f'location_{match["id"]}', '')
-            duration_str = request.form.get(f'duration_{match["id"]}')
-            if not date_str or not time_str:
-                error = f"Match {match['id']}: Please enter both date and time."
-                break
-            if not duration_str:
-                error = f"Match {match['id']}: Please select a duration."
-                break
-            try:
-                match_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-                duration = int(duration_str)
-                if duration < 1 or duration > 10:
-                    error = f"Match {match['id']}: Duration must be between 1 and 10 hours."
-                    break
-            except ValueError:
-                error = f"Match {match['id']}: Invalid date format or duration."
-                break
-            if match_date < tournament_start_date or match_date > tournament_end_date:
-                error = (
-                    f"Match {match['id']} date {date_str} is outside tournament dates "
-                    f"({tournament_start} to {tournament_end})."
-                )
-                break
-            update_match_in_db(match['id'], date_str, time_str, location_str, duration)
+        changes = {
+            match_id: {
+                'date': request.form.get(f'date_{match_id}'),
+                'time': request.form.get(f'time_{match_id}'),
+                'location': request.form.get(f'location_{match_id}', ''),
+                'duration': request.form.get(f'duration_{match_id}'),
+                'version': request.form.get(f'version_{match_id}'),
+            }
+            for match_id in matches.ids
+        }
+        if in_background(len(changes)):
+            job_id = jobs.submit('schedule', tournament_id, save_schedule, tournament_id, changes,
+                                 errors=(ScheduleValidationError, MatchVersionConflict))
+            return redirect(url_for('job_status', job_id=job_id))
+        try:
+            bulk_update_matches(tournament_id, changes)
+        except (ScheduleValidationError, MatchVersionConflict) as e:
+            error = str(e)
         if error:
-            # Re-fetch matches to preserve input values
-            matches = fetch_matches_by_tournament(tournament_id)
+            # Nothing was written; redisplay the submitted values over the latest rows
+            matches = list(fetch_schedule(tournament_id))
             for match in matches:
                 match['date'] = request.form.get(f'date_{match["id"]}', match['date'])
                 match['time'] = request.form.get(f'time_{match["id"]}', match['time'])
                 match['location'] = request.form.get(f'location_{match["id"]}', match['location'])
-                match['duration'] = request.form.get(f'duration_{match["id"]}', match.get('duration', 1))
+                match['duration'] = request.form.get(f'duration_{match["id"]}', match.get('duration', 1), type=int)
             return render_template(
                 'schedule_matches.html',
                 matches=matches,
@@ -138,6 +255,9 @@ def schedule_matches():
                 tournament_start=tournament_start,
                 tournament_end=tournament_end,
             )
+        # Saved; send the organizer straight to any clashes the index now holds
+        if count_conflicts(tournament_id):
+            return redirect(url_for('check_conflicts'))
         return redirect(url_for('view_matches'))
     return render_template(
         'schedule_matches.html',
@@ -147,22 +267,213 @@ def schedule_matches():
         error=error,
     )
 
+def save_schedule(tournament_id, changes):
+    bulk_update_matches(tournament_id, changes)
+    return {'conflicts': count_conflicts(tournament_id)}
+
+@app.route('/api/schedule', methods=['PATCH'])
+def api_update_schedule():
+    # Accepts only the changed matches: {"matches": [{"id": 3, "time": "14:00", "version": 2}, ...]}
+    tournament_id = session.get('tournament_id')
+    if not tournament_id:
+        return jsonify({'error': 'No tournament selected.'}), 400
+    payload = request.get_json(silent=True) or {}
+    items = payload.get('matches', []) if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return jsonify({'error': 'Send an object whose "matches" is a list of match objects.'}), 400
+    try:
+        changes = {int(item['id']): {key: item[key] for key in ('date', 'time', 'location', 'duration', 'version') if key in item}
+                   for item in items}
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Each match needs an integer "id".'}), 400
+    try:
+        updated = bulk_update_matches(tournament_id, changes)
+    except ScheduleValidationError as e:
+        return jsonify({'errors': [{'id': match_id, 'message': message} for match_id, message in e.errors]}), 400
+    except MatchVersionConflict as e:
+        current = dict(e.current) if e.current is not None else None
+        return jsonify({'errors': [{'id': e.match_id, 'message': str(e)}], 'current': current}), 409
+    return jsonify({'updated': updated})
+
+def run_import(tournament, kind, binary, fmt):
+    # Reads teams or fixtures from a binary stream and returns the matches written.
+    # Teams become a round robin; fixtures are inserted as given.
+    stream = text_stream(binary)
+    if kind == 'teams':
+        teams = parse_teams(stream, fmt)
+        if len(teams) < 2:
+            raise ValueError("The file must list at least two teams.")
+        written, elapsed = insert_matches_bulk(tournament['id'], fixtures.round_robin(teams))
+    else:
+        written, elapsed = insert_fixtures_bulk(tournament['id'], iter_fixtures(iter_records(stream, fmt), tournament))
+    app.logger.info('Imported %d matches from %s %s for tournament %s in %.3fs',
+                    written, fmt, kind, tournament['id'], elapsed)
+    return written
+
+@app.route('/import', methods=['GET', 'POST'])
+def import_data():
+    tournament_id = session.get('tournament_id')
+    if not tournament_id:
+        return redirect(url_for('create_tournament'))
+    tournament = fetch_tournament_by_id(tournament_id)
+    errors = []
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+        fmt = detect_format(upload.filename, upload.mimetype) if upload and upload.filename else None
+        if kind not in IMPORT_KINDS:
+            errors = ["Choose whether the file holds teams or fixtures."]
+        elif not upload or not upload.filename:
+            errors = ["Choose a file to import."]
+        elif fmt is None:
+            errors = ["Upload a .csv, .json or .jsonl file."]
+        else:
+            try:
+                run_import(tournament, kind, upload.stream, fmt)
+            except ScheduleValidationError as e:
+                errors = [message for _, message in e.errors]
+            except IMPORT_ERRORS as e:
+                errors = [f"Could not read the file: {e}"]
+            else:
+                return redirect(url_for('schedule_matches' if kind == 'teams' else 'view_matches'))
+    return render_template('import_data.html', tournament=tournament, errors=errors)
+
+@app.route('/tournaments/<int:tournament_id>/import/<kind>', methods=['POST'])
+def api_import(tournament_id, kind):
+    # Streams the raw request body: CSV, a JSON array or JSON Lines, picked by
+    # ?format= or the Content-Type header
+    tournament = fetch_tournament_by_id(tournament_id)
+    if tournament is None or kind not in IMPORT_KINDS:
+        return jsonify({'error': 'Unknown tournament or import kind.'}), 404
+    fmt = request.args.get('format') or detect_format(content_type=request.content_type)
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'error': 'Send text/csv, application/json or application/x-ndjson.'}), 415
+    try:
+        written = run_import(tournament, kind, request.stream, fmt)
+    except ScheduleValidationError as e:
+        return jsonify({'errors': [{'row': row, 'message': message} for row, message in e.errors]}), 400
+    except IMPORT_ERRORS as e:
+        return jsonify({'errors': [{'row': None, 'message': str(e)}]}), 400
+    return jsonify({'imported': written})
+
+@app.route('/tournaments/<int:tournament_id>/export.<fmt>')
+def export_matches(tournament_id, fmt):
+    # Streams matches in keyset batches, so memory stays flat for any league size.
+    # Accepts the same date/venue/team filters as the match listings.
+    tournament = fetch_tournament_by_id(tournament_id)
+    if tournament is None or fmt not in EXPORT_FORMATS:
+        abort(404)
+    team = request.args.get('team') or None
+    venue = request.args.get('venue') or None
+    matches = iter_matches(tournament_id, date=request.args.get('date') or None, location=venue, team=team)
+    name = ' - '.join([tournament['name']] + [value for value in (team, venue) if value])
+    filename = secure_filename(f'{name}.{fmt}') or f'tournament-{tournament_id}.{fmt}'
+    return Response(stream_with_context(chunked(export_lines(fmt, matches, name))),
+                    mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/schedule/auto', methods=['GET', 'POST'])
+def auto_schedule():
+    tournament_id = session.get('tournament_id')
+    if not tournament_id:
+        return redirect(url_for('create_tournament'))
+    tournament = fetch_tournament_by_id(tournament_id)
+    error = None
+    if request.method == 'POST':
+        venues = [venue.strip() for venue in request.form.get('venues', '').split(',') if venue.strip()]
+        try:
+            windows = parse_windows(request.form.get('windows', ''))
+            min_rest = int(request.form.get('min_rest') or DEFAULT_MIN_REST_MINUTES)
+            time_budget = float(request.form.get('time_budget') or DEFAULT_TIME_BUDGET_SECONDS)
+            seed = int(request.form.get('seed') or 0)
+        except ValueError:
+            windows = None
+            error = "Invalid playing windows, rest, time budget or seed."
+        if not error and not venues:
+            error = "Please enter at least one venue."
+        elif not error and not windows:
+            error = "Please enter at least one daily playing window."
+        elif not error and (min_rest < 0 or not 1 <= time_budget <= 120):
+            error = "Rest cannot be negative and the time budget must be between 1 and 120 seconds."
+        if not error:
+            args = (tournament_id, venues, windows, min_rest, time_budget, seed)
+            # A solve can use its whole time budget, so large tournaments go to the job queue
+            if in_background(count_matches(tournament_id)):
+                job_id = jobs.submit('solve', tournament_id, solve_schedule, *args)
+                return redirect(url_for('job_status', job_id=job_id))
+            result = solve_schedule(*args)
+            if not result['unplaced']:
+                return redirect(url_for('view_matches'))
+            error = unplaced_message(tournament, **result)
+    elif request.args.get('unplaced', type=int):
+        # Sent here by a finished background solve that left matches over
+        error = unplaced_message(tournament, request.args.get('scheduled', 0, type=int),
+                                 request.args.get('unplaced', type=int))
+    return render_template(
+        'auto_schedule.html',
+        tournament=tournament,
+        error=error,
+        default_min_rest=DEFAULT_MIN_REST_MINUTES,
+        default_time_budget=int(DEFAULT_TIME_BUDGET_SECONDS),
+    )
+
+def solve_schedule(tournament_id, venues, windows, min_rest, time_budget, seed):
+    result = schedule_tournament(tournament_id, venues, windows=windows, min_rest_minutes=min_rest,
+                                 time_budget=time_budget, seed=seed)
+    app.logger.info('Solver placed %d matches for tournament %s in %.2fs (seed %d)',
+                    len(result.assignments), tournament_id, result.elapsed, result.seed)
+    return {'scheduled': len(result.assignments), 'unplaced': len(result.unplaced)}
+
+def unplaced_message(tournament, scheduled, unplaced):
+    return (f"Scheduled {scheduled} matches, but {unplaced} did not fit before {tournament['end_date']}. "
+            "Add venues, widen the playing windows or reduce rest.")
+
+def render_match_listing(template, tournament_id, **context):
+    # Keyset-paginated by default; ?stream=1 renders every match progressively
+    filters = {
+        'date': request.args.get('date') or None,
+        'location': request.args.get('venue') or None,
+        'team': request.args.get('team') or None,
+    }
+    query = {'date': filters['date'], 'venue': filters['location'], 'team': filters['team']}
+    if request.args.get('stream'):
+        return stream_template(template, matches=iter_matches(tournament_id, **filters), filters=query,
+                               next_url=None, first_url=None, stream_url=None, **context)
+    after = request.args.get('after', 0, type=int)
+    limit = min(max(request.args.get('limit', MATCH_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    matches, next_after = fetch_matches_page(tournament_id, after, limit, **filters)
+
+    active = {key: value for key, value in query.items() if value}
+
+    def page_url(after_id):
+        return url_for(request.endpoint, **request.view_args, after=after_id, limit=limit, **active)
+
+    return render_template(
+        template,
+        matches=matches,
+        filters=query,
+        next_url=page_url(next_after) if next_after else None,
+        first_url=page_url(0) if after else None,
+        stream_url=url_for(request.endpoint, **request.view_args, stream=1, **active),
+        export_urls=[(label, url_for('export_matches', tournament_id=tournament_id, fmt=fmt, **active))
+                     for fmt, label in (('csv', 'CSV'), ('jsonl', 'JSON Lines'), ('ics', 'Calendar'))],
+        **context
+    )
+
 @app.route('/view')
 def view_matches():
     tournament_id = session.get('tournament_id')
     if not tournament_id:
         return redirect(url_for('create_tournament'))
-    matches = fetch_matches_by_tournament(tournament_id)
-    return render_template('view_matches.html', matches=matches)
+    return render_match_listing('view_matches.html', tournament_id)
 
 @app.route('/update/<int:match_id>', methods=['GET', 'POST'])
 def update_match(match_id):
     tournament_id = session.get('tournament_id')
     if not tournament_id:
         return redirect(url_for('create_tournament'))
-    matches = fetch_matches_by_tournament(tournament_id)
-    match = next((m for m in matches if m['id'] == match_id), None)
-    if not match:
+    match = fetch_match_by_id(match_id)
+    if not match or match['tournament_id'] != tournament_id:
         return redirect(url_for('view_matches'))
     error = None
     tournament = fetch_tournament_by_id(tournament_id)
@@ -187,8 +498,17 @@ def update_match(match_id):
                     if date_obj < start_date or date_obj > end_date:
                         error = f"Date must be between {start_date} and {end_date}."
                     else:
-                        update_match_in_db(match_id, date_str, time_str, location_str, duration)
+                        update_match_in_db(match_id, date_str, time_str, location_str, duration,
+                                           expected_version=request.form.get('version', type=int))
+                        if fetch_conflicts(tournament_id, match_id=match_id):
+                            return redirect(url_for('check_conflicts'))
                         return redirect(url_for('view_matches'))
+            except MatchVersionConflict as e:
+                if e.current is None:
+                    return redirect(url_for('view_matches'))
+                # Show the latest saved details so the editor can re-apply their change
+                match = e.current
+                error = "Someone else updated this match while you were editing. Review the latest details and save again."
             except Exception:
                 error = "Invalid date, time, or duration format."
         return render_template('update_matches.html', match=match, error=error,
@@ -202,46 +522,342 @@ def update_match(match_id):
         error=error
     )
 
+def parse_result(score1, score2):
+    # Both blank clears the result; otherwise both must be whole numbers >= 0
+    if score1 in (None, '') and score2 in (None, ''):
+        return None, None
+    try:
+        score1, score2 = int(score1), int(score2)
+    except (TypeError, ValueError):
+        raise ValueError("Enter both scores as whole numbers, or leave both blank to clear the result.")
+    if score1 < 0 or score2 < 0:
+        raise ValueError("Scores cannot be negative.")
+    return score1, score2
+
+@app.route('/matches/<int:match_id>/result', methods=['POST'])
+def record_result(match_id):
+    tournament_id = session.get('tournament_id')
+    if not tournament_id:
+        return redirect(url_for('create_tournament'))
+    match = fetch_match_by_id(match_id)
+    if not match or match['tournament_id'] != tournament_id:
+        return redirect(url_for('view_matches'))
+    tournament = fetch_tournament_by_id(tournament_id)
+    try:
+        score1, score2 = parse_result(request.form.get('score1'), request.form.get('score2'))
+        record_match_result(match_id, score1, score2, expected_version=request.form.get('version', type=int))
+        return redirect(url_for('view_matches'))
+    except ValueError as e:
+        error = str(e)
+    except MatchVersionConflict as e:
+        if e.current is None:
+            return redirect(url_for('view_matches'))
+        match = e.current
+        error = "Someone else updated this match while you were editing. Review the latest details and save again."
+    return render_template('update_matches.html', match=match, result_error=error,
+                           tournament_start=tournament['start_date'],
+                           tournament_end=tournament['end_date'])
+
+@app.route('/api/matches/<int:match_id>/result', methods=['PUT'])
+def api_record_result(match_id):
+    # {"score1": 2, "score2": 1, "version": 4}; null scores clear the result
+    tournament_id = session.get('tournament_id')
+    if not tournament_id:
+        return jsonify({'error': 'No tournament selected.'}), 400
+    match = fetch_match_by_id(match_id)
+    if not match or match['tournament_id'] != tournament_id:
+        return jsonify({'error': 'Match not found.'}), 404
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Send an object with "score1" and "score2".'}), 400
+    version = payload.get('version')
+    # bool is an int subclass, but true is not a version
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+        return jsonify({'error': '"version" must be an integer or null.'}), 400
+    try:
+        score1, score2 = parse_result(payload.get('score1'), payload.get('score2'))
+        match = record_match_result(match_id, score1, score2, expected_version=version)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except MatchVersionConflict as e:
+        current = dict(e.current) if e.current is not None else None
+        return jsonify({'error': str(e), 'current': current}), 409
+    return jsonify({'match': dict(match)})
+
+def reslot_options():
+    # Playing windows and rest shared by the re-slot forms; ValueError if invalid
+    try:
+        windows = parse_windows(request.form.get('windows') or '09:00-21:00')
+        min_rest = int(request.form.get('min_rest') or INDEX_MIN_REST_MINUTES)
+    except ValueError:
+        raise ValueError("Invalid playing windows or rest.")
+    if not windows or min_rest < 0:
+        raise ValueError("Enter at least one playing window and a rest that is not negative.")
+    return {'windows': windows, 'min_rest_minutes': min_rest}
+
+def render_reslot(tournament, day=None, result=None, error=None):
+    matches = {}
+    if result:
+        matches = fetch_matches_by_ids([move[0] for move in result.moves] + result.unplaced)
+    return render_template('reslot.html', tournament=tournament, day=day, result=result, matches=matches,
+                           error=error, default_min_rest=INDEX_MIN_REST_MINUTES)
+
+@app.route('/matches/<int:match_id>/cancel', methods=['POST'])
+def cancel_match(match_id):
+    # action=clear only frees the slot; the default re-slots the match at once
+    tournament_id = session.get('tournament_id')
+    if not tournament_id:
+        return redirect(url_for('create_tournament'))
+    match = fetch_match_by_id(match_id)
+    if not match or match['tournament_id'] != tournament_id:
+        return redirect(url_for('view_matches'))
+    if request.form.get('action') == 'clear':
+        cancel_match_in_db(match_id)
+        return redirect(url_for('view_matches'))
+    tournament = fetch_tournament_by_id(tournament_id)
+    try:
+        options = reslot_options()
+    except ValueError as e:
+        return render_reslot(tournament, match['date'], error=str(e))
+    result = reslot_matches(tournament_id, [match_id], **options)
+    app.logger.info('Re-slotted match %s in %.3fs', match_id, result.elapsed)
+    return render_reslot(tournament, match['date'], result)
+
+@app.route('/reslot', methods=['GET', 'POST'])
+def reslot_day_view():
+    tournament_id = session.get('tournament_id')
+    if not tournament_id:
+        return redirect(url_for('create_tournament'))
+    tournament = fetch_tournament_by_id(tournament_id)
+    if request.method == 'GET':
+        return render_reslot(tournament)
+    day = request.form.get('day', '')
+    try:
+        datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        return render_reslot(tournament, day, error="Please enter the rained-out day.")
+    try:
+        options = reslot_options()
+    except ValueError as e:
+        return render_reslot(tournament, day, error=str(e))
+    if not tournament['start_date'] <= day <= tournament['end_date']:
+        return render_reslot(tournament, day, error=f"Day must be between {tournament['start_date']} and {tournament['end_date']}.")
+    result = reslot_day(tournament_id, day, **options)
+    app.logger.info('Re-slotted %d matches from %s in %.3fs (%d unplaced)',
+                    len(result.moves), day, result.elapsed, len(result.unplaced))
+    return render_reslot(tournament, day, result)
+
 @app.route('/check_conflicts')
 def check_conflicts():
     tournament_id = session.get('tournament_id')
     if not tournament_id:
         return redirect(url_for('create_tournament'))
-    matches = fetch_matches_by_tournament(tournament_id)
-    conflicts = []
-    match_schedule = {}
-    
-    for match in matches:
-        # Only consider matches that have all required fields
-        if match['date'] and match['time'] and match['location'] and match['duration']:
-            # Create key with all four parameters: date, time, duration, venue
-            key = (match['date'], match['time'], match['duration'], match['location'])
-            if key not in match_schedule:
-                match_schedule[key] = []
-            match_schedule[key].append(match)
-    
-    for key, conflict_matches in match_schedule.items():
-        if len(conflict_matches) > 1:
-            conflicts.append((key, conflict_matches))
-    
-    return render_template('check_conflicts.html', conflicts=conflicts)
+    min_rest = request.args.get('min_rest', INDEX_MIN_REST_MINUTES, type=int)
+    if min_rest == INDEX_MIN_REST_MINUTES:
+        # Served from the conflict index that every schedule write maintains
+        conflicts = fetch_conflicts(tournament_id)
+    else:
+        conflicts = fetch_schedule(tournament_id).conflicts(max(min_rest, 0))
+    return render_template('check_conflicts.html', conflicts=conflicts, min_rest=min_rest,
+                           format_minutes=format_minutes)
+
+def format_rest(minutes):
+    # Rest gaps run from minutes to weeks; a negative gap is an overlap
+    minutes = round(minutes)
+    if minutes < 0:
+        return f"overlaps {format_minutes(-minutes)}"
+    days, minutes = divmod(minutes, 1440)
+    if days:
+        return f"{days}d {format_minutes(minutes)}" if minutes else f"{days}d"
+    return format_minutes(minutes)
+
+def format_start_minute(start):
+    return ' '.join(format_start(start))
+
+def team_scope(team_id):
+    # A team's pages cover the session's tournament, or every tournament with
+    # ?all=1 (or tournament_id=... for the API). Returns (team, tournament).
+    team = fetch_team_by_id(team_id)
+    if team is None:
+        abort(404)
+    tournament_id = request.args.get('tournament_id', type=int) or session.get('tournament_id')
+    if request.args.get('all') or not tournament_id:
+        return team, None
+    return team, fetch_tournament_by_id(tournament_id)
+
+@app.route('/teams')
+def list_teams():
+    tournament_id = session.get('tournament_id')
+    if not tournament_id:
+        return redirect(url_for('create_tournament'))
+    return render_template('teams.html', tournament=fetch_tournament_by_id(tournament_id),
+                           teams=fetch_tournament_teams(tournament_id), format_start=format_start_minute)
+
+@app.route('/teams/<int:team_id>')
+def view_team(team_id):
+    team, tournament = team_scope(team_id)
+    tournament_id = tournament['id'] if tournament else None
+    session_tournament = fetch_tournament_by_id(session['tournament_id']) if session.get('tournament_id') else None
+    min_rest = max(request.args.get('min_rest', DEFAULT_MIN_REST_MINUTES, type=int), 0)
+    return render_template('team.html', team=team, tournament=tournament, session_tournament=session_tournament,
+                           fixtures=fetch_team_fixtures(team_id, tournament_id),
+                           next_match=fetch_next_match(team_id, tournament_id),
+                           rest=fetch_team_rest_stats(team_id, tournament_id, min_rest),
+                           min_rest=min_rest, format_rest=format_rest)
+
+@app.route('/api/teams/<int:team_id>')
+def api_team(team_id):
+    # Next match and rest statistics, e.g. /api/teams/7?all=1 or ?tournament_id=3
+    team, tournament = team_scope(team_id)
+    tournament_id = tournament['id'] if tournament else None
+    min_rest = max(request.args.get('min_rest', DEFAULT_MIN_REST_MINUTES, type=int), 0)
+    next_match = fetch_next_match(team_id, tournament_id)
+    return jsonify({
+        'team': dict(team),
+        'tournament_id': tournament_id,
+        'next_match': dict(next_match) if next_match else None,
+        'rest': dict(fetch_team_rest_stats(team_id, tournament_id, min_rest)),
+        'min_rest': min_rest,
+    })
+
+@app.route('/standings')
+def view_standings():
+    tournament_id = session.get('tournament_id')
+    if not tournament_id:
+        return redirect(url_for('create_tournament'))
+    return render_standings(fetch_tournament_by_id(tournament_id))
+
+def render_standings(tournament, message=None, error=None):
+    return render_template('standings.html', tournament=tournament, standings=fetch_standings(tournament['id']),
+                           groups=fetch_group_members(tournament['id']),
+                           knockout_seeds=fetch_knockout_seeds(tournament['id']),
+                           default_size=DEFAULT_KNOCKOUT_SIZE, message=message, error=error)
+
+@app.route('/knockout', methods=['POST'])
+def knockout():
+    # action=next creates the next round; otherwise a bracket is seeded from the
+    # standings: the top `size` teams, or the top `per_group` of each group
+    tournament_id = session.get('tournament_id')
+    if not tournament_id:
+        return redirect(url_for('create_tournament'))
+    tournament = fetch_tournament_by_id(tournament_id)
+    try:
+        if request.form.get('action') == 'next':
+            created = advance_knockout(tournament_id)
+            if not created:
+                return render_standings(tournament, message="No new round yet: every tie in the current round "
+                                        "needs a result that is not a draw, or the final is already decided.")
+        else:
+            per_group = request.form.get('per_group', type=int)
+            if per_group:
+                seeds = fixtures.knockout_seeds(fetch_standings(tournament_id), groups=fetch_group_members(tournament_id),
+                                                per_group=per_group)
+            else:
+                seeds = fixtures.knockout_seeds(fetch_standings(tournament_id),
+                                                size=max(request.form.get('size', DEFAULT_KNOCKOUT_SIZE, type=int), 0))
+            created = start_knockout(tournament_id, seeds)
+    except ValueError as e:
+        return render_standings(tournament, error=str(e))
+    return render_standings(tournament, message=f"Created knockout round {created[0].round} with "
+                                                f"{len(created)} match{'es' if len(created) != 1 else ''}.")
+
+@app.route('/api/tournaments/<int:tournament_id>/standings')
+def api_standings(tournament_id):
+    if fetch_tournament_by_id(tournament_id) is None:
+        abort(404)
+    return jsonify({
+        'tournament_id': tournament_id,
+        'standings': [dict(row, rank=rank) for rank, row in enumerate(fetch_standings(tournament_id), 1)],
+    })
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(tournament_cache.stats())
+
+# Dashboard sort options in display order; the first click sorts names and
+# dates ascending and statistics largest first
+TOURNAMENT_SORT_LABELS = [
+    ('newest', 'Newest'), ('name', 'Name'), ('start', 'Start'), ('end', 'End'),
+    ('matches', 'Matches'), ('scheduled', '% Scheduled'), ('span', 'Span'),
+    ('venues', 'Venues'), ('conflicts', 'Conflicts'),
+]
+ASCENDING_SORTS = ('name', 'start', 'end')
 
 @app.route('/tournaments')
 def tournaments():
-    tournaments = fetch_all_tournaments()
-    return render_template('tournaments.html', tournaments=tournaments)
+    sort = request.args.get('sort', 'newest')
+    if sort not in TOURNAMENT_SORTS:
+        sort = 'newest'
+    order = request.args.get('order')
+    if order not in ('asc', 'desc'):
+        order = 'asc' if sort in ASCENDING_SORTS else 'desc'
+    page = max(request.args.get('page', 1, type=int) or 1, 1)
+    tournaments, total = fetch_tournament_summaries(sort, order == 'desc', TOURNAMENT_PAGE_SIZE,
+                                                    (page - 1) * TOURNAMENT_PAGE_SIZE)
+    page_count = max((total + TOURNAMENT_PAGE_SIZE - 1) // TOURNAMENT_PAGE_SIZE, 1)
+
+    def sort_url(key):
+        # Clicking the active sort flips its order
+        if key == sort:
+            next_order = 'desc' if order == 'asc' else 'asc'
+        else:
+            next_order = 'asc' if key in ASCENDING_SORTS else 'desc'
+        return url_for('tournaments', sort=key, order=next_order)
+
+    sorts = [(key, label, sort_url(key)) for key, label in TOURNAMENT_SORT_LABELS]
+    return render_template(
+        'tournaments.html', tournaments=tournaments, total=total, sorts=sorts, sort=sort, order=order,
+        page=page, page_count=page_count,
+        prev_url=url_for('tournaments', sort=sort, order=order, page=page - 1) if page > 1 else None,
+        next_url=url_for('tournaments', sort=sort, order=order, page=page + 1) if page < page_count else None)
 
 @app.route('/tournaments/<int:tournament_id>/delete', methods=['POST'])
 def delete_tournament(tournament_id):
+    if in_background(count_matches(tournament_id)):
+        job_id = jobs.submit('delete', tournament_id, delete_tournament_by_id, tournament_id)
+        return redirect(url_for('job_status', job_id=job_id))
     delete_tournament_by_id(tournament_id)
     return redirect(url_for('tournaments'))
 
 @app.route('/tournaments/<int:tournament_id>/matches')
 def tournament_matches(tournament_id):
     tournament = fetch_tournament_by_id(tournament_id)
-    matches = fetch_matches_by_tournament(tournament_id)
-    return render_template('tournament_matches.html', tournament=tournament, matches=matches)
+    return render_match_listing('tournament_matches.html', tournament_id, tournament=tournament)
+
+def job_next_url(job):
+    # Where the organizer goes once a job is done, as the inline request would have sent them
+    if job['kind'] == 'generate':
+        return url_for('schedule_matches')
+    if job['kind'] == 'schedule':
+        return url_for('check_conflicts') if job['result']['conflicts'] else url_for('view_matches')
+    if job['kind'] == 'solve':
+        if job['result']['unplaced']:
+            return url_for('auto_schedule', **job['result'])
+        return url_for('view_matches')
+    return url_for('tournaments')
+
+@app.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    # Reloads itself until the job finishes, then moves on, or shows why it failed
+    job = jobs.fetch_job(job_id)
+    if job is None:
+        abort(404)
+    if job['status'] == jobs.DONE:
+        return redirect(job_next_url(job))
+    retry_url = {'generate': url_for('generate_matches'), 'schedule': url_for('schedule_matches'),
+                 'solve': url_for('auto_schedule')}.get(job['kind'], url_for('tournaments'))
+    return render_template('job.html', job=job, label=JOB_LABELS.get(job['kind'], job['kind']),
+                           failed=job['status'] == jobs.FAILED, retry_url=retry_url, poll_seconds=JOB_POLL_SECONDS)
+
+@app.route('/api/jobs/<int:job_id>')
+def api_job(job_id):
+    job = jobs.fetch_job(job_id)
+    if job is None:
+        abort(404)
+    job['next_url'] = job_next_url(job) if job['status'] == jobs.DONE else None
+    return jsonify(job)
 
 
 if __name__ == '__main__':
+    migrate()
     app.run(debug=True)
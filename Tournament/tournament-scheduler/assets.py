@@ -0,0 +1,164 @@
+from hashlib import sha256
+import os
+import threading
+import zlib
+
+from jinja2 import FileSystemBytecodeCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Static files are linked as /static/<file>?v=<hash of its contents>, and a
+# request carrying the current hash is served as cacheable for a year, so a
+# browser fetches each stylesheet once per change. HTML, JSON and exports are
+# compressed with brotli (when installed) or gzip.
+FINGERPRINT_LENGTH = 12
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# Smaller bodies fit in a packet or two and are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+COMPRESSIBLE_TYPES = ('text/html', 'application/json', 'text/csv', 'application/x-ndjson', 'text/calendar')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Streamed pages are flushed to the client every this many uncompressed bytes
+STREAM_FLUSH_BYTES = 16 * 1024
+
+_fingerprints = {}
+_lock = threading.Lock()
+
+
+def fingerprint(static_folder, filename):
+    # Content hash of a static file, cached until the file's mtime changes
+    path = os.path.join(static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _fingerprints.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = (mtime, sha256(f.read()).hexdigest()[:FINGERPRINT_LENGTH])
+        with _lock:
+            _fingerprints[path] = cached
+    return cached[1]
+
+
+def warm_fingerprints(static_folder):
+    for folder, _, files in os.walk(static_folder):
+        for name in files:
+            fingerprint(static_folder, os.path.relpath(os.path.join(folder, name), static_folder))
+
+
+class _Gzip:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+ENCODINGS = {'gzip': _Gzip}
+if brotli is not None:
+    ENCODINGS = {'br': _Brotli, 'gzip': _Gzip}
+
+
+def compress_stream(chunks, compressor, charset='utf-8'):
+    # Compresses a streamed body, flushing the first chunk at once so the page
+    # starts rendering and then every STREAM_FLUSH_BYTES
+    pending = 0
+    first = True
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode(charset)
+        pending += len(chunk)
+        data = compressor.compress(chunk)
+        if first or pending >= STREAM_FLUSH_BYTES:
+            data += compressor.flush()
+            pending = 0
+            first = False
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def _compress(response, encoding):
+    compressor = ENCODINGS[encoding]()
+    if response.is_streamed:
+        response.response = compress_stream(response.response, compressor)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compressor.compress(response.get_data()) + compressor.finish())
+    response.headers['Content-Encoding'] = encoding
+
+
+def init_app(app):
+    # Registers fingerprinted static URLs, long-lived caching for them,
+    # response compression and the template bytecode cache
+    from flask import request
+
+    static_folder = app.static_folder
+    warm_fingerprints(static_folder)
+    # Compiled templates are shared by every worker process. The default lives
+    # in the app's instance folder rather than Jinja's per-user temp directory,
+    # which every app and test run on the host would share.
+    cache_dir = app.config.get('TEMPLATE_CACHE_DIR') or os.path.join(app.instance_path, 'template-cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    def add_fingerprint(endpoint, values):
+        if endpoint == 'static' and 'v' not in values:
+            version = fingerprint(static_folder, values.get('filename', ''))
+            if version:
+                values['v'] = version
+
+    default_max_age = app.get_send_file_max_age
+
+    def static_max_age(filename):
+        if filename and request.args.get('v') == fingerprint(static_folder, filename):
+            return IMMUTABLE_MAX_AGE
+        return default_max_age(filename)
+
+    def mark_immutable(response):
+        if request.endpoint == 'static' and response.cache_control.max_age == IMMUTABLE_MAX_AGE:
+            response.cache_control.immutable = True
+        return response
+
+    def compress(response):
+        if response.mimetype not in COMPRESSIBLE_TYPES or response.direct_passthrough:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.status_code in (204, 304) or 'Content-Encoding' in response.headers
+                or 'no-transform' in response.headers.get('Cache-Control', '')):
+            return response
+        encoding = request.accept_encodings.best_match(list(ENCODINGS))
+        if encoding is None:
+            return response
+        if response.is_streamed or (response.content_length or 0) >= MIN_COMPRESS_BYTES:
+            _compress(response, encoding)
+        return response
+
+    app.url_defaults(add_fingerprint)
+    app.get_send_file_max_age = static_max_age
+    app.after_request(mark_immutable)
+    app.after_request(compress)
@@ -0,0 +1,46 @@
+# Benchmark for the interval-based conflict engine.
+# Usage: python benchmarks/bench_conflicts.py [match_count ...]
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conflicts import find_conflicts
+
+DEFAULT_MATCH_COUNTS = [1000, 10000, 100000]
+
+
+def synthetic_matches(count, seed=7):
+    rng = random.Random(seed)
+    teams = [f'Team {i}' for i in range(max(20, count // 50))]
+    venues = [f'Venue {i}' for i in range(max(5, count // 200))]
+    start = date(2030, 1, 1)
+    matches = []
+    for match_id in range(1, count + 1):
+        team1, team2 = rng.sample(teams, 2)
+        matches.append({
+            'id': match_id,
+            'team1': team1,
+            'team2': team2,
+            'date': (start + timedelta(days=rng.randrange(365))).isoformat(),
+            'time': f'{rng.randrange(8, 20):02d}:{rng.choice((0, 30)):02d}',
+            'duration': rng.randrange(1, 4),
+            'location': rng.choice(venues),
+        })
+    return matches
+
+
+def main(counts):
+    print(f"{'matches':>8} {'conflicts':>10} {'seconds':>9} {'us/match':>9}")
+    for count in counts:
+        matches = synthetic_matches(count)
+        started = time.perf_counter()
+        conflicts = find_conflicts(matches)
+        elapsed = time.perf_counter() - started
+        print(f'{count:>8} {len(conflicts):>10} {elapsed:>9.3f} {elapsed / count * 1e6:>9.2f}')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_MATCH_COUNTS)
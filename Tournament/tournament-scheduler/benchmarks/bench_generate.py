@@ -0,0 +1,36 @@
+# Benchmark for bulk round-robin generation.
+# Usage: python benchmarks/bench_generate.py [team_count ...]
+import os
+import sys
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TEAM_COUNTS = [50, 100, 200, 300]
+
+
+def main(team_counts):
+    workdir = tempfile.mkdtemp(prefix='tournament-bench-')
+    sys.path.insert(0, BASE_DIR)
+    import crud_operations
+    import fixtures
+    from migrations import migrate
+
+    print(f"{'teams':>6} {'matches':>9} {'seconds':>9} {'us/match':>9}")
+    per_match = []
+    for count in team_counts:
+        crud_operations.DB_PATH = os.path.join(workdir, f'bench_{count}.db')
+        migrate()
+        tournament_id = crud_operations.insert_tournament(f'Bench {count}', '2030-01-01', '2030-12-31', '')
+        teams = [f'Team {i}' for i in range(count)]
+        written, elapsed = crud_operations.insert_matches_bulk(
+            tournament_id, fixtures.round_robin(teams))
+        per_match.append(elapsed / written * 1e6)
+        print(f'{count:>6} {written:>9} {elapsed:>9.3f} {per_match[-1]:>9.2f}')
+
+    # Linear scaling means the cost per match stays flat as the league grows
+    spread = max(per_match) / min(per_match)
+    print(f'per-match cost spread: {spread:.2f}x (close to 1.0 means linear scaling)')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_TEAM_COUNTS)
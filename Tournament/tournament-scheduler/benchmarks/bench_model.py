@@ -0,0 +1,87 @@
+# Memory and query benchmark for the compact TournamentSchedule model.
+# Usage: python benchmarks/bench_model.py [match_count ...]
+# Reports traced bytes per match for the model and, for comparison, for the
+# same matches as a list of dicts, plus build, conflict and per-team query times.
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from schedule_model import TournamentSchedule
+
+DEFAULT_MATCH_COUNTS = [10000, 100000, 1000000]
+# Building a million dicts takes most of a GiB, so the comparison stops here
+DICT_COMPARISON_LIMIT = 100000
+# Budget for the model; the run fails above it
+MAX_BYTES_PER_MATCH = 64
+
+
+def synthetic_matches(count, seed=7):
+    # Same distribution as bench_conflicts.py, generated lazily
+    rng = random.Random(seed)
+    teams = [f'Team {i}' for i in range(max(20, count // 50))]
+    venues = [f'Venue {i}' for i in range(max(5, count // 200))]
+    start = date(2030, 1, 1)
+    for match_id in range(1, count + 1):
+        team1, team2 = rng.sample(teams, 2)
+        yield {
+            'id': match_id,
+            'team1': team1,
+            'team2': team2,
+            'date': (start + timedelta(days=rng.randrange(365))).isoformat(),
+            'time': f'{rng.randrange(8, 20):02d}:{rng.choice((0, 30)):02d}',
+            'duration': rng.randrange(1, 4),
+            'location': rng.choice(venues),
+            'version': 1,
+        }
+
+
+def traced_size(build):
+    # Bytes still allocated by build() once it returns, and its result
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, result
+
+
+def main(counts):
+    print(f"{'matches':>8} {'model B/match':>14} {'dicts B/match':>14} {'build s':>8} "
+          f"{'conflicts s':>12} {'team query ms':>14}")
+    over_budget = False
+    for count in counts:
+        # Tracing slows allocation down, so the build is timed on a separate run
+        started = time.perf_counter()
+        TournamentSchedule.from_matches(synthetic_matches(count))
+        build = time.perf_counter() - started
+        size, schedule = traced_size(lambda: TournamentSchedule.from_matches(synthetic_matches(count)))
+        per_match = size / count
+        over_budget = over_budget or per_match > MAX_BYTES_PER_MATCH
+        dict_column = '-'
+        if count <= DICT_COMPARISON_LIMIT:
+            dict_size, matches = traced_size(lambda: list(synthetic_matches(count)))
+            dict_column = f'{dict_size / count:.0f}'
+            del matches
+
+        started = time.perf_counter()
+        schedule.conflicts()
+        conflicts = time.perf_counter() - started
+        started = time.perf_counter()
+        for team in schedule.teams[:100]:
+            schedule.rest_gaps(team)
+        team_query = (time.perf_counter() - started) / min(100, len(schedule.teams)) * 1000
+        print(f'{count:>8} {per_match:>14.1f} {dict_column:>14} {build:>8.2f} {conflicts:>12.2f} '
+              f'{team_query:>14.3f}')
+        del schedule
+    if over_budget:
+        print(f'Model exceeded {MAX_BYTES_PER_MATCH} bytes per match.')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_MATCH_COUNTS)
@@ -0,0 +1,121 @@
+# Benchmark for page weight and time to first byte: renders the main pages of a
+# scheduled tournament through the Flask test client and reports the HTML size
+# as sent with and without compression, the stylesheets a first visit loads,
+# the stylesheet requests a repeat visit still makes, and the time to the
+# first body chunk and to the whole page.
+# Usage: python benchmarks/bench_pages.py [--teams 100] [--repeat 10]
+import argparse
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_suite import SLOT_TIMES, synthetic_assignments, team_names
+
+DEFAULT_TEAMS = 100
+DEFAULT_REPEAT = 10
+PAGES = ['/index', '/view', '/view?stream=1', '/schedule', '/check_conflicts', '/tournaments', '/teams']
+ENCODINGS = ['identity', 'gzip', 'br']
+STYLESHEET = re.compile(r'<link[^>]+rel="stylesheet"[^>]+href="(/static/[^"]+)"')
+
+
+def fetch(client, url, encoding):
+    # Returns (body bytes, ms to the first chunk, ms to the last, response)
+    started = time.perf_counter()
+    response = client.get(url, headers={'Accept-Encoding': encoding}, buffered=False)
+    first = None
+    size = 0
+    body = []
+    for chunk in response.response:
+        if first is None:
+            first = time.perf_counter()
+        size += len(chunk)
+        body.append(chunk)
+    done = time.perf_counter()
+    response.close()
+    first = first or done
+    return b''.join(body), (first - started) * 1000, (done - started) * 1000, response
+
+
+def stylesheet_cost(client, html):
+    # Bytes a first visit downloads, and requests a repeat visit still makes
+    # because the stylesheet is not cacheable without revalidation
+    first_bytes = 0
+    repeat_requests = 0
+    for href in STYLESHEET.findall(html.decode('utf-8', 'replace')):
+        response = client.get(href)
+        if response.status_code != 200:
+            continue
+        first_bytes += len(response.data)
+        cache_control = response.cache_control
+        if cache_control.no_cache or not cache_control.max_age:
+            repeat_requests += 1
+    return first_bytes, repeat_requests
+
+
+def build(client, team_count):
+    import crud_operations
+    import fixtures
+    from migrations import migrate
+
+    migrate()
+    teams = team_names(team_count)
+    start = date.today() + timedelta(days=1)
+    rounds = team_count + team_count % 2 - 1
+    end = start + timedelta(days=rounds // len(SLOT_TIMES) + 1)
+    client.post('/create_tournament', data={
+        'tournament_name': f'Pages {team_count}',
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'description': 'benchmark',
+    })
+    with client.session_transaction() as session:
+        tournament_id = session['tournament_id']
+    crud_operations.insert_matches_bulk(tournament_id, fixtures.round_robin(teams))
+    matches = [dict(row) for row in crud_operations.fetch_matches_by_tournament.uncached(tournament_id)]
+    crud_operations.update_match_schedules(tournament_id, synthetic_assignments(matches, team_count, start))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure page weight and time to first byte.')
+    parser.add_argument('--teams', type=int, default=DEFAULT_TEAMS)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='samples per page')
+    args = parser.parse_args()
+
+    import crud_operations
+    workdir = tempfile.mkdtemp(prefix='tournament-bench-')
+    crud_operations.DB_PATH = os.path.join(workdir, 'pages.db')
+    from app import app
+    client = app.test_client()
+    build(client, args.teams)
+
+    print(f"{'page':<18} {'identity':>10} {'gzip':>9} {'br':>9} {'css 1st':>8} {'css again':>9} "
+          f"{'ttfb ms':>8} {'total ms':>9}")
+    for url in PAGES:
+        sizes = {}
+        for encoding in ENCODINGS:
+            body, _, _, response = fetch(client, url, encoding)
+            sent = response.headers.get('Content-Encoding', 'identity')
+            sizes[encoding] = len(body) if sent == encoding else None
+            if encoding == 'identity':
+                css_bytes, css_repeat = stylesheet_cost(client, body)
+        timings = [fetch(client, url, 'gzip, br')[1:3] for _ in range(args.repeat)]
+        ttfb = statistics.median(timing[0] for timing in timings)
+        total = statistics.median(timing[1] for timing in timings)
+        cells = [f'{sizes[encoding]:>9,}' if sizes[encoding] is not None else f"{'-':>9}"
+                 for encoding in ENCODINGS]
+        print(f'{url:<18} {cells[0]:>10} {cells[1]} {cells[2]} {css_bytes:>8,} {css_repeat:>9} '
+              f'{ttfb:>8.1f} {total:>9.1f}')
+    crud_operations.close_db_connection()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# Benchmark for process startup cost: importing the app and checking the schema.
+# Usage: python benchmarks/bench_startup.py [runs]
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_RUNS = 10
+
+
+def time_snippet(snippet, workdir, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', snippet], cwd=workdir, check=True,
+                       env={**os.environ, 'PYTHONPATH': BASE_DIR})
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main(runs):
+    workdir = tempfile.mkdtemp(prefix='tournament-bench-')
+    cases = [
+        ('python interpreter only', 'pass'),
+        ('import crud_operations', 'import crud_operations'),
+        ('import app', 'import app'),
+        ('import app + migrate (current schema)', 'import app; app.migrate()'),
+    ]
+    # Bring the database up to date once so later runs measure the no-op check
+    subprocess.run([sys.executable, '-c', 'import migrations; migrations.migrate()'], cwd=workdir, check=True,
+                   env={**os.environ, 'PYTHONPATH': BASE_DIR})
+    print(f"{'case':<40} {'median ms':>10}")
+    for label, snippet in cases:
+        print(f'{label:<40} {time_snippet(snippet, workdir, runs):>10.1f}')
+
+    fresh = tempfile.mkdtemp(prefix='tournament-bench-')
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'import migrations; migrations.migrate()'], cwd=fresh, check=True,
+                   env={**os.environ, 'PYTHONPATH': BASE_DIR})
+    print(f"{'migrate fresh database (one run)':<40} {(time.perf_counter() - started) * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RUNS)
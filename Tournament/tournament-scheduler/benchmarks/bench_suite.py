@@ -0,0 +1,397 @@
+# End-to-end benchmark suite: drives the Flask app and TournamentSchedule against
+# synthetic tournaments, records latency percentiles, peak memory and SQL query
+# counts, writes them as JSON and compares them with a stored baseline.
+# Usage: python benchmarks/bench_suite.py [--teams 10 100 500 2000] [--repeat N]
+#        [--output results.json] [--baseline baseline.json] [--update-baseline]
+# Exits with status 1 when a result regresses past the baseline thresholds.
+import argparse
+import contextlib
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+import metrics
+
+DEFAULT_TEAM_COUNTS = [10, 100, 500, 2000]
+DEFAULT_REPEAT = 20
+DEFAULT_WRITE_REPEAT = 3
+# Above this many teams each write sample is millions of rows, so run it once
+LARGE_TEAM_COUNT = 1000
+# The /schedule form posts every match at once; past this size the page is not
+# something an organizer would submit, so the suite schedules directly instead
+SCHEDULE_FORM_MAX_MATCHES = 125000
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, 'results.json')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+# A result regresses when it exceeds the baseline by the relative tolerance and
+# the absolute slack; the slack keeps sub-millisecond noise from failing a run.
+LATENCY_TOLERANCE = 0.25
+LATENCY_SLACK_MS = 2.0
+MEMORY_TOLERANCE = 0.25
+MEMORY_SLACK_KIB = 256
+QUERY_SLACK = 0
+# Queued scenarios only time handing a job to the pool, a few milliseconds that
+# thread scheduling can easily double, so just their median is compared and
+# with a wider floor
+QUEUED_LATENCY_SLACK_MS = 10.0
+
+SLOT_TIMES = ['09:00', '12:00', '15:00', '18:00']
+# Every CLASH_EVERY-th match is moved to a shared venue so conflict checks have
+# real work to do
+CLASH_EVERY = 200
+VERSION_FIELD = re.compile(rb'name="version_(\d+)" value="(\d+)"')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(samples, peak_kib, queries):
+    return {
+        'samples': len(samples),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'max_ms': round(max(samples), 3),
+        'peak_kib': round(peak_kib, 1) if peak_kib is not None else None,
+        'queries': queries,
+    }
+
+
+def measure(run, repeat, prepare=None, check=None, latency_only=False):
+    # One traced run records peak memory and query count, then `repeat` untraced
+    # runs record latency. prepare() runs untimed before each call, check()
+    # untimed after it. latency_only skips the traced run, for calls that hand
+    # work to a background job whose memory and queries overlap the timing.
+    def once(traced):
+        args = prepare() if prepare else ()
+        if traced:
+            tracemalloc.start()
+        queries_before = metrics.statements_total
+        started = time.perf_counter()
+        result = run(*args)
+        elapsed = (time.perf_counter() - started) * 1000
+        queries = metrics.statements_total - queries_before
+        peak = 0
+        if traced:
+            peak = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+        if check:
+            check(result)
+        return elapsed, peak, queries
+
+    peak_kib = queries = None
+    if not latency_only:
+        _, peak_kib, queries = once(traced=True)
+    samples = [once(traced=False)[0] for _ in range(repeat)]
+    return summarize(samples, peak_kib, queries)
+
+
+def expect_status(*codes):
+    def check(response):
+        if response.status_code not in codes:
+            raise RuntimeError(f'{response.request.path} returned {response.status_code}')
+    return check
+
+
+def wait_for_job(job_id):
+    import crud_operations
+    import jobs
+
+    while True:
+        job = jobs.fetch_job(job_id)
+        crud_operations.close_db_connection()
+        if job['status'] == jobs.FAILED:
+            raise RuntimeError(f"job {job_id} failed: {job['error']}")
+        if job['status'] == jobs.DONE:
+            return job
+        time.sleep(0.01)
+
+
+def team_names(count):
+    return [f'Team {i:04d}' for i in range(count)]
+
+
+def circle_round(i, j, count):
+    # Round of pair (i, j) in the circle method, so every round is a set of
+    # disjoint pairs. An odd league gets a phantom team that means a bye.
+    size = count + count % 2
+    if j == size - 1:
+        return (2 * i) % (size - 1)
+    return (i + j) % (size - 1)
+
+
+def synthetic_assignments(matches, team_count, start):
+    # Places each round in its own time slot with one venue per pairing, then
+    # moves every CLASH_EVERY-th match onto venue 0 to create venue clashes
+    index = {name: i for i, name in enumerate(team_names(team_count))}
+    used = {}
+    assignments = []
+    for position, match in enumerate(matches):
+        i, j = sorted((index[match['team1']], index[match['team2']]))
+        round_no = circle_round(i, j, team_count)
+        venue = used.get(round_no, 0)
+        used[round_no] = venue + 1
+        if position % CLASH_EVERY == CLASH_EVERY - 1:
+            venue = 0
+        day = start + timedelta(days=round_no // len(SLOT_TIMES))
+        assignments.append((match['id'], day.isoformat(), SLOT_TIMES[round_no % len(SLOT_TIMES)],
+                            f'Venue {venue}', 1))
+    return assignments
+
+
+def rendered_versions(html):
+    # The version each match's hidden field carries, as the browser posts it back
+    return {int(match_id): int(version) for match_id, version in VERSION_FIELD.findall(html)}
+
+
+def schedule_form(versions, assignments):
+    form = {}
+    for match_id, match_date, match_time, location, duration in assignments:
+        form[f'date_{match_id}'] = match_date
+        form[f'time_{match_id}'] = match_time
+        form[f'location_{match_id}'] = location
+        form[f'duration_{match_id}'] = str(duration)
+        form[f'version_{match_id}'] = str(versions[match_id])
+    return form
+
+
+def run_size(team_count, repeat, write_repeat, workdir):
+    import crud_operations
+    from app import app
+    from cache import tournament_cache
+    from migrations import migrate
+    from schedule_model import TournamentSchedule
+
+    crud_operations.DB_PATH = os.path.join(workdir, f'bench_{team_count}.db')
+    # Templates are compiled up front so no traced run pays for it
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    migrate()
+    crud_operations.close_db_connection()
+    tournament_cache.clear()
+    # Every write runs inline, as the baseline measured it; the *_queued
+    # scenarios at the end cover the job queue
+    app.config['BACKGROUND_MIN_MATCHES'] = None
+
+    teams = team_names(team_count)
+    rounds = team_count + team_count % 2 - 1
+    start = date.today() + timedelta(days=1)
+    end = start + timedelta(days=rounds // len(SLOT_TIMES) + 1)
+    client = app.test_client()
+    results = {}
+
+    def create_tournament():
+        response = client.post('/create_tournament', data={
+            'tournament_name': f'Bench {team_count}',
+            'start_date': start.isoformat(),
+            'end_date': end.isoformat(),
+            'description': 'benchmark',
+        })
+        expect_status(302)(response)
+        return ()
+
+    results['generate'] = measure(
+        lambda: client.post('/generate', data={'teams': ','.join(teams)}),
+        write_repeat, prepare=create_tournament, check=expect_status(302))
+
+    with client.session_transaction() as session:
+        tournament_id = session['tournament_id']
+    matches = [dict(row) for row in crud_operations.fetch_matches_by_tournament.uncached(tournament_id)]
+    crud_operations.close_db_connection()
+    assignments = synthetic_assignments(matches, team_count, start)
+
+    if len(matches) <= SCHEDULE_FORM_MAX_MATCHES:
+        def current_form():
+            tournament_cache.clear()
+            page = client.get('/schedule')
+            expect_status(200)(page)
+            tournament_cache.clear()
+            return (schedule_form(rendered_versions(page.data), assignments),)
+
+        results['schedule_post'] = measure(
+            lambda form: client.post('/schedule', data=form),
+            write_repeat, prepare=current_form, check=expect_status(302))
+    else:
+        crud_operations.update_match_schedules(tournament_id, assignments)
+        crud_operations.close_db_connection()
+        results['schedule_post'] = {'skipped': f'more than {SCHEDULE_FORM_MAX_MATCHES} matches'}
+
+    # Reads start from an empty cache so they measure the query path
+    def cold():
+        tournament_cache.clear()
+        return ()
+
+    # Each sample records a result for the next match in id order, as on a
+    # busy match day; the standings read below then ranks teams with results
+    results_recorded = iter(matches)
+
+    def next_result():
+        match = next(results_recorded)
+        return match['id'], {'score1': match['id'] % 4, 'score2': match['id'] % 3}
+
+    results['record_result'] = measure(
+        lambda match_id, scores: client.put(f'/api/matches/{match_id}/result', json=scores),
+        min(repeat, len(matches) - 1), prepare=next_result, check=expect_status(200))
+
+    # Team 1 plays in every generated tournament, so /teams/1 also covers the
+    # participation index across tournaments
+    for name, path in (('view', '/view'), ('check_conflicts', '/check_conflicts'),
+                       ('tournaments', '/tournaments'), ('teams', '/teams'), ('team', '/teams/1'),
+                       ('standings', '/standings')):
+        results[name] = measure(lambda path=path: client.get(path), repeat,
+                                prepare=cold, check=expect_status(200))
+
+    scheduler = TournamentSchedule()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        results['scheduler_generate_matches'] = measure(
+            lambda: scheduler.generate_matches(teams), write_repeat)
+        scheduler = crud_operations.fetch_schedule.uncached(tournament_id)
+        crud_operations.close_db_connection()
+        results['scheduler_check_conflicts'] = measure(scheduler.check_conflicts, write_repeat)
+
+    # Each sample rains out the current busiest day; its matches move to later days
+    def busiest_day():
+        cur = crud_operations.get_db_connection().cursor()
+        cur.execute('''
+            SELECT date FROM matches WHERE tournament_id = ? AND date IS NOT NULL
+            GROUP BY date ORDER BY COUNT(*) DESC, date LIMIT 1
+        ''', (tournament_id,))
+        day = cur.fetchone()[0]
+        crud_operations.close_db_connection()
+        tournament_cache.clear()
+        return (day,)
+
+    results['reslot_day'] = measure(lambda day: client.post('/reslot', data={'day': day}),
+                                    write_repeat, prepare=busiest_day, check=expect_status(200))
+
+    # With the job queue on, generating and deleting a tournament return as
+    # soon as the job is queued; each sample waits for its job, untimed
+    app.config['BACKGROUND_MIN_MATCHES'] = 0
+    queued = []
+
+    def finish_job(response):
+        expect_status(302)(response)
+        job = wait_for_job(int(response.location.rsplit('/', 1)[1]))
+        if job['kind'] == 'generate':
+            queued.append(job['tournament_id'])
+
+    results['generate_queued'] = measure(
+        lambda: client.post('/generate', data={'teams': ','.join(teams)}),
+        write_repeat, prepare=create_tournament, check=finish_job, latency_only=True)
+    results['delete_queued'] = measure(
+        lambda tournament_id: client.post(f'/tournaments/{tournament_id}/delete'),
+        write_repeat, prepare=lambda: (queued.pop(),), check=finish_job, latency_only=True)
+    app.config['BACKGROUND_MIN_MATCHES'] = None
+    return {'matches': len(matches), 'scenarios': results}
+
+
+def compare(results, baseline):
+    # Returns a list of human-readable regressions against the baseline
+    regressions = []
+    for size, current in results['sizes'].items():
+        expected_size = baseline.get('sizes', {}).get(size)
+        if not expected_size:
+            continue
+        for scenario, current_stats in current['scenarios'].items():
+            expected = expected_size['scenarios'].get(scenario)
+            if not expected or 'skipped' in current_stats or 'skipped' in expected:
+                continue
+            label = f'{size} teams / {scenario}'
+            queued = expected['peak_kib'] is None
+            slack = QUEUED_LATENCY_SLACK_MS if queued else LATENCY_SLACK_MS
+            for key in ('p50_ms',) if queued else ('p50_ms', 'p95_ms'):
+                limit = expected[key] * (1 + LATENCY_TOLERANCE) + slack
+                if current_stats[key] > limit:
+                    regressions.append(f'{label}: {key} {current_stats[key]:.1f} > {limit:.1f} '
+                                       f'(baseline {expected[key]:.1f})')
+            if current_stats['peak_kib'] is None or expected['peak_kib'] is None:
+                continue
+            limit = expected['peak_kib'] * (1 + MEMORY_TOLERANCE) + MEMORY_SLACK_KIB
+            if current_stats['peak_kib'] > limit:
+                regressions.append(f"{label}: peak {current_stats['peak_kib']:.0f} KiB > {limit:.0f} KiB "
+                                   f"(baseline {expected['peak_kib']:.0f})")
+            if current_stats['queries'] > expected['queries'] + QUERY_SLACK:
+                regressions.append(f"{label}: {current_stats['queries']} queries "
+                                   f"(baseline {expected['queries']})")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'teams':>6} {'scenario':<28} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} "
+          f"{'peak KiB':>10} {'queries':>8}")
+    for size, current in results['sizes'].items():
+        for scenario, stats in current['scenarios'].items():
+            if 'skipped' in stats:
+                print(f"{size:>6} {scenario:<28} skipped: {stats['skipped']}")
+                continue
+            peak = f"{stats['peak_kib']:>10.0f}" if stats['peak_kib'] is not None else f"{'-':>10}"
+            queries = stats['queries'] if stats['queries'] is not None else '-'
+            print(f"{size:>6} {scenario:<28} {stats['p50_ms']:>10.2f} {stats['p95_ms']:>10.2f} "
+                  f"{stats['p99_ms']:>10.2f} {peak} {queries:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the tournament scheduler benchmark suite.')
+    parser.add_argument('--teams', type=int, nargs='+', default=DEFAULT_TEAM_COUNTS)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='samples per read scenario')
+    parser.add_argument('--write-repeat', type=int, default=DEFAULT_WRITE_REPEAT,
+                        help='samples per write scenario')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='store these results as the new baseline instead of comparing')
+    args = parser.parse_args()
+
+    import crud_operations
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sizes': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='tournament-bench-') as workdir:
+        # A fresh bytecode cache, so results never depend on templates another
+        # run left compiled; the app reads this when it is first imported
+        os.environ['TOURNAMENT_TEMPLATE_CACHE'] = os.path.join(workdir, 'template-cache')
+        for team_count in args.teams:
+            write_repeat = 1 if team_count >= LARGE_TEAM_COUNT else args.write_repeat
+            results['sizes'][str(team_count)] = run_size(team_count, args.repeat, write_repeat, workdir)
+        crud_operations.close_db_connection()
+
+    print_table(results)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Baseline updated at {args.baseline}')
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}; run with --update-baseline to create one.')
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f))
+    for line in regressions:
+        print(f'REGRESSION {line}')
+    if not regressions:
+        print('No regressions against the baseline.')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from functools import wraps
+import threading
+import time
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL_SECONDS = 30
+# Version key shared by reads that span every tournament
+ALL_TOURNAMENTS = '*'
+
+
+class TournamentCache:
+    # Bounded LRU cache with a TTL whose keys include a per-tournament version.
+    # invalidate() bumps the version, so every entry for that tournament stops
+    # matching at once and ages out of the LRU. The TTL bounds how stale a
+    # process can be when another process writes to the same database, unless
+    # the process calls invalidate_all() when it sees such a write.
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._versions = {}
+        # Part of every version, so invalidate_all() expires every entry at once
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def version(self, tournament_id):
+        return self._epoch, self._versions.get(tournament_id, 0)
+
+    def invalidate(self, tournament_id):
+        # Also expires every cross-tournament read, such as the dashboard
+        with self._lock:
+            for key in (tournament_id, ALL_TOURNAMENTS):
+                self._versions[key] = self._versions.get(key, 0) + 1
+            self.invalidations += 1
+
+    def invalidate_all(self):
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def get_or_load(self, key, load):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+        # Load outside the lock so slow queries don't serialise other readers
+        value = load()
+        with self._lock:
+            self._entries[key] = (now + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def cached(self, name):
+        # Decorator for read functions whose first argument is a tournament id
+        def decorator(func):
+            @wraps(func)
+            def wrapper(tournament_id, *args, **kwargs):
+                # Read the version before querying: if a write lands meanwhile
+                # the result is stored under the old version and never served
+                key = (name, tournament_id, self.version(tournament_id), args, tuple(sorted(kwargs.items())))
+                return self.get_or_load(key, lambda: func(tournament_id, *args, **kwargs))
+            wrapper.uncached = func
+            return wrapper
+        return decorator
+
+    def cached_all(self, name):
+        # Decorator for reads over every tournament; any invalidate() expires them
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                key = (name, ALL_TOURNAMENTS, self.version(ALL_TOURNAMENTS), args, tuple(sorted(kwargs.items())))
+                return self.get_or_load(key, lambda: func(*args, **kwargs))
+            wrapper.uncached = func
+            return wrapper
+        return decorator
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+tournament_cache = TournamentCache()
@@ -0,0 +1,197 @@
+from bisect import bisect_left, bisect_right
+from conflicts import DEFAULT_MIN_REST_MINUTES, REST, TEAM, VENUE, match_interval
+
+# The index stores every scheduled match as one slot per venue and per team in
+# match_slots, and every clashing pair in match_conflicts. Writes call
+# reindex_matches() inside their own transaction; it only re-checks slots that
+# share a venue or team with the changed matches and lie within MAX_SPAN_MINUTES,
+# reading each affected venue or team with a single range query.
+INDEX_MIN_REST_MINUTES = DEFAULT_MIN_REST_MINUTES
+# Upper bound on a match's length, used to bound the slot range query
+MAX_SPAN_MINUTES = 24 * 60
+SQL_VARIABLE_CHUNK = 500
+PER_RESOURCE_QUERY_LIMIT = 20
+
+
+def chunks(items, size=SQL_VARIABLE_CHUNK):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def venue_key(location):
+    return location.strip().lower()
+
+
+def _slots_for(match):
+    interval = match_interval(match)
+    if interval is None:
+        return []
+    start, end = interval
+    slots = []
+    if match['location'] and match['location'].strip():
+        slots.append((VENUE, venue_key(match['location']), start, end))
+    for team in {match['team1'], match['team2']}:
+        slots.append((TEAM, team, start, end))
+    return slots
+
+
+def _classify(kind, start, end, other_start, other_end, rest):
+    # Returns (conflict_kind, minutes) or None for two slots of the same resource
+    overlap = min(end, other_end) - max(start, other_start)
+    if overlap > 0:
+        return kind, overlap
+    if kind == TEAM and -overlap < rest:
+        return REST, -overlap
+    return None
+
+
+def _clear(cur, match_ids):
+    for chunk in chunks(match_ids):
+        marks = ','.join('?' * len(chunk))
+        cur.execute(f'DELETE FROM match_slots WHERE match_id IN ({marks})', chunk)
+        cur.execute(f'DELETE FROM match_conflicts WHERE first_match_id IN ({marks})', chunk)
+        cur.execute(f'DELETE FROM match_conflicts WHERE second_match_id IN ({marks})', chunk)
+
+
+def _load_neighbours(cur, tournament_id, resources, rest):
+    # Returns {(kind, resource): [(start, end, match_id), ...]} sorted by start,
+    # covering every slot that could clash with the given ones. Bulk writes
+    # touch most resources, so past PER_RESOURCE_QUERY_LIMIT each kind is read
+    # with IN-lists over one time range spanning all the changed slots instead
+    # of a query per venue and team.
+    neighbours = {}
+    if len(resources) > PER_RESOURCE_QUERY_LIMIT:
+        low = min(start for slots in resources.values() for start, _, _ in slots) - rest - MAX_SPAN_MINUTES
+        high = max(end for slots in resources.values() for _, end, _ in slots) + rest
+        names = {}
+        for kind, resource in resources:
+            names.setdefault(kind, []).append(resource)
+        for kind, kind_names in names.items():
+            for chunk in chunks(sorted(kind_names)):
+                cur.execute(f'''
+                    SELECT resource, start_minute, end_minute, match_id FROM match_slots
+                    WHERE tournament_id = ? AND kind = ? AND resource IN ({','.join('?' * len(chunk))})
+                      AND start_minute > ? AND start_minute < ?
+                    ORDER BY resource, start_minute
+                ''', [tournament_id, kind] + chunk + [low, high])
+                for resource, start, end, match_id in cur.fetchall():
+                    neighbours.setdefault((kind, resource), []).append((start, end, match_id))
+        return neighbours
+    for (kind, resource), slots in resources.items():
+        reach = rest if kind == TEAM else 0
+        cur.execute('''
+            SELECT start_minute, end_minute, match_id FROM match_slots
+            WHERE tournament_id = ? AND kind = ? AND resource = ?
+              AND start_minute > ? AND start_minute < ?
+            ORDER BY start_minute
+        ''', (tournament_id, kind, resource, min(slots)[0] - reach - MAX_SPAN_MINUTES,
+              max(end for _, end, _ in slots) + reach))
+        neighbours[(kind, resource)] = [tuple(row) for row in cur.fetchall()]
+    return neighbours
+
+
+def reindex_matches(cur, match_ids, rest=INDEX_MIN_REST_MINUTES):
+    # Refreshes slots and conflicts for the given matches from their current
+    # rows. Call within the transaction that changed them.
+    match_ids = list(match_ids)
+    if not match_ids:
+        return
+    _clear(cur, match_ids)
+    matches = []
+    for chunk in chunks(match_ids):
+        cur.execute(f'''
+            SELECT id, tournament_id, team1, team2, date, time, duration, location
+            FROM matches WHERE id IN ({','.join('?' * len(chunk))})
+        ''', chunk)
+        matches.extend(cur.fetchall())
+
+    # Group the changed slots by tournament and resource so each venue or team
+    # is read once
+    changed = {}
+    slot_rows = []
+    for match in matches:
+        for kind, resource, start, end in _slots_for(match):
+            slot_rows.append((match['id'], match['tournament_id'], kind, resource, start, end))
+            resources = changed.setdefault(match['tournament_id'], {})
+            resources.setdefault((kind, resource), []).append((start, end, match['id']))
+    cur.executemany('''
+        INSERT OR IGNORE INTO match_slots (match_id, tournament_id, kind, resource, start_minute, end_minute)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', slot_rows)
+
+    found = set()
+    for tournament_id, resources in changed.items():
+        neighbours = _load_neighbours(cur, tournament_id, resources, rest)
+        for (kind, resource), slots in resources.items():
+            reach = rest if kind == TEAM else 0
+            others = neighbours.get((kind, resource), [])
+            starts = [row[0] for row in others]
+            for start, end, match_id in slots:
+                first = bisect_right(starts, start - reach - MAX_SPAN_MINUTES)
+                last = bisect_left(starts, end + reach)
+                for other_start, other_end, other_id in others[first:last]:
+                    if other_id == match_id or other_end <= start - reach:
+                        continue
+                    clash = _classify(kind, start, end, other_start, other_end, rest)
+                    if clash is None:
+                        continue
+                    # Store each pair once, earlier match first
+                    if (other_start, other_id) < (start, match_id):
+                        pair = (other_id, match_id, other_start)
+                    else:
+                        pair = (match_id, other_id, start)
+                    found.add((tournament_id, clash[0], resource, pair[0], pair[1], pair[2], clash[1]))
+    cur.executemany('''
+        INSERT OR REPLACE INTO match_conflicts
+            (tournament_id, kind, resource, first_match_id, second_match_id, start_minute, minutes)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', found)
+
+
+def remove_tournament(cur, tournament_id):
+    cur.execute('DELETE FROM match_slots WHERE tournament_id = ?', (tournament_id,))
+    cur.execute('DELETE FROM match_conflicts WHERE tournament_id = ?', (tournament_id,))
+
+
+def rebuild_tournament(cur, tournament_id, rest=INDEX_MIN_REST_MINUTES):
+    remove_tournament(cur, tournament_id)
+    cur.execute('SELECT id FROM matches WHERE tournament_id = ? AND date IS NOT NULL AND time IS NOT NULL',
+                (tournament_id,))
+    reindex_matches(cur, [row[0] for row in cur.fetchall()], rest)
+
+
+def conflict_rows(cur, tournament_id):
+    cur.execute('''
+        SELECT kind, resource, first_match_id, second_match_id, minutes FROM match_conflicts
+        WHERE tournament_id = ?
+        ORDER BY start_minute, kind, first_match_id, second_match_id
+    ''', (tournament_id,))
+    return [tuple(row) for row in cur.fetchall()]
+
+
+def conflict_rows_for_match(cur, match_id):
+    cur.execute('''
+        SELECT kind, resource, first_match_id, second_match_id, minutes FROM match_conflicts
+        WHERE first_match_id = ?
+        UNION ALL
+        SELECT kind, resource, first_match_id, second_match_id, minutes FROM match_conflicts
+        WHERE second_match_id = ?
+    ''', (match_id, match_id))
+    return [tuple(row) for row in cur.fetchall()]
+
+
+def compare_with_rebuild(conn, tournament_id):
+    # Rebuilds the tournament's index from scratch inside a savepoint, rolls it
+    # back and returns (missing, unexpected): rows the stored index lacks and
+    # rows it holds that a full rebuild would not produce.
+    cur = conn.cursor()
+    stored = set(conflict_rows(cur, tournament_id))
+    cur.execute('SAVEPOINT conflict_index_verify')
+    try:
+        rebuild_tournament(cur, tournament_id)
+        expected = set(conflict_rows(cur, tournament_id))
+    finally:
+        cur.execute('ROLLBACK TO conflict_index_verify')
+        cur.execute('RELEASE conflict_index_verify')
+    return sorted(expected - stored), sorted(stored - expected)
@@ -0,0 +1,96 @@
+from collections import defaultdict, namedtuple
+from datetime import date
+import heapq
+
+DEFAULT_DURATION_HOURS = 1
+DEFAULT_MIN_REST_MINUTES = 60
+# Playing windows and slot grid shared by the solver and re-slotting
+DEFAULT_WINDOWS = (('09:00', '21:00'),)
+DEFAULT_SLOT_MINUTES = 60
+
+VENUE = 'venue'
+TEAM = 'team'
+REST = 'rest'
+
+# kind is VENUE, TEAM or REST; key is the venue or team name; minutes is the
+# overlap for VENUE/TEAM clashes and the actual gap for REST violations.
+Conflict = namedtuple('Conflict', ['kind', 'key', 'first', 'second', 'minutes'])
+
+
+def _field(match, name):
+    # Works for sqlite3.Row as well as plain dicts used by the CLI
+    try:
+        return match[name]
+    except (KeyError, IndexError):
+        return None
+
+
+def clock_minutes(time_str):
+    hours, minutes = time_str.split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def match_interval(match):
+    # Returns (start, end) in absolute minutes, or None for unscheduled matches
+    date_str = _field(match, 'date')
+    time_str = _field(match, 'time')
+    if not date_str or not time_str:
+        return None
+    start = date.fromisoformat(date_str).toordinal() * 1440 + clock_minutes(time_str)
+    duration = _field(match, 'duration') or DEFAULT_DURATION_HOURS
+    return start, start + int(duration) * 60
+
+
+def _sweep_overlaps(kind, key, intervals, report, min_rest_minutes=0):
+    # intervals: list of (start, end, seq, match) sorted by start.
+    # The heap holds matches that are still in progress (or, with a rest
+    # requirement, finished less than min_rest_minutes ago), so each new match
+    # is only compared against those it clashes with: O(n log n + conflicts).
+    active = []
+    for start, end, seq, match in intervals:
+        while active and active[0][0] + min_rest_minutes <= start:
+            heapq.heappop(active)
+        for other_end, _, other in active:
+            if other_end > start:
+                report(Conflict(kind, key, other, match, min(end, other_end) - start))
+            else:
+                report(Conflict(REST, key, other, match, start - other_end))
+        heapq.heappush(active, (end, seq, match))
+
+
+def find_conflicts(matches, min_rest_minutes=DEFAULT_MIN_REST_MINUTES):
+    by_venue = defaultdict(list)
+    by_team = defaultdict(list)
+    for seq, match in enumerate(matches):
+        interval = match_interval(match)
+        if interval is None:
+            continue
+        entry = (interval[0], interval[1], seq, match)
+        location = _field(match, 'location')
+        if location:
+            by_venue[location.strip().lower()].append(entry)
+        for team_field in ('team1', 'team2'):
+            team = _field(match, team_field)
+            if team:
+                by_team[team].append(entry)
+
+    conflicts = []
+    for venue, intervals in by_venue.items():
+        intervals.sort()
+        _sweep_overlaps(VENUE, intervals[0][3]['location'], intervals, conflicts.append)
+    for team, intervals in by_team.items():
+        intervals.sort()
+        _sweep_overlaps(TEAM, team, intervals, conflicts.append, max(min_rest_minutes, 0))
+
+    conflicts.sort(key=lambda c: (match_interval(c.first)[0], c.kind, _field(c.first, 'id') or 0,
+                                  _field(c.second, 'id') or 0))
+    return conflicts
+
+
+def format_minutes(minutes):
+    hours, minutes = divmod(minutes, 60)
+    if hours and minutes:
+        return f'{hours}h {minutes}m'
+    if hours:
+        return f'{hours}h'
+    return f'{minutes}m'
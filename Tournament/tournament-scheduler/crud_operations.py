@@ -1,42 +1,109 @@
-from abstraction import abstraction
+from cache import tournament_cache
+from conflicts import Conflict, DEFAULT_MIN_REST_MINUTES, DEFAULT_SLOT_MINUTES, DEFAULT_WINDOWS, TEAM, VENUE
 from datetime import datetime
-from tabulate import tabulate
+from fixtures import GROUP_PREFIX, KNOCKOUT, knockout_round
+from itertools import islice
+from metrics import InstrumentedConnection
+from reslot import FreeSlotIndex, ReslotResult, day_start, plan_reslot
+from schedule_model import TournamentSchedule
+import conflict_index
+import os
 import sqlite3
+import standings
+import team_index
+import threading
+import time
 
 DB_PATH = 'tournament_scheduler.db'
+BULK_BATCH_SIZE = 5000
+MATCH_PAGE_SIZE = 50
+STREAM_BATCH_SIZE = 500
+TOURNAMENT_PAGE_SIZE = 20
+# Dashboard sort keys. The first four only need the tournaments table, so a page
+# can be chosen before any matches are aggregated.
+TOURNAMENT_SORTS = {
+    'newest': 't.id',
+    'name': 't.name COLLATE NOCASE',
+    'start': 't.start_date',
+    'end': 't.end_date',
+    'matches': 'match_count',
+    'scheduled': 'scheduled_percent',
+    'span': 'span_days',
+    'venues': 'venue_count',
+    'conflicts': 'conflict_count',
+}
+TOURNAMENT_COLUMN_SORTS = ('newest', 'name', 'start', 'end')
+
+# Session settings applied once when a connection is opened. WAL lets readers
+# proceed while a writer commits, NORMAL sync is safe under WAL, and a negative
+# cache_size is measured in KiB.
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),
+    ('temp_store', 'MEMORY'),
+)
+BUSY_TIMEOUT_SECONDS = 10
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+# Connections a forked worker inherited; kept referenced so they are never
+# closed (or reused) in the child, which would disturb the parent's locks
+_inherited = []
+# One long-lived connection per process that only reads PRAGMA data_version,
+# which changes whenever any other connection commits; see sync_cache()
+_watcher = None
+_watcher_lock = threading.Lock()
+
+def _open_connection(path):
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS, cached_statements=CACHED_STATEMENTS,
+                           factory=InstrumentedConnection)
+    conn.row_factory = sqlite3.Row
+    for name, value in SQLITE_PRAGMAS:
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    # One connection per thread, reused by every helper until close_db_connection()
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != DB_PATH:
+        close_db_connection()
+        conn = _open_connection(DB_PATH)
+        _local.conn = conn
+        _local.path = DB_PATH
     return conn
 
-def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    # Create tournaments table
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS tournaments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            start_date TEXT NOT NULL,
-            end_date TEXT NOT NULL,
-            description TEXT
-        )
-    ''')
-    # Create matches table
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS matches (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tournament_id INTEGER NOT NULL,
-            team1 TEXT NOT NULL,
-            team2 TEXT NOT NULL,
-            date TEXT,
-            time TEXT,
-            FOREIGN KEY (tournament_id) REFERENCES tournaments(id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
+def close_db_connection(exception=None):
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _local.conn = None
+        conn.close()
+
+def _forget_inherited_connections():
+    global _local, _watcher, _watcher_lock
+    for conn in (getattr(_local, 'conn', None), _watcher and _watcher[0]):
+        if conn is not None:
+            _inherited.append(conn)
+    _local = threading.local()
+    _watcher = None
+    _watcher_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_inherited_connections)
+
+def sync_cache():
+    # For processes sharing the database with other writers: expires the read
+    # cache once any other connection has committed since the last call. That
+    # includes this process's own writes, which is coarser than invalidate()
+    # but never stale.
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None or _watcher[1] != DB_PATH:
+            _watcher = [sqlite3.connect(DB_PATH, check_same_thread=False), DB_PATH, None]
+        version = _watcher[0].execute('PRAGMA data_version').fetchone()[0]
+        if version != _watcher[2]:
+            tournament_cache.invalidate_all()
+            _watcher[2] = version
 
 def insert_tournament(name, start_date, end_date, description):
     conn = get_db_connection()
@@ -47,220 +114,816 @@ def insert_tournament(name, start_date, end_date, description):
     ''', (name, start_date, end_date, description))
     conn.commit()
     tournament_id = cur.lastrowid
-    conn.close()
+    tournament_cache.invalidate(tournament_id)
     return tournament_id
 
+# Cached reads return shared row lists; callers must copy before modifying
+@tournament_cache.cached('tournament')
 def fetch_tournament_by_id(tournament_id):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute('SELECT * FROM tournaments WHERE id = ?', (tournament_id,))
     tournament = cur.fetchone()
-    conn.close()
     return tournament
 
-def migrate_add_location_column():
+def insert_match(tournament_id, team1, team2, date=None, time=None, location=None, duration=1):
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("PRAGMA table_info(matches)")
-    columns = [row[1] for row in cur.fetchall()]
-    if 'location' not in columns:
-        cur.execute('ALTER TABLE matches ADD COLUMN location TEXT')
-        conn.commit()
-    conn.close()
+    with conn:
+        cur.execute('''
+            INSERT INTO matches (tournament_id, team1, team2, date, time, location, duration)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (tournament_id, team1, team2, date, time, location, duration))
+        match_id = cur.lastrowid
+        conflict_index.reindex_matches(cur, [match_id])
+        team_index.index_matches(cur, [match_id])
+        standings.add_teams(cur, [match_id])
+    tournament_cache.invalidate(tournament_id)
+    return match_id
 
-def migrate_add_duration_column():
+def _insert_fixture_batches(cur, tournament_id, fixtures, batch_size=BULK_BATCH_SIZE):
+    # Inserts (team1, team2, stage, round) rows in batches inside the caller's
+    # transaction, which must already hold the write lock so each batch gets a
+    # contiguous id range. Returns the number written.
+    rows = ((tournament_id, team1, team2, stage, round_number) for team1, team2, stage, round_number in fixtures)
+    written = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        cur.executemany('''
+            INSERT INTO matches (tournament_id, team1, team2, stage, round)
+            VALUES (?, ?, ?, ?, ?)
+        ''', batch)
+        written += len(batch)
+        cur.execute('SELECT MAX(id) FROM matches')
+        last_id = cur.fetchone()[0]
+        batch_ids = range(last_id - len(batch) + 1, last_id + 1)
+        team_index.index_matches(cur, batch_ids)
+        standings.add_teams(cur, batch_ids)
+    return written
+
+def insert_matches_bulk(tournament_id, fixtures, batch_size=BULK_BATCH_SIZE):
+    # Writes fixtures (see fixtures.py) as they are generated, in one transaction
+    # using batched executemany calls. Returns (rows_written, elapsed_seconds).
+    started = time.perf_counter()
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("PRAGMA table_info(matches)")
-    columns = [row[1] for row in cur.fetchall()]
-    if 'duration' not in columns:
-        cur.execute('ALTER TABLE matches ADD COLUMN duration INTEGER DEFAULT 1')
+    try:
+        cur.execute('BEGIN IMMEDIATE')
+        written = _insert_fixture_batches(cur, tournament_id, fixtures, batch_size)
         conn.commit()
-    conn.close()
-
-migrate_add_location_column()
-migrate_add_duration_column()
-
-def insert_match(tournament_id, team1, team2, date=None, time=None, location=None, duration=1):
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        tournament_cache.invalidate(tournament_id)
+    return written, time.perf_counter() - started
+
+def insert_fixtures_bulk(tournament_id, fixtures, batch_size=BULK_BATCH_SIZE):
+    # fixtures: iterable of (team1, team2, date, time, location, duration), consumed
+    # in batches inside one transaction, so an exception from the iterable rolls
+    # back every row. Returns (rows_written, elapsed_seconds).
+    started = time.perf_counter()
+    rows = ((tournament_id,) + tuple(fixture) for fixture in fixtures)
+    written = 0
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute('''
-        INSERT INTO matches (tournament_id, team1, team2, date, time, location, duration)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (tournament_id, team1, team2, date, time, location, duration))
-    conn.commit()
-    match_id = cur.lastrowid
-    conn.close()
-    return match_id
-
+    try:
+        # Take the write lock up front so each batch gets a contiguous id range
+        cur.execute('BEGIN IMMEDIATE')
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            cur.executemany('''
+                INSERT INTO matches (tournament_id, team1, team2, date, time, location, duration)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+            written += len(batch)
+            cur.execute('SELECT MAX(id) FROM matches')
+            last_id = cur.fetchone()[0]
+            batch_ids = range(last_id - len(batch) + 1, last_id + 1)
+            if any(row[3] for row in batch):
+                conflict_index.reindex_matches(cur, batch_ids)
+            team_index.index_matches(cur, batch_ids)
+            standings.add_teams(cur, batch_ids)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        tournament_cache.invalidate(tournament_id)
+    return written, time.perf_counter() - started
+
+@tournament_cache.cached('matches')
 def fetch_matches_by_tournament(tournament_id):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute('SELECT * FROM matches WHERE tournament_id = ?', (tournament_id,))
     matches = cur.fetchall()
-    conn.close()
     return matches
 
-def update_match_in_db(match_id, date, time, location=None, duration=None):
+@tournament_cache.cached('schedule')
+def fetch_schedule(tournament_id):
+    # The whole tournament as a compact TournamentSchedule, built straight from
+    # the cursor so no list of rows is held alongside it. Cached schedules are
+    # shared between requests; callers must not modify them.
+    tournament = fetch_tournament_by_id(tournament_id)
     conn = get_db_connection()
     cur = conn.cursor()
-    if location is not None and duration is not None:
-        cur.execute('UPDATE matches SET date = ?, time = ?, location = ?, duration = ? WHERE id = ?', (date, time, location, duration, match_id))
-    elif location is not None:
-        cur.execute('UPDATE matches SET date = ?, time = ?, location = ? WHERE id = ?', (date, time, location, match_id))
-    elif duration is not None:
-        cur.execute('UPDATE matches SET date = ?, time = ?, duration = ? WHERE id = ?', (date, time, duration, match_id))
-    else:
-        cur.execute('UPDATE matches SET date = ?, time = ? WHERE id = ?', (date, time, match_id))
-    conn.commit()
-    conn.close()
+    cur.execute('SELECT * FROM matches WHERE tournament_id = ? ORDER BY id', (tournament_id,))
+    return TournamentSchedule.from_matches(cur, tournament)
+
+def _match_filter_clause(tournament_id, date=None, location=None, team=None):
+    clauses = ['tournament_id = ?']
+    params = [tournament_id]
+    if date:
+        clauses.append('date = ?')
+        params.append(date)
+    if location:
+        clauses.append('location = ?')
+        params.append(location)
+    if team:
+        clauses.append('(team1 = ? OR team2 = ?)')
+        params.extend([team, team])
+    return ' AND '.join(clauses), params
+
+@tournament_cache.cached('matches_page')
+def fetch_matches_page(tournament_id, after_id=0, limit=MATCH_PAGE_SIZE, date=None, location=None, team=None):
+    # Keyset pagination on match id: returns (rows, next_after_id). next_after_id
+    # is None on the last page. Cost depends on the page size, not the offset.
+    where, params = _match_filter_clause(tournament_id, date, location, team)
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(f'SELECT * FROM matches WHERE {where} AND id > ? ORDER BY id LIMIT ?',
+                params + [after_id, limit + 1])
+    matches = cur.fetchall()
+    if len(matches) > limit:
+        return matches[:limit], matches[limit - 1]['id']
+    return matches, None
+
+def iter_matches(tournament_id, date=None, location=None, team=None, batch_size=STREAM_BATCH_SIZE):
+    # Yields matches one at a time, reading them in keyset batches so no
+    # read transaction stays open while the caller is streaming a response.
+    # Bypasses the cache so a full stream does not evict the hot pages.
+    after_id = 0
+    while after_id is not None:
+        matches, after_id = fetch_matches_page.uncached(tournament_id, after_id, batch_size, date, location, team)
+        yield from matches
+
+class MatchVersionConflict(Exception):
+    # Raised when a match changed after the editor loaded it; carries the current row
+    def __init__(self, match_id, current):
+        super().__init__(f"Match {match_id} was changed by someone else. Reload it and try again.")
+        self.match_id = match_id
+        self.current = current
+
+def fetch_match_by_id(match_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT * FROM matches WHERE id = ?', (match_id,))
+    match = cur.fetchone()
+    return match
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+def _current_minute():
+    # Now in the absolute minutes used by the conflict and team indexes
+    now = datetime.now()
+    return now.toordinal() * 1440 + now.hour * 60 + now.minute
+
+def update_match_in_db(match_id, date, time, location=None, duration=None, expected_version=None):
+    # With expected_version the write only applies if nobody saved the match
+    # since it was loaded; otherwise MatchVersionConflict is raised.
+    assignments = ['date = ?', 'time = ?']
+    params = [date, time]
+    if location is not None:
+        assignments.append('location = ?')
+        params.append(location)
+    if duration is not None:
+        assignments.append('duration = ?')
+        params.append(duration)
+    assignments.extend(['version = version + 1', 'updated_at = ?'])
+    params.extend([_now(), match_id])
+    where = 'id = ?'
+    if expected_version is not None:
+        where += ' AND version = ?'
+        params.append(expected_version)
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    with conn:
+        cur.execute(f'UPDATE matches SET {", ".join(assignments)} WHERE {where}', params)
+        updated = cur.rowcount
+        if updated:
+            conflict_index.reindex_matches(cur, [match_id])
+            team_index.index_matches(cur, [match_id])
+    match = fetch_match_by_id(match_id)
+    if match is not None:
+        tournament_cache.invalidate(match['tournament_id'])
+    if not updated and expected_version is not None:
+        raise MatchVersionConflict(match_id, match)
+    return match
+
+def update_match_schedules(tournament_id, assignments, expected_versions=None):
+    # assignments: iterable of (match_id, date, time, location, duration), applied
+    # in one transaction. expected_versions optionally maps match_id -> the version
+    # the editor loaded; if any of those changed since, nothing is written.
+    expected_versions = expected_versions or {}
+    updated_at = _now()
+    rows = [
+        (date, time, location, duration, updated_at, match_id, tournament_id)
+        for match_id, date, time, location, duration in assignments
+    ]
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        # The write lock is taken before comparing versions, so no other editor
+        # can save between the check and the update
+        cur.execute('BEGIN IMMEDIATE')
+        for chunk in conflict_index.chunks(sorted(expected_versions)):
+            cur.execute(f'''
+                SELECT * FROM matches WHERE id IN ({','.join('?' * len(chunk))})
+            ''', chunk)
+            current = {match['id']: match for match in cur.fetchall()}
+            for match_id in chunk:
+                match = current.get(match_id)
+                if match is None or match['version'] != expected_versions[match_id]:
+                    raise MatchVersionConflict(match_id, match)
+        cur.executemany('''
+            UPDATE matches
+            SET date = ?, time = ?, location = ?, duration = ?, version = version + 1, updated_at = ?
+            WHERE id = ? AND tournament_id = ?
+        ''', rows)
+        conflict_index.reindex_matches(cur, [row[5] for row in rows])
+        team_index.index_matches(cur, [row[5] for row in rows])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        tournament_cache.invalidate(tournament_id)
+    return len(rows)
+
+class ScheduleValidationError(ValueError):
+    # Carries every (match_id, message) problem found in a schedule payload
+    def __init__(self, errors):
+        super().__init__(errors[0][1])
+        self.errors = errors
+
+def validate_duration(match_id, duration):
+    # Returns the duration as whole hours; ValueError unless it is 1 to 10
+    try:
+        duration = int(duration)
+    except (TypeError, ValueError):
+        raise ValueError(f"Match {match_id}: Invalid duration.")
+    if duration < 1 or duration > 10:
+        raise ValueError(f"Match {match_id}: Duration must be between 1 and 10 hours.")
+    return duration
+
+def validate_schedule_change(match_id, fields, start_date, end_date):
+    date_str = fields.get('date')
+    time_str = fields.get('time')
+    location = fields.get('location') or ''
+    duration = fields.get('duration')
+    if not date_str or not time_str:
+        raise ValueError(f"Match {match_id}: Please enter both date and time.")
+    if duration in (None, ''):
+        raise ValueError(f"Match {match_id}: Please select a duration.")
+    try:
+        match_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+        datetime.strptime(time_str, "%H:%M")
+        int(duration)
+    except (TypeError, ValueError):
+        raise ValueError(f"Match {match_id}: Invalid date, time or duration format.")
+    duration = validate_duration(match_id, duration)
+    if match_date < start_date or match_date > end_date:
+        raise ValueError(
+            f"Match {match_id} date {date_str} is outside tournament dates "
+            f"({start_date} to {end_date})."
+        )
+    return match_id, date_str, time_str, location.strip(), duration
+
+def validate_schedule_changes(tournament, schedule, changes):
+    # changes maps match_id -> dict of date/time/location/duration. Missing
+    # fields fall back to the stored values so partial edits are accepted.
+    # Returns assignment rows for update_match_schedules() or raises
+    # ScheduleValidationError listing every problem in the payload.
+    start_date = datetime.strptime(tournament['start_date'], "%Y-%m-%d").date()
+    end_date = datetime.strptime(tournament['end_date'], "%Y-%m-%d").date()
+    rows = []
+    errors = []
+    for match_id, fields in changes.items():
+        index = schedule.find(match_id)
+        if index is None:
+            errors.append((match_id, f"Match {match_id} does not belong to this tournament."))
+            continue
+        current = schedule.match(index)
+        merged = {key: current[key] for key in ('date', 'time', 'location', 'duration')}
+        merged.update(fields)
+        try:
+            rows.append(validate_schedule_change(match_id, merged, start_date, end_date))
+        except ValueError as e:
+            errors.append((match_id, str(e)))
+    if errors:
+        raise ScheduleValidationError(errors)
+    return rows
+
+def bulk_update_matches(tournament_id, changes):
+    # Validates the whole payload before writing anything, then applies it
+    # with one batched statement in one transaction. A 'version' field makes
+    # that match's update conditional. Returns the row count.
+    tournament = fetch_tournament_by_id(tournament_id)
+    rows = validate_schedule_changes(tournament, fetch_schedule(tournament_id), changes)
+    expected_versions = {}
+    for match_id, fields in changes.items():
+        if fields.get('version') not in (None, ''):
+            try:
+                expected_versions[match_id] = int(fields['version'])
+            except (TypeError, ValueError):
+                raise ScheduleValidationError([(match_id, f"Match {match_id}: Invalid version.")])
+    return update_match_schedules(tournament_id, rows, expected_versions)
 
 def fetch_all_tournaments():
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute('SELECT * FROM tournaments ORDER BY id DESC')
     tournaments = cur.fetchall()
-    conn.close()
     return tournaments
 
+def _tournament_statistics_query(source, paging=''):
+    # One grouped statement: each tournament from `source` with its match statistics
+    return f'''
+        SELECT t.*,
+               COUNT(m.id) AS match_count,
+               SUM(m.date IS NOT NULL AND m.time IS NOT NULL) AS scheduled_count,
+               ROUND(100.0 * SUM(m.date IS NOT NULL AND m.time IS NOT NULL) / COUNT(m.id), 1) AS scheduled_percent,
+               MIN(m.date) AS first_date,
+               MAX(m.date) AS last_date,
+               CAST(julianday(MAX(m.date)) - julianday(MIN(m.date)) + 1 AS INTEGER) AS span_days,
+               COUNT(DISTINCT NULLIF(lower(trim(m.location)), '')) AS venue_count,
+               (SELECT COUNT(*) FROM match_conflicts c WHERE c.tournament_id = t.id) AS conflict_count
+        FROM {source} t
+        LEFT JOIN matches m ON m.tournament_id = t.id
+        GROUP BY t.id
+        {paging}
+    '''
+
+@tournament_cache.cached_all('tournament_statistics')
+def fetch_tournament_statistics():
+    # Every tournament with its statistics from a single pass over matches.
+    # Cached until any tournament changes, so sorting and paging by a statistic
+    # reuse one aggregation.
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(_tournament_statistics_query('tournaments'))
+    return cur.fetchall()
+
+def fetch_tournament_summaries(sort='newest', descending=True, limit=TOURNAMENT_PAGE_SIZE, offset=0):
+    # Returns (rows, total) for one dashboard page. Column sorts choose the page
+    # from the tournaments table first and aggregate only its matches.
+    if sort not in TOURNAMENT_COLUMN_SORTS:
+        rows = fetch_tournament_statistics()
+        column = TOURNAMENT_SORTS[sort]
+        # NULL statistics (no matches yet) sort lowest, as they would in SQLite
+        ordered = sorted(rows, key=lambda row: (row[column] is not None, row[column] or 0, row['id']),
+                         reverse=descending)
+        return ordered[offset:offset + limit], len(rows)
+    direction = ' DESC' if descending else ''
+    order = f'{TOURNAMENT_SORTS[sort]}{direction}, t.id{direction}'
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(_tournament_statistics_query(f'(SELECT * FROM tournaments t ORDER BY {order} LIMIT ? OFFSET ?)',
+                                             f'ORDER BY {order}'), (limit, offset))
+    rows = cur.fetchall()
+    cur.execute('SELECT COUNT(*) FROM tournaments')
+    return rows, cur.fetchone()[0]
+
 def delete_tournament_by_id(tournament_id):
+    conn = get_db_connection()
+    with conn:
+        cur = conn.cursor()
+        # Delete matches first (to maintain referential integrity)
+        cur.execute('DELETE FROM matches WHERE tournament_id = ?', (tournament_id,))
+        cur.execute('DELETE FROM tournaments WHERE id = ?', (tournament_id,))
+        conflict_index.remove_tournament(cur, tournament_id)
+        team_index.remove_tournament(cur, tournament_id)
+        standings.remove_tournament(cur, tournament_id)
+        cur.execute('DELETE FROM knockout_seeds WHERE tournament_id = ?', (tournament_id,))
+    tournament_cache.invalidate(tournament_id)
+
+def cancel_match_in_db(match_id):
+    # Clears a match's slot so it can be rescheduled; the conflict index drops it
     conn = get_db_connection()
     cur = conn.cursor()
-    # Delete matches first (to maintain referential integrity)
-    cur.execute('DELETE FROM matches WHERE tournament_id = ?', (tournament_id,))
-    cur.execute('DELETE FROM tournaments WHERE id = ?', (tournament_id,))
-    conn.commit()
-    conn.close()
-
-# Call init_db() when this module is imported
-init_db()
-
-class MatchScheduler:
-    def __init__(self):
-        self.matches = []
-
-    def generate_matches(self, teams):
-        self.matches = []
-        match_id = 1
-        for i in range(len(teams)):
-            for j in range(i + 1, len(teams)):
-                self.matches.append({"id": match_id, "teams": [teams[i], teams[j]]})
-                match_id += 1
-        print("Matches generated successfully!")
-
-    def schedule_matches(self):
-        if not self.matches:
-            print("No matches available to schedule.")
-            return
-
-        print("\nLet's schedule the matches. Enter the date and time for each match.")
-        for match in self.matches:
-            print(f"\nMatch ID: {match['id']}, Teams: {match['teams'][0]} vs {match['teams'][1]}")
-            while True:
-                date = input("Enter match date (YYYY-MM-DD): ").strip()
-                time = input("Enter match time (HH:MM): ").strip()
-                try:
-                    datetime.strptime(date, "%Y-%m-%d")
-                    datetime.strptime(time, "%H:%M")
-                    match["date"] = date
-                    match["time"] = time
-                    break
-                except ValueError:
-                    print("Invalid date or time format. Please try again.")
-        print("All matches have been scheduled successfully! 👍👍")
-
-    def view_matches(self):
-        if not self.matches:
-            print("No matches scheduled.")
-        else:
-            headers = ["ID", "Teams", "Date", "Time"]
-            table = [
-                [match["id"], f"{match['team1']} vs {match['team2']}", match.get("date", "Not Scheduled"),
-                 match.get("time", "Not Scheduled")]
-                for match in self.matches
-            ]
-            print("\nMatch Schedule:")
-            print(tabulate(table, headers=headers, tablefmt="grid"))
-
-    def update_match(self):
-        if not self.matches:
-            print("No matches to update.")
-            return
+    with conn:
+        cur.execute('''
+            UPDATE matches SET date = NULL, time = NULL, location = NULL,
+                version = version + 1, updated_at = ?
+            WHERE id = ?
+        ''', (_now(), match_id))
+        conflict_index.reindex_matches(cur, [match_id])
+        team_index.index_matches(cur, [match_id])
+    match = fetch_match_by_id(match_id)
+    if match is not None:
+        tournament_cache.invalidate(match['tournament_id'])
+    return match
+
+def record_match_result(match_id, score1, score2, expected_version=None):
+    # Saves a match's scores, or clears the result when both are None, and
+    # moves the two teams' standings by the difference in the same transaction
+    # (league and group matches only).
+    # Returns the updated match, or None if it does not exist.
+    conn = get_db_connection()
+    cur = conn.cursor()
+    tournament_id = None
+    try:
+        # The write lock is taken before reading the old result, so two scorers
+        # saving the same match cannot both subtract the same previous score
+        cur.execute('BEGIN IMMEDIATE')
+        cur.execute('SELECT * FROM matches WHERE id = ?', (match_id,))
+        match = cur.fetchone()
+        if match is None:
+            conn.rollback()
+            return None
+        tournament_id = match['tournament_id']
+        if expected_version is not None and match['version'] != expected_version:
+            raise MatchVersionConflict(match_id, match)
+        old = (match['score1'], match['score2']) if match['score1'] is not None else None
+        new = (score1, score2) if score1 is not None else None
+        now = _now()
+        cur.execute('''
+            UPDATE matches SET score1 = ?, score2 = ?, result_recorded_at = ?,
+                version = version + 1, updated_at = ?
+            WHERE id = ?
+        ''', (score1, score2, now if new else None, now, match_id))
+        if old != new and standings.counts(match['stage']):
+            cur.execute('SELECT name, id FROM teams WHERE name IN (?, ?)', (match['team1'], match['team2']))
+            team_ids = dict(cur.fetchall())
+            standings.apply_result(cur, tournament_id, (team_ids[match['team1']], team_ids[match['team2']]), old, new)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if tournament_id is not None:
+            tournament_cache.invalidate(tournament_id)
+    return fetch_match_by_id(match_id)
+
+def _tournament_venues(cur, tournament_id):
+    # (venue_key, name) for every venue the tournament has booked, walking the
+    # conflict index one distinct venue at a time instead of scanning its slots
+    cur.execute('''
+        WITH RECURSIVE venues(resource) AS (
+            SELECT MIN(resource) FROM match_slots WHERE tournament_id = ? AND kind = ?
+            UNION ALL
+            SELECT (SELECT MIN(resource) FROM match_slots
+                    WHERE tournament_id = ? AND kind = ? AND resource > venues.resource)
+            FROM venues WHERE resource IS NOT NULL
+        )
+        SELECT resource,
+               (SELECT m.location FROM match_slots s JOIN matches m ON m.id = s.match_id
+                WHERE s.tournament_id = ? AND s.kind = ? AND s.resource = venues.resource LIMIT 1)
+        FROM venues WHERE resource IS NOT NULL
+    ''', (tournament_id, VENUE, tournament_id, VENUE, tournament_id, VENUE))
+    return [tuple(row) for row in cur.fetchall()]
+
+def _free_slot_loader(cur, tournament_id, resources, skip_ids):
+    # FreeSlotIndex loader reading the conflict index for the given
+    # {kind: [resource, ...]}, leaving out skip_ids
+    def load(low, high):
+        rows = []
+        for kind, names in resources.items():
+            for chunk in conflict_index.chunks(names):
+                cur.execute(f'''
+                    SELECT match_id, resource, start_minute, end_minute FROM match_slots
+                    WHERE tournament_id = ? AND kind = ? AND resource IN ({','.join('?' * len(chunk))})
+                      AND start_minute >= ? AND start_minute < ?
+                ''', [tournament_id, kind] + chunk + [low, high])
+                rows.extend((kind, resource, start, end) for match_id, resource, start, end in cur.fetchall()
+                            if match_id not in skip_ids)
+        return rows
+    return load
+
+def reslot_matches(tournament_id, match_ids, windows=DEFAULT_WINDOWS, min_rest_minutes=conflict_index.INDEX_MIN_REST_MINUTES,
+                   slot_minutes=DEFAULT_SLOT_MINUTES, not_before=None):
+    # Moves each match to the earliest slot before the tournament's end_date
+    # where a venue is free and both teams keep their rest, leaving every
+    # other fixture where it is. Matches are placed in their original order
+    # from the day after the latest one's original date (or not_before, in
+    # absolute minutes), never in the past. Anything that does not fit is left
+    # unscheduled. Planning and writing share one transaction.
+    started = time.perf_counter()
+    tournament = fetch_tournament_by_id(tournament_id)
+    match_ids = list(match_ids)
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        # Holding the write lock while planning keeps the free slots current
+        cur.execute('BEGIN IMMEDIATE')
+        matches = []
+        for chunk in conflict_index.chunks(match_ids):
+            cur.execute(f'''
+                SELECT * FROM matches WHERE tournament_id = ? AND id IN ({','.join('?' * len(chunk))})
+            ''', [tournament_id] + chunk)
+            matches.extend(cur.fetchall())
+        matches.sort(key=lambda match: (match['date'] is None, match['date'] or '', match['time'] or '', match['id']))
+        if not_before is None:
+            dates = [match['date'] for match in matches if match['date']]
+            not_before = day_start(max(dates)) + 1440 if dates else day_start(tournament['start_date'])
+        not_before = max(not_before, day_start(tournament['start_date']), _current_minute() + 1)
+        venues = _tournament_venues(cur, tournament_id)
+        teams = {team for match in matches for team in (match['team1'], match['team2'])}
+        loader = _free_slot_loader(cur, tournament_id, {VENUE: [key for key, _ in venues], TEAM: sorted(teams)},
+                                   {match['id'] for match in matches})
+        index = FreeSlotIndex(min_rest_minutes, loader, not_before)
+        moves, unplaced = plan_reslot(
+            index,
+            [(match['id'], match['team1'], match['team2'], match['duration'],
+              conflict_index.venue_key(match['location']) if match['location'] else None) for match in matches],
+            venues, tournament['end_date'], not_before, windows, slot_minutes)
+        updated_at = _now()
+        cur.executemany('''
+            UPDATE matches
+            SET date = ?, time = ?, location = ?, duration = ?, version = version + 1, updated_at = ?
+            WHERE id = ?
+        ''', [(match_date, match_time, location, duration, updated_at, match_id)
+              for match_id, match_date, match_time, location, duration in moves])
+        cur.executemany('''
+            UPDATE matches SET date = NULL, time = NULL, version = version + 1, updated_at = ?
+            WHERE id = ?
+        ''', [(updated_at, match_id) for match_id in unplaced])
+        conflict_index.reindex_matches(cur, [match['id'] for match in matches])
+        team_index.index_matches(cur, [match['id'] for match in matches])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        tournament_cache.invalidate(tournament_id)
+    return ReslotResult(moves, unplaced, time.perf_counter() - started)
+
+def fetch_match_ids_on_day(tournament_id, day):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT id FROM matches WHERE tournament_id = ? AND date = ? ORDER BY time, id', (tournament_id, day))
+    return [row[0] for row in cur.fetchall()]
 
-        try:
-            match_id = int(input("Enter the Match ID to update: ").strip())
-        except ValueError:
-            print("Invalid ID. Please enter a valid number.")
-            return
-
-        for match in self.matches:
-            if match["id"] == match_id:
-                print(f"\nCurrent Details for Match ID {match_id}: Teams: {match['team1']} vs {match['team2']}, "
-                      f"Date: {match.get('date', 'Not Scheduled')}, Time: {match.get('time', 'Not Scheduled')}")
-                while True:
-                    date = input("Enter new match date (YYYY-MM-DD): ").strip()
-                    time = input("Enter new match time (HH:MM): ").strip()
-                    try:
-                        datetime.strptime(date, "%Y-%m-%d")
-                        datetime.strptime(time, "%H:%M")
-                        match["date"] = date
-                        match["time"] = time
-                        print("Match updated successfully!")
-                        return
-                    except ValueError:
-                        print("Invalid date or time format. Please try again.")
-        print("Match not found.")
-
-    def cancel_match(self):
-        if not self.matches:
-            print("No matches to cancel.")
-            return
+def reslot_day(tournament_id, day, **options):
+    # Re-slots every match of a rained-out day onto later days
+    return reslot_matches(tournament_id, fetch_match_ids_on_day(tournament_id, day),
+                          not_before=day_start(day) + 1440, **options)
 
-        try:
-            match_id = int(input("Enter the Match ID to cancel: ").strip())
-        except ValueError:
-            print("Invalid ID. Please enter a valid number.")
-            return
-
-        for match in self.matches:
-            if match["id"] == match_id:
-                print(f"\nMatch ID: {match_id}, Teams: {match['team1']} vs {match['team2']}")
-                weather = input("What is the weather like? (Sunny/Rainy/Cloudy): ").strip().lower()
-                if weather == "rainy":
-                    self.matches.remove(match)
-                    print(f"Match ID {match_id} canceled due to rainy weather! 🌧️")
-                else:
-                    print("The match can continue. No cancellation required. ☀️")
-                return
-        print("Match not found.")
-
-    def check_conflicts(self):
-        if not self.matches:
-            print("No matches scheduled.")
-            return
-
-        conflicts = []
-        match_schedule = {}
-
-        for match in self.matches:
-            if "date" in match and "time" in match:
-                key = (match["date"], match["time"])
-                if key not in match_schedule:
-                    match_schedule[key] = []
-                match_schedule[key].append(match)
-
-        for key, conflict_matches in match_schedule.items():
-            if len(conflict_matches) > 1:
-                conflicts.append((key, conflict_matches))
-
-        if conflicts:
-            print("\nConflicts Found:")
-            for (date, time), conflict_matches in conflicts:
-                print(f"\nDate: {date}, Time: {time}")
-                for conflict in conflict_matches:
-                    print(f"  Match ID: {conflict['id']}, Teams: {conflict['team1']} vs {conflict['team2']}")
-        else:
-            print("No conflicts found. All matches are scheduled properly.")
+def fetch_matches_by_ids(match_ids):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    matches = {}
+    for chunk in conflict_index.chunks(match_ids):
+        cur.execute(f'SELECT * FROM matches WHERE id IN ({",".join("?" * len(chunk))})', chunk)
+        matches.update((row['id'], row) for row in cur.fetchall())
+    return matches
+
+def _team_scope(team_id, tournament_id):
+    # WHERE clause on match_teams for one team, optionally within one tournament
+    if tournament_id is None:
+        return 'mt.team_id = ?', [team_id]
+    return 'mt.tournament_id = ? AND mt.team_id = ?', [tournament_id, team_id]
 
+def fetch_team_by_id(team_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT * FROM teams WHERE id = ?', (team_id,))
+    return cur.fetchone()
 
+def fetch_team_by_name(name):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT * FROM teams WHERE name = ?', (name,))
+    return cur.fetchone()
 
+@tournament_cache.cached('teams')
+def fetch_tournament_teams(tournament_id):
+    # Every team in the tournament with its fixture count and first and last
+    # scheduled start, read from the participation index in team order
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT t.id, t.name, COUNT(*) AS fixtures, COUNT(mt.start_minute) AS scheduled,
+               MIN(mt.start_minute) AS first_start, MAX(mt.start_minute) AS last_start
+        FROM match_teams mt JOIN teams t ON t.id = mt.team_id
+        WHERE mt.tournament_id = ?
+        GROUP BY mt.team_id
+        ORDER BY t.name COLLATE NOCASE
+    ''', (tournament_id,))
+    return cur.fetchall()
+
+def fetch_team_fixtures(team_id, tournament_id=None):
+    # The team's matches in start order, unscheduled ones last, each with the
+    # rest in minutes since the team's previous match ended (NULL for the first)
+    where, params = _team_scope(team_id, tournament_id)
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(f'''
+        SELECT m.*, tr.name AS tournament_name, mt.start_minute,
+               mt.start_minute - LAG(mt.end_minute) OVER (ORDER BY mt.start_minute, mt.match_id) AS rest_minutes
+        FROM match_teams mt
+        JOIN matches m ON m.id = mt.match_id
+        JOIN tournaments tr ON tr.id = mt.tournament_id
+        WHERE {where}
+        ORDER BY mt.start_minute IS NULL, mt.start_minute, mt.match_id
+    ''', params)
+    return cur.fetchall()
+
+def fetch_next_match(team_id, tournament_id=None, after_minute=None):
+    # The team's first match starting at or after after_minute (default: now)
+    where, params = _team_scope(team_id, tournament_id)
+    if after_minute is None:
+        after_minute = _current_minute()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(f'''
+        SELECT m.*, tr.name AS tournament_name, mt.start_minute
+        FROM match_teams mt
+        JOIN matches m ON m.id = mt.match_id
+        JOIN tournaments tr ON tr.id = mt.tournament_id
+        WHERE {where} AND mt.start_minute >= ?
+        ORDER BY mt.start_minute, mt.match_id
+        LIMIT 1
+    ''', params + [after_minute])
+    return cur.fetchone()
+
+def fetch_team_rest_stats(team_id, tournament_id=None, min_rest_minutes=DEFAULT_MIN_REST_MINUTES):
+    # Gaps between the end of each scheduled match and the start of the team's
+    # next one: count, shortest, average, longest and how many fall under
+    # min_rest_minutes. A negative gap is an overlap.
+    where, params = _team_scope(team_id, tournament_id)
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(f'''
+        SELECT COUNT(gap) AS gaps, MIN(gap) AS shortest, AVG(gap) AS average, MAX(gap) AS longest,
+               COALESCE(SUM(gap < ?), 0) AS short
+        FROM (
+            SELECT mt.start_minute - LAG(mt.end_minute) OVER (ORDER BY mt.start_minute, mt.match_id) AS gap
+            FROM match_teams mt
+            WHERE {where} AND mt.start_minute IS NOT NULL
+        )
+    ''', [min_rest_minutes] + params)
+    return cur.fetchone()
+
+@tournament_cache.cached('standings')
+def fetch_standings(tournament_id):
+    # The leaderboard in rank order, read along idx_standings_rank
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(f'''
+        SELECT t.id, t.name, {', '.join('s.' + column for column in standings.COLUMNS)}
+        FROM standings s JOIN teams t ON t.id = s.team_id
+        WHERE s.tournament_id = ?
+        ORDER BY {standings.RANK_ORDER}
+    ''', (tournament_id,))
+    return cur.fetchall()
+
+def fetch_group_members(tournament_id):
+    # {stage: team names} for every group of the tournament's group stage. The
+    # stage range covers every name starting with GROUP_PREFIX, so only group
+    # matches are read from idx_matches_stage_round.
+    after_groups = GROUP_PREFIX[:-1] + chr(ord(GROUP_PREFIX[-1]) + 1)
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT stage, team1 FROM matches WHERE tournament_id = ? AND stage >= ? AND stage < ?
+        UNION SELECT stage, team2 FROM matches WHERE tournament_id = ? AND stage >= ? AND stage < ?
+        ORDER BY 1, 2
+    ''', (tournament_id, GROUP_PREFIX, after_groups) * 2)
+    groups = {}
+    for stage, team in cur.fetchall():
+        groups.setdefault(stage, []).append(team)
+    return groups
+
+def fetch_knockout_seeds(tournament_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT t.name FROM knockout_seeds k JOIN teams t ON t.id = k.team_id
+        WHERE k.tournament_id = ? ORDER BY k.seed
+    ''', (tournament_id,))
+    return [row[0] for row in cur.fetchall()]
+
+def _next_knockout_round(cur, tournament_id, seeds):
+    # A tie is decided once it has a result that is not a draw
+    cur.execute('''
+        SELECT team1, team2, score1, score2 FROM matches
+        WHERE tournament_id = ? AND stage = ?
+    ''', (tournament_id, KNOCKOUT))
+    winners = {}
+    for team1, team2, score1, score2 in cur.fetchall():
+        winner = None
+        if score1 is not None and score1 != score2:
+            winner = team1 if score1 > score2 else team2
+        winners[frozenset((team1, team2))] = winner
+    return knockout_round(seeds, winners)
+
+def start_knockout(tournament_id, seeds):
+    # Stores the bracket's seeds (best first) and creates its first round.
+    # Returns the fixtures created; ValueError if the tournament already has one.
+    if len(seeds) < 2:
+        raise ValueError("A knockout needs at least two teams.")
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute('BEGIN IMMEDIATE')
+        cur.execute('SELECT 1 FROM knockout_seeds WHERE tournament_id = ? LIMIT 1', (tournament_id,))
+        if cur.fetchone():
+            raise ValueError("This tournament already has a knockout bracket.")
+        cur.executemany('INSERT OR IGNORE INTO teams (name) VALUES (?)', [(team,) for team in seeds])
+        cur.executemany('''
+            INSERT INTO knockout_seeds (tournament_id, seed, team_id)
+            SELECT ?, ?, id FROM teams WHERE name = ?
+        ''', [(tournament_id, seed, team) for seed, team in enumerate(seeds, 1)])
+        fixtures = _next_knockout_round(cur, tournament_id, seeds)
+        _insert_fixture_batches(cur, tournament_id, fixtures)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        tournament_cache.invalidate(tournament_id)
+    return fixtures
+
+def advance_knockout(tournament_id):
+    # Creates the next knockout round once every tie of the current one is
+    # decided. Returns the fixtures created, empty while results are missing
+    # or once the final is decided.
+    seeds = fetch_knockout_seeds(tournament_id)
+    if not seeds:
+        raise ValueError("This tournament has no knockout bracket.")
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute('BEGIN IMMEDIATE')
+        fixtures = _next_knockout_round(cur, tournament_id, seeds)
+        _insert_fixture_batches(cur, tournament_id, fixtures)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        tournament_cache.invalidate(tournament_id)
+    return fixtures
+
+def count_matches(tournament_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT COUNT(*) FROM matches WHERE tournament_id = ?', (tournament_id,))
+    return cur.fetchone()[0]
+
+@tournament_cache.cached('conflicts')
+def fetch_conflicts(tournament_id, match_id=None):
+    # Reads the persisted conflict index; optionally only pairs involving match_id
+    conn = get_db_connection()
+    cur = conn.cursor()
+    if match_id is None:
+        rows = conflict_index.conflict_rows(cur, tournament_id)
+    else:
+        rows = conflict_index.conflict_rows_for_match(cur, match_id)
+    matches = fetch_matches_by_ids({row[2] for row in rows} | {row[3] for row in rows})
+    conflicts = []
+    for kind, resource, first_id, second_id, minutes in rows:
+        first, second = matches[first_id], matches[second_id]
+        key = first['location'] if kind == VENUE else resource
+        conflicts.append(Conflict(kind, key, first, second, minutes))
+    return conflicts
+
+def count_conflicts(tournament_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT COUNT(*) FROM match_conflicts WHERE tournament_id = ?', (tournament_id,))
+    return cur.fetchone()[0]
+
+def rebuild_conflict_index(tournament_id):
+    conn = get_db_connection()
+    with conn:
+        conflict_index.rebuild_tournament(conn.cursor(), tournament_id)
+    tournament_cache.invalidate(tournament_id)
+
+def verify_conflict_index(tournament_id):
+    # Returns (missing, unexpected) conflict rows compared to a full rebuild;
+    # both empty means the incremental index is consistent
+    conn = get_db_connection()
+    with conn:
+        return conflict_index.compare_with_rebuild(conn, tournament_id)
+
+def rebuild_standings(tournament_id):
+    conn = get_db_connection()
+    with conn:
+        standings.rebuild_tournament(conn.cursor(), tournament_id)
+    tournament_cache.invalidate(tournament_id)
+
+def verify_standings(tournament_id):
+    # Returns (missing, unexpected) standings rows compared to a full rebuild;
+    # both empty means the incremental table is consistent
+    conn = get_db_connection()
+    with conn:
+        return standings.compare_with_rebuild(conn, tournament_id)
@@ -0,0 +1,177 @@
+from collections import namedtuple
+from itertools import zip_longest
+
+# Fixture generators for each tournament format. They yield Fixture rows lazily,
+# round by round, so a format streams straight into batched inserts and holds
+# only O(teams) in memory however many matches it produces. Round robins use
+# the circle method: one team stays fixed while the rest rotate, so nobody
+# plays twice in a round, an odd team count gives one team a bye each round,
+# and home and away alternate with at most one break per team.
+LEAGUE = 'League'
+KNOCKOUT = 'Knockout'
+GROUP_PREFIX = 'Group '
+FORMATS = {
+    'round_robin': 'Round robin',
+    'double_round_robin': 'Double round robin',
+    'groups': 'Group stage',
+    'knockout': 'Knockout',
+}
+
+Fixture = namedtuple('Fixture', ['team1', 'team2', 'stage', 'round'])
+
+
+def circle_rounds(teams):
+    # Yields each round as a list of (home, away) pairs; byes are left out
+    teams = list(teams)
+    if len(teams) % 2:
+        teams.append(None)
+    if len(teams) < 2:
+        return
+    fixed, ring = teams[-1], teams[:-1]
+    size = len(ring)
+    half = len(teams) // 2
+    for r in range(size):
+        # Round r pairs the ring, rotated r places, from both ends inwards:
+        # position k meets position -k, swapping home and away every other pair
+        rotated = ring[r:] + ring[:r]
+        pairs = list(zip(rotated[1:half], rotated[:size - half:-1]))
+        pairs[1::2] = [(second, first) for first, second in pairs[1::2]]
+        if fixed is not None:
+            pairs.insert(0, (fixed, rotated[0]) if r % 2 else (rotated[0], fixed))
+        yield pairs
+
+
+def round_robin(teams, legs=1, stage=LEAGUE):
+    # Every pair meets once per leg; the second leg swaps home and away and
+    # its rounds follow on from the first's
+    teams = list(dict.fromkeys(teams))
+    rounds = len(teams) - 1 + len(teams) % 2
+    for leg in range(legs):
+        for number, pairs in enumerate(circle_rounds(teams), leg * rounds + 1):
+            for home, away in pairs:
+                if leg % 2:
+                    home, away = away, home
+                yield Fixture(home, away, stage, number)
+
+
+def group_name(index):
+    if index < 26:
+        return GROUP_PREFIX + chr(ord('A') + index)
+    return f'{GROUP_PREFIX}{index + 1}'
+
+
+def seed_groups(teams, group_count):
+    # Snake seeding: teams in seed order go A, B, C, C, B, A, A, B, ... so every
+    # group gets an even share of strong and weak seeds
+    groups = [[] for _ in range(group_count)]
+    for i, team in enumerate(dict.fromkeys(teams)):
+        lap, position = divmod(i, group_count)
+        groups[position if lap % 2 == 0 else group_count - 1 - position].append(team)
+    return groups
+
+
+def group_stage(teams, group_count, legs=1):
+    # A round robin inside each group. Round n of every group comes out
+    # together, so the groups play their rounds side by side.
+    groups = seed_groups(teams, group_count) if group_count and group_count > 0 else []
+    if not groups or any(len(group) < 2 for group in groups):
+        raise ValueError("Every group needs at least two teams.")
+    rounds = [_by_round(round_robin(group, legs, group_name(i))) for i, group in enumerate(groups)]
+    return (fixture for same_round in zip_longest(*rounds, fillvalue=())
+            for fixtures in same_round for fixture in fixtures)
+
+
+def _by_round(fixtures):
+    # Groups consecutive fixtures with the same round number into lists
+    current = []
+    for fixture in fixtures:
+        if current and fixture.round != current[0].round:
+            yield current
+            current = []
+        current.append(fixture)
+    if current:
+        yield current
+
+
+def bracket_order(size):
+    # Seed numbers in bracket position order for a power-of-two size, e.g.
+    # 8 -> 1 8 4 5 2 7 3 6, so the top two seeds can only meet in the final
+    order = [1]
+    while len(order) < size:
+        total = len(order) * 2 + 1
+        order = [seed for top in order for seed in (top, total - top)]
+    return order
+
+
+def knockout_round(seeds, winners):
+    # seeds: teams in seed order, best first. winners maps frozenset({team1,
+    # team2}) to the winner of each knockout tie created so far, or None while
+    # it is undecided. Returns the fixtures of the next round to create: the
+    # first round with a tie not yet in winners. Nothing is returned while a
+    # round is still being played or once the final is decided. Seeds past the
+    # number of teams are byes, which fall to the top seeds.
+    size = 1
+    while size < len(seeds):
+        size *= 2
+    slots = [seeds[seed - 1] if seed <= len(seeds) else None for seed in bracket_order(size)]
+    number = 1
+    while len(slots) > 1:
+        advancing = []
+        pending = []
+        for home, away in zip(slots[::2], slots[1::2]):
+            if home is None or away is None:
+                advancing.append(home if away is None else away)
+                continue
+            tie = frozenset((home, away))
+            if tie not in winners:
+                pending.append(Fixture(home, away, KNOCKOUT, number))
+            elif winners[tie] is None:
+                return []
+            advancing.append(winners.get(tie))
+        if pending:
+            return pending
+        slots = advancing
+        number += 1
+    return []
+
+
+def knockout_seeds(standings, size=None, groups=None, per_group=None):
+    # Qualifiers for a knockout in seed order from standings rows in rank
+    # order: the top `size` teams, or with groups ({stage: team names}) the
+    # top per_group of each group, group winners seeded ahead of runners-up
+    ranked = [row['name'] for row in standings]
+    if groups is None:
+        return ranked[:size]
+    rank = {name: i for i, name in enumerate(ranked)}
+    places = [sorted(members, key=lambda name: rank.get(name, len(rank)))[:per_group]
+              for members in groups.values()]
+    seeds = []
+    for place in range(per_group):
+        finishers = [members[place] for members in places if place < len(members)]
+        seeds.extend(sorted(finishers, key=lambda name: rank.get(name, len(rank))))
+    return seeds
+
+
+def generate(fmt, teams, group_count=None):
+    # League and group fixtures for a format chosen on the generate form; a
+    # knockout's later rounds depend on results, so it starts from seeds instead
+    if fmt == 'round_robin':
+        return round_robin(teams)
+    if fmt == 'double_round_robin':
+        return round_robin(teams, legs=2)
+    if fmt == 'groups':
+        return group_stage(teams, group_count)
+    raise ValueError(f"Unknown format {fmt}.")
+
+
+def fixture_count(fmt, teams, group_count=None):
+    # How many fixtures generate() yields for the same arguments, without
+    # generating them
+    team_count = len(dict.fromkeys(teams))
+    if fmt == 'round_robin':
+        return team_count * (team_count - 1) // 2
+    if fmt == 'double_round_robin':
+        return team_count * (team_count - 1)
+    if fmt == 'groups':
+        return sum(len(group) * (len(group) - 1) // 2 for group in seed_groups(range(team_count), group_count))
+    raise ValueError(f"Unknown format {fmt}.")
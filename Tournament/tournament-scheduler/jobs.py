@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import secrets
+import threading
+
+from crud_operations import close_db_connection, get_db_connection
+
+# A local background queue for long writes: generating fixtures, saving a
+# whole schedule and deleting a tournament. Jobs run on a small thread pool in
+# the process that accepted them, so the request returns at once. Each job's
+# status is kept in the jobs table rather than in memory, so whichever worker
+# process serves a status poll can answer it. SQLite takes one writer at a
+# time, so a couple of threads are enough.
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+JOB_WORKERS = int(os.environ.get('TOURNAMENT_JOB_WORKERS', 2))
+# Finished jobs are pruned after this long
+JOB_RETENTION = timedelta(days=1)
+INTERRUPTED = "The server stopped before this job finished."
+UNEXPECTED = "The job failed unexpectedly; see the server log."
+
+logger = logging.getLogger(__name__)
+_executor = None
+_lock = threading.Lock()
+
+
+def _new_owner():
+    # Identifies this process in jobs.owner; the token tells a restarted
+    # process apart from an earlier one that had the same pid
+    return f'{os.getpid()}-{secrets.token_hex(4)}'
+
+
+_owner = _new_owner()
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def _pool():
+    # Created on first use, so a parent process that forks workers never
+    # starts threads its children would not have
+    global _executor
+    with _lock:
+        if _executor is None:
+            recover_jobs()
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+        return _executor
+
+
+def _forget_pool():
+    global _executor, _lock, _owner
+    _executor = None
+    _lock = threading.Lock()
+    _owner = _new_owner()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_pool)
+
+
+def submit(kind, tournament_id, func, *args, errors=(ValueError,)):
+    # Queues func(*args) and returns the job id. func returns a JSON-serialisable
+    # result; an exception in `errors` fails the job with its message, anything
+    # else is logged and reported as unexpected.
+    conn = get_db_connection()
+    with conn:
+        cur = conn.cursor()
+        cur.execute('DELETE FROM jobs WHERE finished_at < ?', ((datetime.now() - JOB_RETENTION).isoformat(),))
+        cur.execute('''
+            INSERT INTO jobs (kind, tournament_id, status, owner, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (kind, tournament_id, QUEUED, _owner, _now()))
+        job_id = cur.lastrowid
+    _pool().submit(_run, job_id, func, args, errors)
+    return job_id
+
+
+def _finish(job_id, status, result=None, error=None):
+    conn = get_db_connection()
+    with conn:
+        conn.execute('''
+            UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?
+        ''', (status, json.dumps(result) if result is not None else None, error, _now(), job_id))
+
+
+def _run(job_id, func, args, errors):
+    try:
+        conn = get_db_connection()
+        with conn:
+            conn.execute('UPDATE jobs SET status = ?, started_at = ? WHERE id = ?', (RUNNING, _now(), job_id))
+        result = func(*args)
+    except errors as e:
+        _finish(job_id, FAILED, error=str(e))
+    except Exception:
+        logger.exception('Job %s failed', job_id)
+        _finish(job_id, FAILED, error=UNEXPECTED)
+    else:
+        _finish(job_id, DONE, result=result)
+    finally:
+        # Pool threads outlive the job, so don't hold a connection between jobs
+        close_db_connection()
+
+
+def fetch_job(job_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+def _alive(owner):
+    if owner == _owner:
+        return True
+    pid = int(owner.split('-')[0])
+    # Without fork there is only one serving process, so any other owner is
+    # an earlier run; os.kill would also end the process on Windows
+    if pid == os.getpid() or not hasattr(os, 'fork'):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def recover_jobs():
+    # Fails jobs left queued or running by processes that have exited, so
+    # their pages stop polling. Returns how many were marked.
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT id, owner FROM jobs WHERE status IN (?, ?)', (QUEUED, RUNNING))
+    orphaned = [(FAILED, INTERRUPTED, _now(), job_id) for job_id, owner in cur.fetchall() if not _alive(owner)]
+    if orphaned:
+        with conn:
+            cur.executemany('UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?', orphaned)
+    return len(orphaned)
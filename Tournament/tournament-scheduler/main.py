@@ -1,10 +1,68 @@
-from crud_operations import MatchScheduler
+from crud_operations import close_db_connection, fetch_schedule, insert_fixtures_bulk, insert_tournament
+from migrations import migrate
+from schedule_model import TournamentSchedule
+
+MENU = [
+    ("Create tournament", 'create_tournment'),
+    ("Generate matches", 'generate_matches'),
+    ("Schedule matches", 'schedule_matches'),
+    ("View matches", 'view_matches'),
+    ("Update a match", 'update_match'),
+    ("Cancel a match", 'cancel_match'),
+    ("Check conflicts", 'check_conflicts'),
+]
 
 class TournamentManager:
     def __init__(self):
-        self.scheduler = MatchScheduler()
-        
+        self.scheduler = TournamentSchedule()
+
+    def load_tournament(self):
+        try:
+            tournament_id = int(input("Enter the tournament ID to load: ").strip())
+        except ValueError:
+            print("Invalid ID. Please enter a valid number.")
+            return
+        schedule = fetch_schedule.uncached(tournament_id)
+        if schedule.tournament_id is None:
+            print("Tournament not found.")
+            return
+        self.scheduler = schedule
+        print(f"Loaded '{schedule.name}' with {len(schedule)} matches.")
+
+    def save_tournament(self):
+        # Saves the schedule as a new tournament so the web app can open it
+        schedule = self.scheduler
+        if not schedule.start_date or not schedule.end_date:
+            print("Create the tournament first so it has a name and dates.")
+            return
+        tournament_id = insert_tournament(schedule.name, schedule.start_date, schedule.end_date,
+                                          schedule.description or '')
+        written, _ = insert_fixtures_bulk(tournament_id, schedule.fixture_rows())
+        print(f"Saved as tournament {tournament_id} with {written} matches.")
+
+    def main_menu(self):
+        actions = MENU + [("Load tournament from database", self.load_tournament),
+                          ("Save as new tournament in database", self.save_tournament)]
+        while True:
+            print("\nTournament Scheduler")
+            for number, (label, _) in enumerate(actions, 1):
+                print(f"{number}. {label}")
+            print("0. Exit")
+            choice = input("Choose an option: ").strip()
+            if choice == '0':
+                break
+            if not choice.isdigit() or not 1 <= int(choice) <= len(actions):
+                print("Invalid option. Please try again.")
+                continue
+            action = actions[int(choice) - 1][1]
+            # Schedule operations go to whichever schedule is currently loaded
+            if isinstance(action, str):
+                action = getattr(self.scheduler, action)
+            action()
+        close_db_connection()
+
 # Example Usage
 if __name__ == "__main__":
+    migrate()
     manager = TournamentManager()
     manager.main_menu()
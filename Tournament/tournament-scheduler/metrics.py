@@ -0,0 +1,387 @@
+from bisect import bisect_left
+from collections import Counter, deque
+from functools import lru_cache
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 1000, 10000)
+# A statement run this many times with execute() in one request is an N+1 pattern
+N_PLUS_ONE_THRESHOLD = 25
+SLOW_STATEMENT_LIMIT = 10
+STATEMENT_LABEL_LENGTH = 200
+# SQLite VM instructions between progress callbacks
+PROGRESS_INTERVAL = 1000
+PROFILE_INTERVAL_SECONDS = 0.005
+PROFILE_HISTORY = 20
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+logger = logging.getLogger(__name__)
+_local = threading.local()
+_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class StatementStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.vm_steps = 0
+
+
+class RequestStats:
+    # Collected for the request running on this thread, then folded into the
+    # process-wide aggregates when it finishes
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.query_seconds = 0.0
+        self.render_seconds = 0.0
+        self.render_started = []
+        self.executions = Counter()
+        self.profiler = None
+
+
+# Process-wide aggregates, guarded by _lock
+request_seconds = {}
+render_seconds = {}
+request_query_seconds = {}
+request_statements = {}
+responses = Counter()
+statements = {}
+n_plus_one = Counter()
+statements_total = 0
+profiles = deque(maxlen=PROFILE_HISTORY)
+_profile_ids = iter(range(1, sys.maxsize))
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    sql = ' '.join(sql.split())
+    # IN lists of different lengths are the same statement
+    return re.sub(r'\?(?:\s*,\s*\?)+', '?, ...', sql)
+
+
+def _statement_stats(sql):
+    key = normalize_sql(sql)
+    with _lock:
+        stats = statements.get(key)
+        if stats is None:
+            stats = statements[key] = StatementStats()
+    return key, stats
+
+
+def _trace(statement):
+    # Fires once per statement SQLite runs, including each executemany row and
+    # the BEGIN/COMMIT issued by the sqlite3 module
+    global statements_total
+    with _lock:
+        statements_total += 1
+    current = getattr(_local, 'request', None)
+    if current is not None:
+        current.statements += 1
+
+
+def _progress():
+    stats = getattr(_local, 'statement', None)
+    if stats is not None:
+        stats.vm_steps += PROGRESS_INTERVAL
+    return 0
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Times execute() together with the fetches that follow it, so a SELECT's
+    # cost includes stepping through its rows
+    _stats = None
+    _elapsed = 0.0
+
+    def _timed(self, stats, call, *args):
+        _local.statement = stats
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            _local.statement = None
+            self._elapsed += elapsed
+            with _lock:
+                stats.seconds += elapsed
+                stats.max_seconds = max(stats.max_seconds, self._elapsed)
+            current = getattr(_local, 'request', None)
+            if current is not None:
+                current.query_seconds += elapsed
+
+    def _begin(self, sql, executions):
+        key, stats = _statement_stats(sql)
+        with _lock:
+            stats.count += 1
+        self._stats = stats
+        self._elapsed = 0.0
+        current = getattr(_local, 'request', None)
+        # Statements with an IN list are already batched, so repeats aren't N+1
+        if current is not None and executions and '?, ...' not in key:
+            current.executions[key] += 1
+        return stats
+
+    def execute(self, sql, *args):
+        return self._timed(self._begin(sql, True), super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._timed(self._begin(sql, False), super().executemany, sql, *args)
+
+    def fetchone(self):
+        if self._stats is None:
+            return super().fetchone()
+        return self._timed(self._stats, super().fetchone)
+
+    def fetchmany(self, *args):
+        if self._stats is None:
+            return super().fetchmany(*args)
+        return self._timed(self._stats, super().fetchmany, *args)
+
+    def fetchall(self):
+        if self._stats is None:
+            return super().fetchall()
+        return self._timed(self._stats, super().fetchall)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_trace)
+        self.set_progress_handler(_progress, PROGRESS_INTERVAL)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+
+class SamplingProfiler:
+    # Samples one thread's stack from a background thread and counts each
+    # distinct stack, in the collapsed format flame graph tools read
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def report(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+
+def current_request():
+    return getattr(_local, 'request', None)
+
+
+def begin_request(route, profile=False):
+    current = RequestStats(route)
+    if profile:
+        current.profiler = SamplingProfiler(threading.get_ident()).start()
+    _local.request = current
+    return current
+
+
+def stop_profiler(current):
+    # Returns the id of the stored profile, or None if the request wasn't profiled
+    if current.profiler is None:
+        return None
+    current.profiler.stop()
+    profile_id = next(_profile_ids)
+    profiles.append((profile_id, current.route, current.profiler.report()))
+    current.profiler = None
+    return profile_id
+
+
+def end_request(status):
+    current = getattr(_local, 'request', None)
+    if current is None:
+        return None
+    _local.request = None
+    stop_profiler(current)
+    route = current.route
+    elapsed = time.perf_counter() - current.started
+    repeated = [(sql, count) for sql, count in current.executions.items() if count >= N_PLUS_ONE_THRESHOLD]
+    with _lock:
+        request_seconds.setdefault(route, Histogram()).observe(elapsed)
+        request_query_seconds.setdefault(route, Histogram()).observe(current.query_seconds)
+        request_statements.setdefault(route, Histogram(QUERY_COUNT_BUCKETS)).observe(current.statements)
+        responses[(route, status)] += 1
+        for sql, count in repeated:
+            n_plus_one[(route, sql)] += 1
+    for sql, count in repeated:
+        logger.warning('Possible N+1 in %s: %d executions of %s', route, count, sql)
+    return current
+
+
+def render_started(template):
+    current = getattr(_local, 'request', None)
+    if current is not None:
+        current.render_started.append(time.perf_counter())
+
+
+def render_finished(template):
+    current = getattr(_local, 'request', None)
+    if current is None or not current.render_started:
+        return
+    elapsed = time.perf_counter() - current.render_started.pop()
+    current.render_seconds += elapsed
+    with _lock:
+        render_seconds.setdefault(template.name or 'string', Histogram()).observe(elapsed)
+
+
+def _label(value):
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'"{value}"'
+
+
+def _histogram_lines(name, help_text, histograms, label):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for key, histogram in sorted(histograms.items()):
+        prefix = f'{label}={_label(key)}'
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{prefix},le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{prefix}}} {round(histogram.sum, 6)}')
+        lines.append(f'{name}_count{{{prefix}}} {histogram.count}')
+    return lines
+
+
+def render_prometheus():
+    with _lock:
+        lines = []
+        lines += _histogram_lines('http_request_duration_seconds', 'Wall time per request.',
+                                  request_seconds, 'route')
+        lines += _histogram_lines('template_render_duration_seconds', 'Time spent rendering each template.',
+                                  render_seconds, 'template')
+        lines += _histogram_lines('http_request_db_seconds', 'Time per request spent in SQLite calls.',
+                                  request_query_seconds, 'route')
+        lines += _histogram_lines('http_request_sqlite_statements', 'SQLite statements run per request.',
+                                  request_statements, 'route')
+
+        lines += ['# HELP http_responses_total Responses by route and status code.',
+                  '# TYPE http_responses_total counter']
+        for (route, status), count in sorted(responses.items()):
+            lines.append(f'http_responses_total{{route={_label(route)},status="{status}"}} {count}')
+
+        lines += ['# HELP sqlite_statements_total SQLite statements run, counted by the trace hook.',
+                  '# TYPE sqlite_statements_total counter',
+                  f'sqlite_statements_total {statements_total}']
+
+        slowest = sorted(statements.items(), key=lambda item: item[1].seconds, reverse=True)[:SLOW_STATEMENT_LIMIT]
+        for name, help_text, attribute in (
+                ('sqlite_statement_calls_total', 'Calls of the most expensive statements.', 'count'),
+                ('sqlite_statement_seconds_total', 'Time spent in the most expensive statements.', 'seconds'),
+                ('sqlite_statement_max_seconds', 'Slowest single call of the most expensive statements.', 'max_seconds'),
+                ('sqlite_statement_vm_steps_total', 'Approximate SQLite VM instructions per statement.', 'vm_steps')):
+            kind = 'gauge' if attribute == 'max_seconds' else 'counter'
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            for sql, stats in slowest:
+                value = getattr(stats, attribute)
+                value = f'{value:.6f}' if isinstance(value, float) else value
+                lines.append(f'{name}{{statement={_label(sql[:STATEMENT_LABEL_LENGTH])}}} {value}')
+
+        lines += ['# HELP n_plus_one_requests_total Requests that repeated one statement at least '
+                  f'{N_PLUS_ONE_THRESHOLD} times.',
+                  '# TYPE n_plus_one_requests_total counter']
+        for (route, sql), count in sorted(n_plus_one.items()):
+            lines.append(f'n_plus_one_requests_total{{route={_label(route)},'
+                         f'statement={_label(sql[:STATEMENT_LABEL_LENGTH])}}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def find_profile(profile_id):
+    for stored_id, route, report in profiles:
+        if stored_id == profile_id:
+            return route, report
+    return None
+
+
+def init_app(app):
+    # Registers request hooks and the /metrics routes. Call right after creating
+    # the app so the timing hook runs before every other before_request hook.
+    from flask import abort, before_render_template, g, request, template_rendered, url_for
+
+    def start():
+        profile = app.config.get('PROFILER_ENABLED') and request.args.get('profile') == '1'
+        g.metrics = begin_request(request.endpoint or 'unmatched', profile=profile)
+
+    def attach_profile(response):
+        current = g.get('metrics')
+        if current is not None:
+            profile_id = stop_profiler(current)
+            if profile_id is not None:
+                response.headers['X-Profile'] = url_for('metrics_profile', profile_id=profile_id)
+            response.headers['Server-Timing'] = (
+                f'db;dur={current.query_seconds * 1000:.1f}, render;dur={current.render_seconds * 1000:.1f}')
+            g.metrics_status = response.status_code
+        return response
+
+    def finish(exception=None):
+        end_request(g.get('metrics_status', 500))
+
+    def local_only():
+        if request.remote_addr not in LOCAL_ADDRESSES:
+            abort(404)
+
+    def metrics_view():
+        local_only()
+        return render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+    def metrics_profile(profile_id):
+        local_only()
+        found = find_profile(profile_id)
+        if found is None:
+            abort(404)
+        return found[1], 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+    app.before_request(start)
+    app.after_request(attach_profile)
+    app.teardown_request(finish)
+    before_render_template.connect(lambda sender, template, context: render_started(template), app, weak=False)
+    template_rendered.connect(lambda sender, template, context: render_finished(template), app, weak=False)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    app.add_url_rule('/metrics/profiles/<int:profile_id>', 'metrics_profile', metrics_profile)
@@ -0,0 +1,305 @@
+from datetime import datetime
+
+from crud_operations import get_db_connection
+import conflict_index
+import standings
+import team_index
+
+
+def _column_names(cur, table):
+    cur.execute(f'PRAGMA table_info({table})')
+    return {row[1] for row in cur.fetchall()}
+
+
+def _create_tables(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS tournaments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            description TEXT
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS matches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tournament_id INTEGER NOT NULL,
+            team1 TEXT NOT NULL,
+            team2 TEXT NOT NULL,
+            date TEXT,
+            time TEXT,
+            FOREIGN KEY (tournament_id) REFERENCES tournaments(id)
+        )
+    ''')
+
+
+def _add_location_column(cur):
+    # Databases created before versioning may already have the column
+    if 'location' not in _column_names(cur, 'matches'):
+        cur.execute('ALTER TABLE matches ADD COLUMN location TEXT')
+
+
+def _add_duration_column(cur):
+    if 'duration' not in _column_names(cur, 'matches'):
+        cur.execute('ALTER TABLE matches ADD COLUMN duration INTEGER DEFAULT 1')
+
+
+def _add_match_indexes(cur):
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_matches_tournament ON matches (tournament_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_matches_location_date ON matches (location, date)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_matches_team1 ON matches (team1)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_matches_team2 ON matches (team2)')
+
+
+def _add_match_version_columns(cur):
+    columns = _column_names(cur, 'matches')
+    if 'version' not in columns:
+        cur.execute('ALTER TABLE matches ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    if 'updated_at' not in columns:
+        cur.execute('ALTER TABLE matches ADD COLUMN updated_at TEXT')
+
+
+def _create_conflict_index(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS match_slots (
+            match_id INTEGER NOT NULL,
+            tournament_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            resource TEXT NOT NULL,
+            start_minute INTEGER NOT NULL,
+            end_minute INTEGER NOT NULL,
+            PRIMARY KEY (match_id, kind, resource)
+        )
+    ''')
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_match_slots_resource
+        ON match_slots (tournament_id, kind, resource, start_minute)
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS match_conflicts (
+            tournament_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            resource TEXT NOT NULL,
+            first_match_id INTEGER NOT NULL,
+            second_match_id INTEGER NOT NULL,
+            start_minute INTEGER NOT NULL,
+            minutes INTEGER NOT NULL,
+            PRIMARY KEY (kind, resource, first_match_id, second_match_id)
+        )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_match_conflicts_tournament ON match_conflicts (tournament_id, start_minute)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_match_conflicts_first ON match_conflicts (first_match_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_match_conflicts_second ON match_conflicts (second_match_id)')
+    cur.execute('SELECT id FROM tournaments')
+    for (tournament_id,) in cur.fetchall():
+        conflict_index.rebuild_tournament(cur, tournament_id)
+
+
+def _add_match_day_index(cur):
+    # Finds a tournament's matches on one day, e.g. everything a rain-out cancels
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_matches_tournament_date ON matches (tournament_id, date, time)')
+
+
+def _create_team_index(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS teams (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS match_teams (
+            match_id INTEGER NOT NULL,
+            team_id INTEGER NOT NULL,
+            tournament_id INTEGER NOT NULL,
+            start_minute INTEGER,
+            end_minute INTEGER,
+            PRIMARY KEY (match_id, team_id),
+            FOREIGN KEY (team_id) REFERENCES teams(id)
+        )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_match_teams_team ON match_teams (team_id, start_minute, match_id)')
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_match_teams_tournament
+        ON match_teams (tournament_id, team_id, start_minute, match_id)
+    ''')
+    cur.execute('SELECT id FROM tournaments')
+    for (tournament_id,) in cur.fetchall():
+        team_index.rebuild_tournament(cur, tournament_id)
+
+
+def _rebuild_standings_v9(cur, tournament_id):
+    # standings.rebuild_tournament() as it was when migration 9 shipped, frozen
+    # here because the current one reads columns later migrations add
+    cur.execute('DELETE FROM standings WHERE tournament_id = ?', (tournament_id,))
+    cur.execute('''
+        WITH sides AS (
+            SELECT team1 AS team, score1 AS scored, score2 AS conceded FROM matches
+            WHERE tournament_id = ? AND score1 IS NOT NULL
+            UNION ALL
+            SELECT team2, score2, score1 FROM matches
+            WHERE tournament_id = ? AND score1 IS NOT NULL
+        ),
+        totals AS (
+            SELECT team, COUNT(*) AS played, SUM(scored > conceded) AS wins, SUM(scored = conceded) AS draws,
+                   SUM(scored < conceded) AS losses, SUM(scored) AS score_for, SUM(conceded) AS score_against
+            FROM sides
+            GROUP BY team
+        )
+        INSERT INTO standings (tournament_id, team_id, played, wins, draws, losses,
+                               score_for, score_against, score_diff, points)
+        SELECT ?, p.team_id, COALESCE(r.played, 0), COALESCE(r.wins, 0), COALESCE(r.draws, 0),
+               COALESCE(r.losses, 0), COALESCE(r.score_for, 0), COALESCE(r.score_against, 0),
+               COALESCE(r.score_for - r.score_against, 0),
+               COALESCE(3 * r.wins + 1 * r.draws + 0 * r.losses, 0)
+        FROM (SELECT DISTINCT team_id FROM match_teams WHERE tournament_id = ?) p
+        JOIN teams t ON t.id = p.team_id
+        LEFT JOIN totals r ON r.team = t.name
+    ''', (tournament_id, tournament_id, tournament_id, tournament_id))
+
+
+def _create_standings(cur):
+    columns = _column_names(cur, 'matches')
+    for column in ('score1', 'score2'):
+        if column not in columns:
+            cur.execute(f'ALTER TABLE matches ADD COLUMN {column} INTEGER')
+    if 'result_recorded_at' not in columns:
+        cur.execute('ALTER TABLE matches ADD COLUMN result_recorded_at TEXT')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS standings (
+            tournament_id INTEGER NOT NULL,
+            team_id INTEGER NOT NULL,
+            played INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            draws INTEGER NOT NULL DEFAULT 0,
+            losses INTEGER NOT NULL DEFAULT 0,
+            score_for INTEGER NOT NULL DEFAULT 0,
+            score_against INTEGER NOT NULL DEFAULT 0,
+            score_diff INTEGER NOT NULL DEFAULT 0,
+            points INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (tournament_id, team_id),
+            FOREIGN KEY (team_id) REFERENCES teams(id)
+        )
+    ''')
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_standings_rank
+        ON standings (tournament_id, points DESC, score_diff DESC, score_for DESC, wins DESC)
+    ''')
+    cur.execute('SELECT id FROM tournaments')
+    for (tournament_id,) in cur.fetchall():
+        _rebuild_standings_v9(cur, tournament_id)
+
+
+def _add_fixture_structure(cur):
+    columns = _column_names(cur, 'matches')
+    if 'stage' not in columns:
+        cur.execute('ALTER TABLE matches ADD COLUMN stage TEXT')
+    if 'round' not in columns:
+        cur.execute('ALTER TABLE matches ADD COLUMN round INTEGER')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_matches_stage_round ON matches (tournament_id, stage, round)')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS knockout_seeds (
+            tournament_id INTEGER NOT NULL,
+            seed INTEGER NOT NULL,
+            team_id INTEGER NOT NULL,
+            PRIMARY KEY (tournament_id, seed),
+            FOREIGN KEY (team_id) REFERENCES teams(id)
+        )
+    ''')
+
+
+def _create_jobs(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            tournament_id INTEGER,
+            status TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            owner TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT
+        )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)')
+
+
+def _exclude_knockout_standings(cur):
+    # Knockout results were counted in the standings before this; rebuild
+    # every tournament's table from its league and group matches only
+    cur.execute('SELECT id FROM tournaments')
+    for (tournament_id,) in cur.fetchall():
+        standings.rebuild_tournament(cur, tournament_id)
+
+
+# Append new steps at the end; never renumber or edit an applied one.
+MIGRATIONS = [
+    (1, 'create tournaments and matches tables', _create_tables),
+    (2, 'add matches.location', _add_location_column),
+    (3, 'add matches.duration', _add_duration_column),
+    (4, 'index matches by tournament, venue/date and teams', _add_match_indexes),
+    (5, 'add matches.version and matches.updated_at for optimistic locking', _add_match_version_columns),
+    (6, 'add match_slots and match_conflicts conflict index', _create_conflict_index),
+    (7, 'index matches by tournament and day', _add_match_day_index),
+    (8, 'add teams and match_teams participation index', _create_team_index),
+    (9, 'add match results and the standings table', _create_standings),
+    (10, 'add matches.stage, matches.round and knockout_seeds', _add_fixture_structure),
+    (11, 'add the background jobs table', _create_jobs),
+    (12, 'leave knockout results out of the standings', _exclude_knockout_standings),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn=None):
+    conn = conn or get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'")
+    if cur.fetchone() is None:
+        return 0
+    cur.execute('SELECT MAX(version) FROM schema_version')
+    return cur.fetchone()[0] or 0
+
+
+def migrate(conn=None):
+    # Applies every pending migration in its own transaction and returns the
+    # versions applied. When the schema is current this is a single query.
+    conn = conn or get_db_connection()
+    if current_version(conn) >= LATEST_VERSION:
+        return []
+    applied = []
+    cur = conn.cursor()
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+    for version, description, step in MIGRATIONS:
+        # BEGIN IMMEDIATE takes the write lock before re-reading the version,
+        # so concurrent workers starting together apply each step only once
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(cur)
+            cur.execute('INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                        (version, description, datetime.now().isoformat(timespec='seconds')))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+if __name__ == '__main__':
+    versions = migrate()
+    if versions:
+        print(f'Applied migrations: {", ".join(str(v) for v in versions)}')
+    print(f'Schema is at version {current_version()}.')
@@ -0,0 +1,116 @@
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import date
+
+from conflict_index import MAX_SPAN_MINUTES
+from conflicts import DEFAULT_DURATION_HOURS, DEFAULT_SLOT_MINUTES, DEFAULT_WINDOWS, TEAM, VENUE, clock_minutes
+
+# Re-slotting moves cancelled matches into the earliest free slots without
+# touching any other fixture. Busy time per venue and per team comes from the
+# conflict index (or the in-memory schedule), so placing a match costs a few
+# bisects per candidate slot rather than a re-solve of the tournament.
+LOAD_DAYS = 7
+
+# moves: (match_id, date, time, location, duration) rows ready for
+# update_match_schedules(); unplaced: ids with no free slot before end_date.
+ReslotResult = namedtuple('ReslotResult', ['moves', 'unplaced', 'elapsed'])
+
+
+def day_start(date_str):
+    return date.fromisoformat(date_str).toordinal() * 1440
+
+
+def format_start(start):
+    day, minute = divmod(start, 1440)
+    return date.fromordinal(day).isoformat(), f'{minute // 60:02d}:{minute % 60:02d}'
+
+
+def candidate_starts(not_before, end_date, windows, slot_minutes, length):
+    # Slot starts from not_before through end_date, in order, where a match of
+    # `length` minutes still ends inside its playing window
+    windows = sorted((clock_minutes(start), clock_minutes(end)) for start, end in windows)
+    for day in range(not_before // 1440, date.fromisoformat(end_date).toordinal() + 1):
+        for window_start, window_end in windows:
+            start = day * 1440 + window_start
+            while start + length <= day * 1440 + window_end:
+                if start >= not_before:
+                    yield start
+                start += slot_minutes
+
+
+class FreeSlotIndex:
+    # Busy intervals per (kind, resource), sorted by start. A slot is free for a
+    # venue when nothing overlaps it, and for a team when nothing comes within
+    # the rest gap of it. With a loader(low, high) returning the (kind,
+    # resource, start, end) slots that start in [low, high), busy time is read
+    # LOAD_DAYS at a time from `since` as placements reach later days, so a
+    # re-slot that lands within the week never reads the rest of the season.
+    def __init__(self, rest, loader=None, since=0):
+        self.rest = rest
+        self.busy = {}
+        self.loader = loader
+        self.loaded_until = since - rest - MAX_SPAN_MINUTES
+
+    def _load(self, until):
+        high = until + LOAD_DAYS * 1440
+        # Placements all start before loaded_until, so the new rows go at the end
+        for kind, resource, start, end in sorted(self.loader(self.loaded_until, high)):
+            starts, ends = self.busy.setdefault((kind, resource), ([], []))
+            starts.append(start)
+            ends.append(end)
+        self.loaded_until = high
+
+    def add(self, kind, resource, start, end):
+        starts, ends = self.busy.setdefault((kind, resource), ([], []))
+        index = bisect_left(starts, start)
+        starts.insert(index, start)
+        ends.insert(index, end)
+
+    def is_free(self, kind, resource, start, end):
+        if self.loader is not None and end + self.rest > self.loaded_until:
+            self._load(end + self.rest)
+        entry = self.busy.get((kind, resource))
+        if not entry:
+            return True
+        starts, ends = entry
+        margin = self.rest if kind == TEAM else 0
+        first = bisect_left(starts, start - margin - MAX_SPAN_MINUTES)
+        last = bisect_left(starts, end + margin)
+        return all(ends[i] + margin <= start for i in range(first, last))
+
+
+def plan_reslot(index, matches, venues, end_date, not_before, windows=DEFAULT_WINDOWS,
+                slot_minutes=DEFAULT_SLOT_MINUTES):
+    # matches: (match_id, team1, team2, duration, venue_key) in the order they
+    # should be placed; venues: (venue_key, name) pairs. Each match takes the
+    # earliest slot where both teams are rested and a venue is free, preferring
+    # its own venue at that time. Placements are added to the index as they
+    # are made so re-slotted matches never clash with each other.
+    # Returns (moves, unplaced).
+    moves = []
+    unplaced = []
+    for match_id, team1, team2, duration, own_venue in matches:
+        duration = duration or DEFAULT_DURATION_HOURS
+        length = duration * 60
+        choices = sorted(venues, key=lambda venue: venue[0] != own_venue) or [(None, None)]
+        found = None
+        for start in candidate_starts(not_before, end_date, windows, slot_minutes, length):
+            end = start + length
+            if not (index.is_free(TEAM, team1, start, end) and index.is_free(TEAM, team2, start, end)):
+                continue
+            for key, name in choices:
+                if key is None or index.is_free(VENUE, key, start, end):
+                    found = (start, key, name)
+                    break
+            if found:
+                break
+        if found is None:
+            unplaced.append(match_id)
+            continue
+        start, key, name = found
+        if key is not None:
+            index.add(VENUE, key, start, start + length)
+        for team in {team1, team2}:
+            index.add(TEAM, team, start, start + length)
+        moves.append((match_id, *format_start(start), name, duration))
+    return moves, unplaced
@@ -0,0 +1,435 @@
+from abstraction import abstraction
+from array import array
+from bisect import bisect_left
+from conflicts import Conflict, DEFAULT_DURATION_HOURS, DEFAULT_MIN_REST_MINUTES, DEFAULT_SLOT_MINUTES, DEFAULT_WINDOWS, REST, TEAM, VENUE, format_minutes
+from datetime import date, datetime
+from fixtures import circle_rounds
+from reslot import FreeSlotIndex, day_start, plan_reslot
+from tabulate import tabulate
+import heapq
+
+# A tournament held column-wise: one typed array per field, with team names and
+# venues interned to small integer ids. A match costs about 34 bytes instead of
+# the ~1 KiB of a dict or sqlite3.Row, so a million-match tournament fits in a
+# few tens of MiB and whole-tournament scans touch only the columns they need.
+UNSCHEDULED = -1
+NO_VENUE = -1
+NO_DURATION = 0
+
+
+def _start_minute(date_str, time_str):
+    if not date_str or not time_str:
+        return UNSCHEDULED
+    hours, minutes = str(time_str).split(':')[:2]
+    return date.fromisoformat(str(date_str)).toordinal() * 1440 + int(hours) * 60 + int(minutes)
+
+
+class TournamentSchedule(abstraction):
+    def __init__(self, tournament_id=None, name=None, start_date=None, end_date=None, description=None):
+        self.tournament_id = tournament_id
+        self.name = name
+        self.start_date = start_date
+        self.end_date = end_date
+        self.description = description
+        self.teams = []
+        self.venues = []
+        self._team_ids = {}
+        self._venue_ids = {}
+        # Venue names that differ only in case or spacing share a conflict key
+        self._venue_keys = array('i')
+        self._venue_key_ids = {}
+        self.ids = array('q')
+        self.team1 = array('i')
+        self.team2 = array('i')
+        self.start = array('q')
+        self.duration = array('H')
+        self.venue = array('i')
+        self.version = array('I')
+        self._by_team = None
+
+    @classmethod
+    def from_matches(cls, matches, tournament=None):
+        # Builds a schedule from match rows or dicts, consuming them one at a time
+        schedule = cls()
+        if tournament is not None:
+            schedule.tournament_id = tournament['id']
+            schedule.name = tournament['name']
+            schedule.start_date = tournament['start_date']
+            schedule.end_date = tournament['end_date']
+            schedule.description = tournament['description']
+        for match in matches:
+            schedule.add_match(match['team1'], match['team2'], match['date'], match['time'],
+                               match['location'], match['duration'], match_id=match['id'],
+                               version=match['version'])
+        return schedule
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return (self.match(index) for index in range(len(self.ids)))
+
+    def team_id(self, name):
+        team = self._team_ids.get(name)
+        if team is None:
+            team = self._team_ids[name] = len(self.teams)
+            self.teams.append(name)
+        return team
+
+    def venue_id(self, location):
+        if not location or not location.strip():
+            return NO_VENUE
+        venue = self._venue_ids.get(location)
+        if venue is None:
+            venue = self._venue_ids[location] = len(self.venues)
+            self.venues.append(location)
+            key = location.strip().lower()
+            self._venue_keys.append(self._venue_key_ids.setdefault(key, len(self._venue_key_ids)))
+        return venue
+
+    def add_match(self, team1, team2, date_str=None, time_str=None, location=None, duration=None,
+                  match_id=None, version=0):
+        # Ids must arrive in ascending order so find() can bisect them
+        if match_id is None:
+            match_id = self.ids[-1] + 1 if self.ids else 1
+        elif self.ids and match_id <= self.ids[-1]:
+            raise ValueError(f"Match {match_id} arrived out of id order.")
+        self.ids.append(match_id)
+        self.team1.append(self.team_id(team1))
+        self.team2.append(self.team_id(team2))
+        self.start.append(_start_minute(date_str, time_str))
+        self.duration.append(int(duration) if duration else NO_DURATION)
+        self.venue.append(self.venue_id(location))
+        # Stored as read so the schedule form posts back what the database holds
+        self.version.append(version if version is not None else 0)
+        self._by_team = None
+        return len(self.ids) - 1
+
+    def set_slot(self, index, date_str, time_str, location=None, duration=None):
+        self.start[index] = _start_minute(date_str, time_str)
+        self.venue[index] = self.venue_id(location)
+        self.duration[index] = int(duration) if duration else NO_DURATION
+        self.version[index] += 1
+        self._by_team = None
+
+    def remove_match(self, index):
+        for column in (self.ids, self.team1, self.team2, self.start, self.duration, self.venue, self.version):
+            del column[index]
+        self._by_team = None
+
+    def find(self, match_id):
+        # Index of the match with this id, or None
+        index = bisect_left(self.ids, match_id)
+        if index < len(self.ids) and self.ids[index] == match_id:
+            return index
+        return None
+
+    def end(self, index):
+        return self.start[index] + (self.duration[index] or DEFAULT_DURATION_HOURS) * 60
+
+    def match(self, index):
+        # One match as a dict with the same keys as a matches row
+        start = self.start[index]
+        if start == UNSCHEDULED:
+            date_str = time_str = None
+        else:
+            day, minute = divmod(start, 1440)
+            date_str = date.fromordinal(day).isoformat()
+            time_str = f'{minute // 60:02d}:{minute % 60:02d}'
+        venue = self.venue[index]
+        return {
+            'id': self.ids[index],
+            'tournament_id': self.tournament_id,
+            'team1': self.teams[self.team1[index]],
+            'team2': self.teams[self.team2[index]],
+            'date': date_str,
+            'time': time_str,
+            'location': None if venue == NO_VENUE else self.venues[venue],
+            'duration': self.duration[index] or None,
+            'version': self.version[index],
+        }
+
+    def fixture_rows(self):
+        # (team1, team2, date, time, location, duration) tuples for insert_fixtures_bulk
+        for match in self:
+            yield (match['team1'], match['team2'], match['date'], match['time'],
+                   match['location'], match['duration'] or DEFAULT_DURATION_HOURS)
+
+    def _group(self, group_count, groups_of):
+        # Match positions grouped in CSR form: group g holds
+        # positions[offsets[g]:offsets[g + 1]], scheduled matches first in
+        # (start, end) order like the intervals find_conflicts sweeps
+        counts = array('q', bytes(8 * (group_count + 1)))
+        for index in range(len(self.ids)):
+            for group in groups_of(index):
+                counts[group + 1] += 1
+        for group in range(group_count):
+            counts[group + 1] += counts[group]
+        offsets = counts
+        fill = array('q', offsets)
+        positions = array('i', bytes(4 * offsets[-1]))
+        for index in range(len(self.ids)):
+            for group in groups_of(index):
+                positions[fill[group]] = index
+                fill[group] += 1
+        start = self.start
+        end = self.end
+        for group in range(group_count):
+            first, last = offsets[group], offsets[group + 1]
+            positions[first:last] = array('i', sorted(
+                positions[first:last], key=lambda i: (start[i] == UNSCHEDULED, start[i], end(i), i)))
+        return offsets, positions
+
+    def _team_groups(self, index):
+        team1, team2 = self.team1[index], self.team2[index]
+        return (team1,) if team1 == team2 else (team1, team2)
+
+    def _team_index(self):
+        # Built on first use and kept until the schedule changes
+        if self._by_team is None:
+            self._by_team = self._group(len(self.teams), self._team_groups)
+        return self._by_team
+
+    def team_positions(self, name):
+        team = self._team_ids.get(name)
+        if team is None:
+            return array('i')
+        offsets, positions = self._team_index()
+        return positions[offsets[team]:offsets[team + 1]]
+
+    def team_matches(self, name):
+        return [self.match(index) for index in self.team_positions(name)]
+
+    def rest_gaps(self, name):
+        # (previous, next, minutes) between a team's consecutive scheduled matches
+        scheduled = [index for index in self.team_positions(name) if self.start[index] != UNSCHEDULED]
+        return [(self.match(previous), self.match(following), self.start[following] - self.end(previous))
+                for previous, following in zip(scheduled, scheduled[1:])]
+
+    def _sweep(self, kind, offsets, positions, label_of, min_rest, report):
+        # The sweep of conflicts.find_conflicts over each group's start-ordered
+        # positions: the heap holds matches still in progress (or, with a rest
+        # requirement, finished less than min_rest ago).
+        start = self.start
+        for group in range(len(offsets) - 1):
+            first, last = offsets[group], offsets[group + 1]
+            if last - first < 2:
+                continue
+            label = label_of(group, positions[first])
+            active = []
+            for index in positions[first:last]:
+                match_start = start[index]
+                if match_start == UNSCHEDULED:
+                    break
+                while active and active[0][0] + min_rest <= match_start:
+                    heapq.heappop(active)
+                match_end = self.end(index)
+                for other_end, other in active:
+                    if other_end > match_start:
+                        report(kind, label, other, index, min(match_end, other_end) - match_start)
+                    else:
+                        report(REST, label, other, index, match_start - other_end)
+                heapq.heappush(active, (match_end, index))
+
+    def conflicts(self, min_rest_minutes=DEFAULT_MIN_REST_MINUTES):
+        # The conflicts.find_conflicts result for this schedule
+        found = []
+
+        def report(kind, key, first, second, minutes):
+            found.append((self.start[first], kind, self.ids[first], self.ids[second], key, first, second, minutes))
+
+        venue_keys = self._venue_keys
+        offsets, positions = self._group(
+            len(self._venue_key_ids),
+            lambda i: () if self.venue[i] == NO_VENUE else (venue_keys[self.venue[i]],))
+        self._sweep(VENUE, offsets, positions, lambda group, index: self.venues[self.venue[index]], 0, report)
+        offsets, positions = self._team_index()
+        self._sweep(TEAM, offsets, positions, lambda group, index: self.teams[group],
+                    max(min_rest_minutes, 0), report)
+        found.sort(key=lambda row: row[:4])
+        return [Conflict(kind, key, self.match(first), self.match(second), minutes)
+                for _, kind, _, _, key, first, second, minutes in found]
+
+    def reslot(self, positions, windows=DEFAULT_WINDOWS, min_rest_minutes=DEFAULT_MIN_REST_MINUTES,
+               slot_minutes=DEFAULT_SLOT_MINUTES):
+        # In-memory counterpart of crud_operations.reslot_matches: moves the
+        # matches at these positions to the earliest free slots after the
+        # latest one's day, leaving the rest of the schedule alone
+        moving = set(positions)
+        index = FreeSlotIndex(min_rest_minutes)
+        venues = {}
+        for position in range(len(self.ids)):
+            venue = self.venue[position]
+            if venue != NO_VENUE:
+                venues.setdefault(self._venue_keys[venue], self.venues[venue])
+            if position in moving or self.start[position] == UNSCHEDULED:
+                continue
+            start, end = self.start[position], self.end(position)
+            if venue != NO_VENUE:
+                index.add(VENUE, self._venue_keys[venue], start, end)
+            for team in self._team_groups(position):
+                index.add(TEAM, team, start, end)
+        ordered = sorted(moving, key=lambda position: (self.start[position], self.ids[position]))
+        latest = max((self.start[position] for position in ordered), default=UNSCHEDULED)
+        not_before = max((latest // 1440 + 1) * 1440 if latest != UNSCHEDULED else 0, day_start(self.start_date))
+        moves, unplaced = plan_reslot(
+            index,
+            [(self.ids[position], self.team1[position], self.team2[position], self.duration[position],
+              self._venue_keys[self.venue[position]] if self.venue[position] != NO_VENUE else None)
+             for position in ordered],
+            list(venues.items()), self.end_date, not_before, windows, slot_minutes)
+        for match_id, date_str, time_str, location, duration in moves:
+            self.set_slot(self.find(match_id), date_str, time_str, location, duration)
+        for match_id in unplaced:
+            position = self.find(match_id)
+            self.set_slot(position, None, None, self.match(position)['location'], self.duration[position])
+        return moves, unplaced
+
+    # Interactive console operations used by main.py
+
+    def create_tournment(self):
+        self.name = input("Enter tournament name: ").strip() or "Tournament"
+        while True:
+            start_date = input("Enter start date (YYYY-MM-DD): ").strip()
+            end_date = input("Enter end date (YYYY-MM-DD): ").strip()
+            try:
+                if datetime.strptime(end_date, "%Y-%m-%d") < datetime.strptime(start_date, "%Y-%m-%d"):
+                    print("End date must be on or after the start date.")
+                    continue
+                break
+            except ValueError:
+                print("Invalid date format. Please try again.")
+        self.start_date = start_date
+        self.end_date = end_date
+        self.description = input("Enter description (optional): ").strip()
+        print(f"Tournament '{self.name}' created for {start_date} to {end_date}.")
+
+    def generate_matches(self, teams=None):
+        if teams is None:
+            teams = [team.strip() for team in input("Enter team names separated by commas: ").split(',')]
+        self.__init__(self.tournament_id, self.name, self.start_date, self.end_date, self.description)
+        team_ids = [self.team_id(team) for team in dict.fromkeys(team for team in teams if team)]
+        # Pairs come round by round from the circle method, so the schedule can
+        # be filled a round at a time with nobody playing twice in a round.
+        # Each round's columns are extended at once.
+        for pairs in circle_rounds(team_ids):
+            self.team1.extend([home for home, _ in pairs])
+            self.team2.extend([away for _, away in pairs])
+        count = len(self.team1)
+        self.ids.extend(range(1, count + 1))
+        self.start.extend([UNSCHEDULED] * count)
+        self.duration.extend([NO_DURATION] * count)
+        self.venue.extend([NO_VENUE] * count)
+        self.version.extend([0] * count)
+        print("Matches generated successfully!")
+
+    def _input_slot(self, prompt):
+        # Asks until a valid date and time inside the tournament's dates is entered
+        while True:
+            date_str = input(f"Enter {prompt}match date (YYYY-MM-DD): ").strip()
+            time_str = input(f"Enter {prompt}match time (HH:MM): ").strip()
+            try:
+                match_date = datetime.strptime(date_str, "%Y-%m-%d").strftime("%Y-%m-%d")
+                datetime.strptime(time_str, "%H:%M")
+            except ValueError:
+                print("Invalid date or time format. Please try again.")
+                continue
+            if self.start_date and self.end_date and not self.start_date <= match_date <= self.end_date:
+                print(f"Date must be between {self.start_date} and {self.end_date}.")
+                continue
+            location = input("Enter venue (optional): ").strip()
+            return date_str, time_str, location
+
+    def _describe(self, index):
+        match = self.match(index)
+        return f"Match ID: {match['id']}, Teams: {match['team1']} vs {match['team2']}"
+
+    def _input_match(self, action):
+        try:
+            match_id = int(input(f"Enter the Match ID to {action}: ").strip())
+        except ValueError:
+            print("Invalid ID. Please enter a valid number.")
+            return None
+        index = self.find(match_id)
+        if index is None:
+            print("Match not found.")
+        return index
+
+    def schedule_matches(self):
+        if not len(self):
+            print("No matches available to schedule.")
+            return
+
+        print("\nLet's schedule the matches. Enter the date and time for each match.")
+        for index in range(len(self)):
+            print(f"\n{self._describe(index)}")
+            self.set_slot(index, *self._input_slot(''), duration=self.duration[index])
+        print("All matches have been scheduled successfully! 👍👍")
+
+    def view_matches(self):
+        if not len(self):
+            print("No matches scheduled.")
+            return
+        headers = ["ID", "Teams", "Date", "Time", "Venue"]
+        table = [[match["id"], f"{match['team1']} vs {match['team2']}", match["date"] or "Not Scheduled",
+                  match["time"] or "Not Scheduled", match["location"] or ""] for match in self]
+        print("\nMatch Schedule:")
+        print(tabulate(table, headers=headers, tablefmt="grid"))
+
+    def update_match(self):
+        if not len(self):
+            print("No matches to update.")
+            return
+        index = self._input_match('update')
+        if index is None:
+            return
+        match = self.match(index)
+        print(f"\nCurrent Details for {self._describe(index)}, "
+              f"Date: {match['date'] or 'Not Scheduled'}, Time: {match['time'] or 'Not Scheduled'}")
+        self.set_slot(index, *self._input_slot('new '), duration=self.duration[index])
+        print("Match updated successfully!")
+
+    def cancel_match(self):
+        if not len(self):
+            print("No matches to cancel.")
+            return
+        index = self._input_match('cancel')
+        if index is None:
+            return
+        print(f"\n{self._describe(index)}")
+        weather = input("What is the weather like? (Sunny/Rainy/Cloudy): ").strip().lower()
+        if weather == "rainy" and self.start_date and self.end_date:
+            moves, _ = self.reslot([index])
+            if moves:
+                _, date_str, time_str, location, _ = moves[0]
+                print(f"Match ID {self.ids[index]} rained out and moved to {date_str} {time_str}"
+                      f"{f' at {location}' if location else ''}. 🌧️")
+            else:
+                print(f"Match ID {self.ids[index]} rained out; no free slot before {self.end_date}, "
+                      f"so it is left unscheduled. 🌧️")
+        elif weather == "rainy":
+            match_id = self.ids[index]
+            self.remove_match(index)
+            print(f"Match ID {match_id} canceled due to rainy weather! 🌧️")
+        else:
+            print("The match can continue. No cancellation required. ☀️")
+
+    def check_conflicts(self, min_rest_minutes=DEFAULT_MIN_REST_MINUTES):
+        if not len(self):
+            print("No matches scheduled.")
+            return
+
+        conflicts = self.conflicts(min_rest_minutes)
+        if conflicts:
+            print("\nConflicts Found:")
+            for conflict in conflicts:
+                if conflict.kind == REST:
+                    print(f"\n{conflict.key} only rests {format_minutes(conflict.minutes)} between matches")
+                else:
+                    print(f"\n{conflict.kind.title()} clash ({conflict.key}) overlapping {format_minutes(conflict.minutes)}")
+                for match in (conflict.first, conflict.second):
+                    print(f"  Match ID: {match['id']}, Teams: {match['team1']} vs {match['team2']}, "
+                          f"Date: {match['date']}, Time: {match['time']}")
+        else:
+            print("No conflicts found. All matches are scheduled properly.")
+        return conflicts
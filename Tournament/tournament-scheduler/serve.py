@@ -0,0 +1,111 @@
+import argparse
+import contextlib
+import importlib.util
+import logging
+import os
+import signal
+import sys
+
+from app import app, ensure_schema
+from crud_operations import close_db_connection
+import jobs
+
+# Production entry point: python serve.py [--bind 0.0.0.0:8000] [--workers 4]
+# Runs the app in several worker processes under gunicorn when it is installed,
+# and otherwise under a small pre-forking werkzeug server (one threaded process
+# where fork is not available). The app is imported, migrated and warmed once
+# in the parent, and its SQLite connection closed, before any worker is forked.
+DEFAULT_BIND = os.environ.get('TOURNAMENT_BIND', '127.0.0.1:8000')
+DEFAULT_WORKERS = int(os.environ.get('TOURNAMENT_WORKERS', min(4, os.cpu_count() or 1)))
+
+logger = logging.getLogger(__name__)
+
+
+def warm():
+    # Work every worker would otherwise repeat on its first request
+    ensure_schema()
+    jobs.recover_jobs()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    # Other processes write to the same database, so each request checks
+    # whether this process's read cache has gone stale
+    app.config['SHARED_DATABASE'] = True
+    close_db_connection()
+    if not os.environ.get('TOURNAMENT_SECRET_KEY'):
+        logger.warning('TOURNAMENT_SECRET_KEY is not set; sessions will not survive a restart')
+
+
+def run_gunicorn(bind, workers):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', bind)
+            self.cfg.set('workers', workers)
+            # The app above is already loaded and warmed; workers inherit it
+            self.cfg.set('preload_app', True)
+
+        def load(self):
+            return app
+
+    Server().run()
+
+
+def run_prefork(bind, workers):
+    from werkzeug.serving import make_server
+
+    host, _, port = bind.rpartition(':')
+    if not hasattr(os, 'fork') or workers <= 1:
+        make_server(host, int(port), app, threaded=True).serve_forever()
+        return
+    # Every worker accepts on the socket bound here; a worker that exits is replaced
+    server = make_server(host, int(port), app)
+    children = set()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+        for pid in children:
+            with contextlib.suppress(ChildProcessError):
+                os.waitpid(pid, 0)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    logger.info('Serving on http://%s with %d workers', bind, workers)
+    while True:
+        pid, _ = os.wait()
+        if pid in children:
+            children.discard(pid)
+            spawn()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the tournament scheduler with several worker processes.')
+    parser.add_argument('--bind', default=DEFAULT_BIND, help='host:port to listen on')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    warm()
+    if importlib.util.find_spec('gunicorn'):
+        run_gunicorn(args.bind, args.workers)
+    else:
+        run_prefork(args.bind, args.workers)
+
+
+if __name__ == '__main__':
+    main()
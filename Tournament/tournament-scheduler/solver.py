@@ -0,0 +1,344 @@
+from bisect import bisect_left
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+import argparse
+import heapq
+import math
+import os
+import random
+import time
+
+from conflict_index import MAX_SPAN_MINUTES
+from conflicts import DEFAULT_DURATION_HOURS, DEFAULT_MIN_REST_MINUTES, DEFAULT_SLOT_MINUTES, DEFAULT_WINDOWS, clock_minutes, match_interval
+from fixtures import KNOCKOUT
+from crud_operations import fetch_matches_by_tournament, fetch_tournament_by_id, update_match_schedules
+from migrations import migrate
+
+DEFAULT_TIME_BUDGET_SECONDS = 10.0
+DEFAULT_MAX_ITERATIONS = 20000
+MAX_STALLS = 200
+LATEST_CANDIDATES = 8
+
+# assignments: list of (match_id, date, time, location, duration) ready for
+# update_match_schedules(); unplaced: ids that did not fit before end_date.
+SolverResult = namedtuple('SolverResult', ['assignments', 'unplaced', 'score', 'seed', 'elapsed'])
+
+
+def build_slots(start_date, end_date, windows, slot_minutes):
+    # Returns (starts, remaining): slot start times in absolute minutes, and
+    # for each slot how many consecutive slots are left in its playing window.
+    starts = []
+    remaining = []
+    for day in range(date.fromisoformat(start_date).toordinal(), date.fromisoformat(end_date).toordinal() + 1):
+        for window_start, window_end in sorted(windows):
+            first = clock_minutes(window_start)
+            count = (clock_minutes(window_end) - first) // slot_minutes
+            for k in range(count):
+                starts.append(day * 1440 + first + k * slot_minutes)
+                remaining.append(count - k)
+    return starts, remaining
+
+
+class _Schedule:
+    def __init__(self, problem):
+        self.problem = problem
+        self.slot_starts = problem['slot_starts']
+        self.venue_busy = [set() for _ in problem['venues']]
+        self.slot_load = [0] * len(self.slot_starts)
+        self.team_starts = {}
+        self.team_ends = {}
+        self.placement = {}
+        # Every slot before first_open is already full at all venues
+        self.first_open = 0
+        for venue, team1, team2, start, end in problem['fixed']:
+            if venue is not None:
+                for slot in self._slots_overlapping(start, end):
+                    self._occupy_slot(venue, slot)
+            self._add_team_interval(team1, start, end)
+            self._add_team_interval(team2, start, end)
+
+    def _slots_overlapping(self, start, end):
+        starts = self.slot_starts
+        step = self.problem['slot_minutes']
+        first = bisect_left(starts, start - step + 1)
+        last = bisect_left(starts, end)
+        return range(first, last)
+
+    def _occupy_slot(self, venue, slot):
+        if slot not in self.venue_busy[venue]:
+            self.venue_busy[venue].add(slot)
+            self.slot_load[slot] += 1
+            venue_count = len(self.venue_busy)
+            while self.first_open < len(self.slot_load) and self.slot_load[self.first_open] >= venue_count:
+                self.first_open += 1
+
+    def _release_slot(self, venue, slot):
+        self.venue_busy[venue].discard(slot)
+        self.slot_load[slot] -= 1
+        self.first_open = min(self.first_open, slot)
+
+    def _add_team_interval(self, team, start, end):
+        starts = self.team_starts.setdefault(team, [])
+        index = bisect_left(starts, start)
+        starts.insert(index, start)
+        self.team_ends.setdefault(team, []).insert(index, end)
+
+    def _remove_team_interval(self, team, start):
+        starts = self.team_starts[team]
+        index = bisect_left(starts, start)
+        del starts[index]
+        del self.team_ends[team][index]
+
+    def _team_free(self, team, start, end):
+        # Already scheduled matches may overlap one another, so every interval
+        # that can reach within the rest gap is checked, not just the nearest
+        rest = self.problem['min_rest']
+        starts = self.team_starts.get(team)
+        if not starts:
+            return True
+        ends = self.team_ends[team]
+        first = bisect_left(starts, start - rest - MAX_SPAN_MINUTES)
+        last = bisect_left(starts, end + rest)
+        return all(ends[i] + rest <= start for i in range(first, last))
+
+    def earliest_slot(self, match, before=None):
+        match_id, team1, team2, length = match
+        limit = len(self.slot_starts) if before is None else before
+        venue_count = len(self.venue_busy)
+        remaining = self.problem['slot_remaining']
+        step = self.problem['slot_minutes']
+        first = max(self.first_open, self.problem['first_slot'], self.problem['not_before'].get(match_id, 0))
+        for slot in range(first, limit):
+            if remaining[slot] < length or self.slot_load[slot] >= venue_count:
+                continue
+            start = self.slot_starts[slot]
+            end = start + length * step
+            if not (self._team_free(team1, start, end) and self._team_free(team2, start, end)):
+                continue
+            for venue, busy in enumerate(self.venue_busy):
+                if all(s not in busy for s in range(slot, slot + length)):
+                    return slot, venue
+        return None
+
+    def place(self, match, slot, venue):
+        match_id, team1, team2, length = match
+        for s in range(slot, slot + length):
+            self._occupy_slot(venue, s)
+        start = self.slot_starts[slot]
+        end = start + length * self.problem['slot_minutes']
+        self._add_team_interval(team1, start, end)
+        self._add_team_interval(team2, start, end)
+        self.placement[match_id] = (slot, venue)
+
+    def remove(self, match):
+        match_id, team1, team2, length = match
+        slot, venue = self.placement.pop(match_id)
+        for s in range(slot, slot + length):
+            self._release_slot(venue, s)
+        start = self.slot_starts[slot]
+        self._remove_team_interval(team1, start)
+        self._remove_team_interval(team2, start)
+        return slot, venue
+
+    def end_slot(self, match_id):
+        return self.placement[match_id][0] + self.problem['lengths'][match_id]
+
+    def score(self):
+        # Fewer unplaced matches first, then an earlier finish, then earlier starts overall
+        ends = [self.end_slot(match_id) for match_id in self.placement]
+        return len(self.problem['matches']) - len(ends), max(ends, default=0), sum(ends)
+
+
+def _solve_restart(problem, seed, time_budget, max_iterations):
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    matches = list(problem['matches'])
+    # The base seed keeps the natural order so a single restart is still sensible
+    if seed != problem['base_seed']:
+        rng.shuffle(matches)
+    # Rounds are built in order, knockout rounds after every other stage, so
+    # the schedule keeps the fixtures' round structure; within a round longer
+    # matches are harder to fit, so they go first
+    rounds = problem['rounds']
+    matches.sort(key=lambda match: (rounds.get(match[0], (False, 0)), -match[3]))
+
+    schedule = _Schedule(problem)
+    unplaced = []
+    for match in matches:
+        found = schedule.earliest_slot(match)
+        if found is None:
+            unplaced.append(match)
+        else:
+            schedule.place(match, *found)
+
+    # Local search: pull the matches that finish last into earlier gaps and
+    # retry anything left unplaced. Stops after MAX_STALLS failed moves, the
+    # iteration cap or the time budget, whichever comes first.
+    by_id = {match[0]: match for match in matches}
+    stalls = 0
+    for _ in range(max_iterations):
+        if stalls >= MAX_STALLS or time.perf_counter() - started > time_budget:
+            break
+        if unplaced:
+            found = schedule.earliest_slot(unplaced[-1])
+            if found is not None:
+                schedule.place(unplaced.pop(), *found)
+                stalls = 0
+                continue
+        if not schedule.placement:
+            break
+        latest = heapq.nlargest(LATEST_CANDIDATES, schedule.placement, key=schedule.end_slot)
+        match = by_id[rng.choice(latest)]
+        slot, venue = schedule.remove(match)
+        found = schedule.earliest_slot(match, before=slot)
+        if found is None:
+            schedule.place(match, slot, venue)
+            stalls += 1
+        else:
+            schedule.place(match, *found)
+            stalls = 0
+
+    return schedule.score(), seed, schedule.placement
+
+
+def build_problem(tournament, matches, venues, windows=DEFAULT_WINDOWS, min_rest_minutes=DEFAULT_MIN_REST_MINUTES,
+                  slot_minutes=DEFAULT_SLOT_MINUTES, seed=0, now=None):
+    # now: absolute minute before which nothing is placed, so re-solving a
+    # running tournament never fills slots that have already started
+    slot_starts, slot_remaining = build_slots(tournament['start_date'], tournament['end_date'], windows, slot_minutes)
+    if now is None:
+        now = datetime.now()
+        now = now.toordinal() * 1440 + now.hour * 60 + now.minute
+    venue_index = {venue.strip().lower(): i for i, venue in enumerate(venues)}
+    pending = []
+    durations = {}
+    fixed = []
+    rounds = {}
+    knockout_rounds = {}
+    # Latest end of the scheduled matches a knockout round must follow: every
+    # earlier stage, and each earlier knockout round
+    stages_end = 0
+    knockout_ends = {}
+    for match in matches:
+        interval = match_interval(match)
+        knockout = match['stage'] == KNOCKOUT
+        if interval is None:
+            length = math.ceil((match['duration'] or DEFAULT_DURATION_HOURS) * 60 / slot_minutes)
+            pending.append((match['id'], match['team1'], match['team2'], length))
+            # Slots only pack the match; its saved duration is written back as it was
+            durations[match['id']] = match['duration']
+            rounds[match['id']] = (knockout, match['round'] or 0)
+            if knockout:
+                knockout_rounds[match['id']] = match['round'] or 0
+        else:
+            venue = venue_index.get((match['location'] or '').strip().lower())
+            fixed.append((venue, match['team1'], match['team2'], interval[0], interval[1]))
+            if knockout:
+                knockout_ends[match['round'] or 0] = max(knockout_ends.get(match['round'] or 0, 0), interval[1])
+            else:
+                stages_end = max(stages_end, interval[1])
+    not_before = {}
+    for match_id, round_number in knockout_rounds.items():
+        end = max([stages_end] + [end for number, end in knockout_ends.items() if number < round_number])
+        not_before[match_id] = bisect_left(slot_starts, end)
+    return {
+        'matches': pending,
+        'lengths': {match[0]: match[3] for match in pending},
+        'durations': durations,
+        'rounds': rounds,
+        'not_before': not_before,
+        'first_slot': bisect_left(slot_starts, now),
+        'fixed': fixed,
+        'venues': list(venues),
+        'slot_starts': slot_starts,
+        'slot_remaining': slot_remaining,
+        'slot_minutes': slot_minutes,
+        'min_rest': min_rest_minutes,
+        'base_seed': seed,
+    }
+
+
+def solve(problem, restarts=None, workers=None, time_budget=DEFAULT_TIME_BUDGET_SECONDS,
+          max_iterations=DEFAULT_MAX_ITERATIONS):
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    restarts = restarts or workers
+    seeds = [problem['base_seed'] + i for i in range(restarts)]
+    if not problem['matches'] or not problem['venues'] or not problem['slot_starts']:
+        return SolverResult([], [match[0] for match in problem['matches']], None, problem['base_seed'], 0.0)
+
+    if workers == 1 or restarts == 1:
+        results = [_solve_restart(problem, seed, time_budget, max_iterations) for seed in seeds]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, restarts)) as pool:
+            results = list(pool.map(_solve_restart, [problem] * restarts, seeds,
+                                    [time_budget] * restarts, [max_iterations] * restarts))
+
+    # Ties go to the lowest seed so the same inputs give the same schedule
+    score, seed, placement = min(results, key=lambda result: (result[0], result[1]))
+    assignments = []
+    for match_id, _, _, _ in problem['matches']:
+        if match_id not in placement:
+            continue
+        slot, venue = placement[match_id]
+        start = problem['slot_starts'][slot]
+        day, minute = divmod(start, 1440)
+        assignments.append((match_id, date.fromordinal(day).isoformat(), f'{minute // 60:02d}:{minute % 60:02d}',
+                            problem['venues'][venue], problem['durations'][match_id]))
+    unplaced = [match[0] for match in problem['matches'] if match[0] not in placement]
+    return SolverResult(assignments, unplaced, score, seed, time.perf_counter() - started)
+
+
+def schedule_tournament(tournament_id, venues, windows=DEFAULT_WINDOWS, min_rest_minutes=DEFAULT_MIN_REST_MINUTES,
+                        slot_minutes=DEFAULT_SLOT_MINUTES, restarts=None, workers=None,
+                        time_budget=DEFAULT_TIME_BUDGET_SECONDS, seed=0):
+    # Fills in every unscheduled match of the tournament and saves the result
+    tournament = fetch_tournament_by_id(tournament_id)
+    matches = fetch_matches_by_tournament(tournament_id)
+    problem = build_problem(tournament, matches, venues, windows, min_rest_minutes, slot_minutes, seed)
+    result = solve(problem, restarts=restarts, workers=workers, time_budget=time_budget)
+    if result.assignments:
+        update_match_schedules(tournament_id, result.assignments)
+    return result
+
+
+def parse_windows(text):
+    # "09:00-12:00, 14:00-20:00" -> (('09:00', '12:00'), ('14:00', '20:00'))
+    windows = []
+    for part in text.split(','):
+        if part.strip():
+            start, end = part.split('-')
+            if clock_minutes(end.strip()) <= clock_minutes(start.strip()):
+                raise ValueError(f'Playing window {part.strip()} ends before it starts.')
+            windows.append((start.strip(), end.strip()))
+    return tuple(windows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Assign dates, times and venues to unscheduled matches.')
+    parser.add_argument('tournament_id', type=int)
+    parser.add_argument('--venues', required=True, help='comma-separated venue names')
+    parser.add_argument('--windows', default='09:00-21:00', help='daily playing windows, e.g. 09:00-12:00,14:00-20:00')
+    parser.add_argument('--min-rest', type=int, default=DEFAULT_MIN_REST_MINUTES, help='minimum rest per team in minutes')
+    parser.add_argument('--slot-minutes', type=int, default=DEFAULT_SLOT_MINUTES)
+    parser.add_argument('--restarts', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--time-budget', type=float, default=DEFAULT_TIME_BUDGET_SECONDS)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    migrate()
+    result = schedule_tournament(
+        args.tournament_id,
+        [venue.strip() for venue in args.venues.split(',') if venue.strip()],
+        windows=parse_windows(args.windows),
+        min_rest_minutes=args.min_rest,
+        slot_minutes=args.slot_minutes,
+        restarts=args.restarts,
+        workers=args.workers,
+        time_budget=args.time_budget,
+        seed=args.seed,
+    )
+    print(f'Scheduled {len(result.assignments)} matches in {result.elapsed:.2f}s (seed {result.seed}).')
+    if result.unplaced:
+        print(f'{len(result.unplaced)} matches did not fit before the tournament end date: {result.unplaced}')
@@ -0,0 +1,122 @@
+from conflict_index import chunks
+from fixtures import GROUP_PREFIX, LEAGUE
+
+# standings holds one row per team per tournament: played, won, drawn and lost
+# counts, scores for and against, score difference and points. Recording,
+# changing or clearing a result applies the difference to the two teams' rows
+# in the same transaction as the match update, so a leaderboard is one read of
+# idx_standings_rank rather than a pass over every result. rebuild_tournament()
+# recomputes the rows from matches and compare_with_rebuild() checks them.
+# Only league and group-stage results are counted; knockout matches decide who
+# goes through rather than points.
+POINTS_FOR_WIN = 3
+POINTS_FOR_DRAW = 1
+POINTS_FOR_LOSS = 0
+COLUMNS = ('played', 'wins', 'draws', 'losses', 'score_for', 'score_against', 'score_diff', 'points')
+# Ties on points are broken by score difference, then scores for, then wins;
+# the name only fixes the order of teams level on all four
+RANK_ORDER = 's.points DESC, s.score_diff DESC, s.score_for DESC, s.wins DESC, t.name COLLATE NOCASE'
+# Matches created before stages were recorded have none and are league games
+COUNTED_STAGES = "(stage IS NULL OR stage = ? OR stage LIKE ? || '%')"
+
+
+def counts(stage):
+    return stage is None or stage == LEAGUE or stage.startswith(GROUP_PREFIX)
+
+
+def _line(score, other):
+    # What one result adds to a team's row, in COLUMNS order
+    win, draw, loss = score > other, score == other, score < other
+    points = POINTS_FOR_WIN * win + POINTS_FOR_DRAW * draw + POINTS_FOR_LOSS * loss
+    return (1, int(win), int(draw), int(loss), score, other, score - other, points)
+
+
+def result_deltas(old, new):
+    # Changes to (team1, team2) rows when a match's result goes from old to
+    # new; each is (score1, score2) or None for no result
+    deltas = []
+    for side in (0, 1):
+        delta = [0] * len(COLUMNS)
+        for scores, sign in ((old, -1), (new, 1)):
+            if scores is not None:
+                for i, value in enumerate(_line(scores[side], scores[1 - side])):
+                    delta[i] += sign * value
+        deltas.append(delta)
+    return deltas
+
+
+def apply_result(cur, tournament_id, team_ids, old, new):
+    # team_ids: (team1_id, team2_id) from the teams table
+    names = ', '.join(COLUMNS)
+    updates = ', '.join(f'{column} = {column} + excluded.{column}' for column in COLUMNS)
+    for team_id, delta in zip(team_ids, result_deltas(old, new)):
+        if not any(delta):
+            continue
+        cur.execute(f'''
+            INSERT INTO standings (tournament_id, team_id, {names})
+            VALUES (?, ?, {', '.join('?' * len(COLUMNS))})
+            ON CONFLICT (tournament_id, team_id) DO UPDATE SET {updates}
+        ''', [tournament_id, team_id] + delta)
+
+
+def add_teams(cur, match_ids):
+    # Gives every team in the given matches a row, so teams yet to play are listed
+    for chunk in chunks(match_ids):
+        cur.execute(f'''
+            INSERT OR IGNORE INTO standings (tournament_id, team_id)
+            SELECT DISTINCT tournament_id, team_id FROM match_teams WHERE match_id IN ({','.join('?' * len(chunk))})
+        ''', chunk)
+
+
+def remove_tournament(cur, tournament_id):
+    cur.execute('DELETE FROM standings WHERE tournament_id = ?', (tournament_id,))
+
+
+def rebuild_tournament(cur, tournament_id):
+    remove_tournament(cur, tournament_id)
+    cur.execute(f'''
+        WITH sides AS (
+            SELECT team1 AS team, score1 AS scored, score2 AS conceded FROM matches
+            WHERE tournament_id = ? AND score1 IS NOT NULL AND {COUNTED_STAGES}
+            UNION ALL
+            SELECT team2, score2, score1 FROM matches
+            WHERE tournament_id = ? AND score1 IS NOT NULL AND {COUNTED_STAGES}
+        ),
+        totals AS (
+            SELECT team, COUNT(*) AS played, SUM(scored > conceded) AS wins, SUM(scored = conceded) AS draws,
+                   SUM(scored < conceded) AS losses, SUM(scored) AS score_for, SUM(conceded) AS score_against
+            FROM sides
+            GROUP BY team
+        )
+        INSERT INTO standings (tournament_id, team_id, played, wins, draws, losses,
+                               score_for, score_against, score_diff, points)
+        SELECT ?, p.team_id, COALESCE(r.played, 0), COALESCE(r.wins, 0), COALESCE(r.draws, 0),
+               COALESCE(r.losses, 0), COALESCE(r.score_for, 0), COALESCE(r.score_against, 0),
+               COALESCE(r.score_for - r.score_against, 0),
+               COALESCE(? * r.wins + ? * r.draws + ? * r.losses, 0)
+        FROM (SELECT DISTINCT team_id FROM match_teams WHERE tournament_id = ?) p
+        JOIN teams t ON t.id = p.team_id
+        LEFT JOIN totals r ON r.team = t.name
+    ''', (tournament_id, LEAGUE, GROUP_PREFIX, tournament_id, LEAGUE, GROUP_PREFIX, tournament_id,
+          POINTS_FOR_WIN, POINTS_FOR_DRAW, POINTS_FOR_LOSS, tournament_id))
+
+
+def standing_rows(cur, tournament_id):
+    cur.execute(f'SELECT team_id, {", ".join(COLUMNS)} FROM standings WHERE tournament_id = ?', (tournament_id,))
+    return [tuple(row) for row in cur.fetchall()]
+
+
+def compare_with_rebuild(conn, tournament_id):
+    # Rebuilds the tournament's standings inside a savepoint, rolls it back and
+    # returns (missing, unexpected): rows a full rebuild produces that are not
+    # stored, and stored rows it would not produce
+    cur = conn.cursor()
+    stored = set(standing_rows(cur, tournament_id))
+    cur.execute('SAVEPOINT standings_verify')
+    try:
+        rebuild_tournament(cur, tournament_id)
+        expected = set(standing_rows(cur, tournament_id))
+    finally:
+        cur.execute('ROLLBACK TO standings_verify')
+        cur.execute('RELEASE standings_verify')
+    return sorted(expected - stored), sorted(stored - expected)
@@ -0,0 +1,40 @@
+from conflict_index import chunks
+from conflicts import TEAM
+
+# Teams are stored once by name in `teams`, shared by every tournament, and
+# match_teams holds one row per team per match with the match's start and end
+# minute (NULL while unscheduled). A team's fixtures, next match and rest gaps
+# are then range reads on (team_id, start_minute) instead of scans of
+# matches.team1/team2. Times come from the conflict index's team slots, so
+# writes call index_matches() after conflict_index.reindex_matches(), in the
+# same transaction.
+
+
+def index_matches(cur, match_ids):
+    # Refreshes participation rows for the given matches from their current rows
+    for chunk in chunks(match_ids):
+        marks = ','.join('?' * len(chunk))
+        cur.execute(f'DELETE FROM match_teams WHERE match_id IN ({marks})', chunk)
+        cur.execute(f'''
+            INSERT OR IGNORE INTO teams (name)
+            SELECT team1 FROM matches WHERE id IN ({marks})
+            UNION SELECT team2 FROM matches WHERE id IN ({marks})
+        ''', chunk + chunk)
+        cur.execute(f'''
+            INSERT OR IGNORE INTO match_teams (match_id, team_id, tournament_id, start_minute, end_minute)
+            SELECT m.id, t.id, m.tournament_id, s.start_minute, s.end_minute
+            FROM matches m
+            JOIN teams t ON t.name IN (m.team1, m.team2)
+            LEFT JOIN match_slots s ON s.match_id = m.id AND s.kind = ? AND s.resource = t.name
+            WHERE m.id IN ({marks})
+        ''', [TEAM] + chunk)
+
+
+def remove_tournament(cur, tournament_id):
+    cur.execute('DELETE FROM match_teams WHERE tournament_id = ?', (tournament_id,))
+
+
+def rebuild_tournament(cur, tournament_id):
+    remove_tournament(cur, tournament_id)
+    cur.execute('SELECT id FROM matches WHERE tournament_id = ?', (tournament_id,))
+    index_matches(cur, [row[0] for row in cur.fetchall()])
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import tournament_cache
+import crud_operations
+from migrations import migrate
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # Points the app at an empty database file for one test
+    monkeypatch.setattr(crud_operations, 'DB_PATH', str(tmp_path / 'tournament_scheduler.db'))
+    tournament_cache.clear()
+    yield crud_operations.get_db_connection()
+    crud_operations.close_db_connection()
+    tournament_cache.clear()
+
+
+@pytest.fixture
+def client(database, monkeypatch):
+    # A test client with a tournament of three teams selected in its session
+    from app import app
+
+    migrate()
+    monkeypatch.setitem(app.config, 'BACKGROUND_MIN_MATCHES', None)
+    client = app.test_client()
+    client.post('/create_tournament', data={'tournament_name': 'Cup', 'start_date': '2030-01-01',
+                                            'end_date': '2030-01-31', 'description': ''})
+    client.post('/generate', data={'teams': 'A,B,C'})
+    return client
@@ -0,0 +1,29 @@
+import pytest
+
+
+@pytest.mark.parametrize('body', [[1], {'matches': {}}, {'matches': [1]}, {'matches': 'all'}, 'matches'])
+def test_schedule_patch_rejects_malformed_bodies(client, body):
+    response = client.patch('/api/schedule', json=body)
+    assert response.status_code == 400
+
+
+def test_schedule_patch_updates_listed_matches(client):
+    response = client.patch('/api/schedule', json={'matches': [
+        {'id': 1, 'date': '2030-01-02', 'time': '10:00', 'duration': 1, 'version': 0},
+    ]})
+    assert response.status_code == 200
+    assert response.json == {'updated': 1}
+
+
+@pytest.mark.parametrize('version', ['0', 0.0, True, [0]])
+def test_result_put_rejects_non_integer_versions(client, version):
+    response = client.put('/api/matches/1/result', json={'score1': 2, 'score2': 1, 'version': version})
+    assert response.status_code == 400
+
+
+def test_result_put_checks_integer_versions(client):
+    assert client.put('/api/matches/1/result', json={'score1': 2, 'score2': 1, 'version': 0}).status_code == 200
+    response = client.put('/api/matches/1/result', json={'score1': 3, 'score2': 1, 'version': 0})
+    assert response.status_code == 409
+    assert response.json['current']['version'] == 1
+    assert client.put('/api/matches/1/result', json={'score1': 3, 'score2': 1, 'version': None}).status_code == 200
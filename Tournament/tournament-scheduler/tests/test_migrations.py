@@ -0,0 +1,55 @@
+import crud_operations
+from fixtures import KNOCKOUT
+import migrations
+import team_index
+
+
+def migrate_to(version, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(migrations, 'MIGRATIONS', [step for step in migrations.MIGRATIONS if step[0] <= version])
+        patch.setattr(migrations, 'LATEST_VERSION', version)
+        return migrations.migrate()
+
+
+def add_tournament(conn, matches):
+    # matches: (team1, team2) pairs, inserted with only the columns every
+    # schema version has
+    cur = conn.cursor()
+    cur.execute("INSERT INTO tournaments (name, start_date, end_date) VALUES ('Cup', '2030-01-01', '2030-01-31')")
+    tournament_id = cur.lastrowid
+    for team1, team2 in matches:
+        cur.execute('INSERT INTO matches (tournament_id, team1, team2) VALUES (?, ?, ?)', (tournament_id, team1, team2))
+    team_index.rebuild_tournament(cur, tournament_id)
+    conn.commit()
+    return tournament_id
+
+
+def test_upgrade_from_version_8(database, monkeypatch):
+    assert migrate_to(8, monkeypatch) == [1, 2, 3, 4, 5, 6, 7, 8]
+    tournament_id = add_tournament(database, [('A', 'B'), ('A', 'C'), ('B', 'C')])
+
+    assert migrations.migrate() == [9, 10, 11, 12]
+    assert migrations.current_version() == migrations.LATEST_VERSION
+    table = crud_operations.fetch_standings(tournament_id)
+    assert sorted(row['name'] for row in table) == ['A', 'B', 'C']
+    assert all(row['played'] == 0 for row in table)
+    assert crud_operations.verify_standings(tournament_id) == ([], [])
+
+
+def test_upgrade_drops_knockout_results_from_standings(database, monkeypatch):
+    migrate_to(11, monkeypatch)
+    tournament_id = add_tournament(database, [('A', 'B'), ('A', 'B')])
+    _, final = [row[0] for row in database.execute('SELECT id FROM matches ORDER BY id')]
+    database.execute('UPDATE matches SET stage = ?, round = 1 WHERE id = ?', (KNOCKOUT, final))
+    database.execute('UPDATE matches SET score1 = 2, score2 = 1 WHERE tournament_id = ?', (tournament_id,))
+    # Standings as they were kept before knockout results were left out
+    migrations._rebuild_standings_v9(database.cursor(), tournament_id)
+    database.commit()
+    assert {row['name']: row['played'] for row in crud_operations.fetch_standings(tournament_id)} == {'A': 2, 'B': 2}
+
+    assert migrations.migrate() == [12]
+    crud_operations.tournament_cache.clear()
+    table = {row['name']: row for row in crud_operations.fetch_standings(tournament_id)}
+    assert table['A']['played'] == 1 and table['A']['points'] == 3
+    assert table['B']['played'] == 1 and table['B']['points'] == 0
+    assert crud_operations.verify_standings(tournament_id) == ([], [])
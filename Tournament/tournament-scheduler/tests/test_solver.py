@@ -0,0 +1,44 @@
+import time
+from datetime import date
+
+import jobs
+from solver import build_problem, solve
+
+TOURNAMENT = {'start_date': '2030-01-01', 'end_date': '2030-01-01'}
+DAY = date(2030, 1, 1).toordinal() * 1440
+
+
+def match(match_id, team1, team2, time=None, duration=1):
+    return {'id': match_id, 'team1': team1, 'team2': team2, 'date': '2030-01-01' if time else None,
+            'time': time, 'location': 'Old Ground' if time else None, 'duration': duration,
+            'stage': None, 'round': None}
+
+
+def test_team_is_busy_for_every_overlapping_booking():
+    # A's two bookings overlap; the later, shorter one ends at 11:00 while the
+    # first runs to 13:00, so nothing for A fits before 13:00
+    matches = [match(1, 'A', 'X', '09:00', 4), match(2, 'A', 'Y', '10:00', 1), match(3, 'A', 'B')]
+    problem = build_problem(TOURNAMENT, matches, ['Main'], min_rest_minutes=0, now=0)
+    result = solve(problem, restarts=1, workers=1, time_budget=1)
+    assert [assignment[:3] for assignment in result.assignments] == [(3, '2030-01-01', '13:00')]
+
+
+def test_slots_that_have_started_are_skipped():
+    matches = [match(1, 'A', 'B'), match(2, 'C', 'D')]
+    problem = build_problem(TOURNAMENT, matches, ['Main'], min_rest_minutes=0, now=DAY + 15 * 60 + 30)
+    result = solve(problem, restarts=1, workers=1, time_budget=1)
+    assert sorted(assignment[2] for assignment in result.assignments) == ['16:00', '17:00']
+
+
+def test_large_solves_run_as_jobs(client, monkeypatch):
+    monkeypatch.setitem(client.application.config, 'BACKGROUND_MIN_MATCHES', 1)
+    response = client.post('/schedule/auto', data={'venues': 'Main', 'windows': '09:00-21:00',
+                                                   'min_rest': '0', 'time_budget': '1'})
+    assert response.status_code == 302
+    job_id = int(response.location.rsplit('/', 1)[1])
+    deadline = time.monotonic() + 30
+    while jobs.fetch_job(job_id)['status'] not in (jobs.DONE, jobs.FAILED) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    job = jobs.fetch_job(job_id)
+    assert job['status'] == jobs.DONE and job['result'] == {'scheduled': 3, 'unplaced': 0}
+    assert client.get(f'/jobs/{job_id}').location.endswith('/view')
@@ -0,0 +1,24 @@
+import pytest
+
+from crud_operations import ScheduleValidationError
+from transfer import iter_fixtures
+
+TOURNAMENT = {'start_date': '2030-01-01', 'end_date': '2030-01-31'}
+
+
+def test_unscheduled_fixture_durations_are_range_checked():
+    records = enumerate([
+        {'team1': 'X', 'team2': 'Y', 'duration': '-3'},
+        {'team1': 'X', 'team2': 'Z', 'duration': '70000'},
+        {'team1': 'Y', 'team2': 'Z', 'duration': 'long'},
+        {'team1': 'A', 'team2': 'B', 'duration': ''},
+    ], start=2)
+    with pytest.raises(ScheduleValidationError) as error:
+        list(iter_fixtures(records, TOURNAMENT))
+    assert [row for row, _ in error.value.errors] == [2, 3, 4]
+    assert 'between 1 and 10 hours' in error.value.errors[0][1]
+
+
+def test_unscheduled_fixture_defaults_to_one_hour():
+    rows = list(iter_fixtures([(2, {'team1': 'A', 'team2': 'B', 'location': 'Court 1'})], TOURNAMENT))
+    assert rows == [('A', 'B', None, None, 'Court 1', 1)]
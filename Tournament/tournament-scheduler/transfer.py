@@ -0,0 +1,254 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime, timezone
+
+from crud_operations import ScheduleValidationError, validate_duration, validate_schedule_change
+
+IMPORT_FORMATS = ('csv', 'json', 'jsonl')
+# Exceptions that mean the uploaded file itself is malformed
+IMPORT_ERRORS = (ValueError, csv.Error)
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'ics': 'text/calendar',
+}
+EXPORT_FIELDS = ('id', 'team1', 'team2', 'date', 'time', 'location', 'duration')
+READ_CHUNK_SIZE = 64 * 1024
+# Rows joined into each chunk of a streamed export
+EXPORT_CHUNK_ROWS = 200
+# An import keeps validating after the first bad row but reports at most this many
+MAX_IMPORT_ERRORS = 50
+ICS_LINE_OCTETS = 75
+
+
+def detect_format(filename=None, content_type=None):
+    # Picks an import format from the file extension, then the content type
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension == 'ndjson':
+        extension = 'jsonl'
+    if extension in IMPORT_FORMATS:
+        return extension
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/jsonl', 'application/json-lines'):
+        return 'jsonl'
+    if content_type == 'application/json':
+        return 'json'
+    return None
+
+
+def text_stream(binary):
+    # utf-8-sig drops the BOM spreadsheet tools put in front of CSV exports
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+def iter_json_records(stream, chunk_size=READ_CHUNK_SIZE):
+    # Yields (number, value) for each element of a top-level JSON array, or for
+    # each value of a JSON Lines stream, decoding one value at a time
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    started = False
+    number = 0
+    while True:
+        buffer = buffer.lstrip()
+        if buffer and not started:
+            started = True
+            if buffer[0] == '[':
+                buffer = buffer[1:]
+            continue
+        if buffer[:1] in (',', ']'):
+            buffer = buffer[1:]
+            continue
+        if buffer:
+            try:
+                value, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A value ending exactly at the buffer edge may be a cut-off number
+                if end < len(buffer) or eof:
+                    number += 1
+                    yield number, value
+                    buffer = buffer[end:]
+                    continue
+        if eof:
+            return
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def iter_csv_records(stream):
+    # Yields (line_number, row) with lower-cased header names
+    reader = csv.DictReader(stream)
+    if reader.fieldnames is None:
+        return
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    for row in reader:
+        yield reader.line_num, row
+
+
+def iter_records(stream, fmt):
+    if fmt == 'csv':
+        return iter_csv_records(stream)
+    return iter_json_records(stream)
+
+
+def parse_teams(stream, fmt):
+    # Team names in file order without duplicates. CSV takes the first column
+    # (skipping a "team" or "name" header); JSON takes strings or objects with
+    # a "team" or "name" key.
+    if fmt == 'csv':
+        records = ((line, row[0] if row else '') for line, row in enumerate(csv.reader(stream), 1))
+    else:
+        records = iter_json_records(stream)
+    teams = {}
+    for number, record in records:
+        if isinstance(record, dict):
+            record = record.get('team') or record.get('name') or ''
+        name = str(record).strip()
+        if number == 1 and fmt == 'csv' and name.lower() in ('team', 'name'):
+            continue
+        if name:
+            teams.setdefault(name, None)
+    return list(teams)
+
+
+def _clean(value):
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def iter_fixtures(records, tournament):
+    # Validates fixture records and yields (team1, team2, date, time, location,
+    # duration) rows. Bad rows are skipped and, once the input is exhausted,
+    # reported together in a ScheduleValidationError so the caller's
+    # transaction rolls back.
+    start_date = datetime.strptime(tournament['start_date'], "%Y-%m-%d").date()
+    end_date = datetime.strptime(tournament['end_date'], "%Y-%m-%d").date()
+    errors = []
+    error_count = 0
+    for number, record in records:
+        try:
+            if not isinstance(record, dict):
+                raise ValueError(f"Row {number}: Expected an object with team1 and team2.")
+            team1 = _clean(record.get('team1'))
+            team2 = _clean(record.get('team2'))
+            if not team1 or not team2:
+                raise ValueError(f"Row {number}: Both team1 and team2 are required.")
+            if team1 == team2:
+                raise ValueError(f"Row {number}: A team cannot play itself.")
+            fields = {key: _clean(record.get(key)) for key in ('date', 'time', 'location', 'duration')}
+            if fields['date'] or fields['time']:
+                fields['duration'] = fields['duration'] or '1'
+                _, date_str, time_str, location, duration = validate_schedule_change(
+                    f'on row {number}', fields, start_date, end_date)
+            else:
+                date_str = time_str = None
+                location = fields['location']
+                duration = validate_duration(f'on row {number}', fields['duration'] or 1)
+        except ValueError as e:
+            error_count += 1
+            if len(errors) < MAX_IMPORT_ERRORS:
+                errors.append((number, str(e)))
+            continue
+        yield team1, team2, date_str, time_str, location or None, duration
+    if errors:
+        if error_count > len(errors):
+            errors.append((None, f"{error_count - len(errors)} more rows were rejected."))
+        raise ScheduleValidationError(errors)
+
+
+def chunked(lines, rows=EXPORT_CHUNK_ROWS):
+    # Joins generated lines into larger chunks so the server writes fewer pieces
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= rows:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def csv_lines(matches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for match in matches:
+        writer.writerow(['' if match[field] is None else match[field] for field in EXPORT_FIELDS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def jsonl_lines(matches):
+    for match in matches:
+        yield json.dumps({field: match[field] for field in EXPORT_FIELDS}) + '\n'
+
+
+def _ics_text(value):
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _ics_line(line):
+    # Folds content lines longer than 75 octets without splitting a character
+    encoded = line.encode('utf-8')
+    if len(encoded) <= ICS_LINE_OCTETS:
+        return line + '\r\n'
+    parts = []
+    current = ''
+    limit = ICS_LINE_OCTETS
+    for char in line:
+        if len((current + char).encode('utf-8')) > limit:
+            parts.append(current)
+            current = ''
+            # Continuation lines start with a space, which counts toward the limit
+            limit = ICS_LINE_OCTETS - 1
+        current += char
+    parts.append(current)
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def ics_lines(matches, calendar_name):
+    # Scheduled matches as floating-time VEVENTs; unscheduled ones are skipped
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    yield _ics_line('BEGIN:VCALENDAR')
+    yield _ics_line('VERSION:2.0')
+    yield _ics_line('PRODID:-//Tournament Scheduler//EN')
+    yield _ics_line('CALSCALE:GREGORIAN')
+    yield _ics_line(f'X-WR-CALNAME:{_ics_text(calendar_name)}')
+    for match in matches:
+        if not match['date'] or not match['time']:
+            continue
+        try:
+            starts = datetime.strptime(f"{match['date']} {match['time']}", "%Y-%m-%d %H:%M")
+        except ValueError:
+            continue
+        yield _ics_line('BEGIN:VEVENT')
+        yield _ics_line(f"UID:match-{match['id']}-{match['tournament_id']}@tournament-scheduler")
+        yield _ics_line(f'DTSTAMP:{stamp}')
+        yield _ics_line(f"DTSTART:{starts.strftime('%Y%m%dT%H%M%S')}")
+        yield _ics_line(f"DURATION:PT{match['duration'] or 1}H")
+        yield _ics_line(f"SUMMARY:{_ics_text(match['team1'])} vs {_ics_text(match['team2'])}")
+        if match['location']:
+            yield _ics_line(f"LOCATION:{_ics_text(match['location'])}")
+        yield _ics_line(f'DESCRIPTION:{_ics_text(calendar_name)}')
+        yield _ics_line('END:VEVENT')
+    yield _ics_line('END:VCALENDAR')
+
+
+def export_lines(fmt, matches, calendar_name):
+    if fmt == 'csv':
+        return csv_lines(matches)
+    if fmt == 'jsonl':
+        return jsonl_lines(matches)
+    return ics_lines(matches, calendar_name)